@@ -0,0 +1,87 @@
+import concurrent.futures
+import glob
+import os
+import time
+
+import bytecode
+import cobalt
+from cache import TranspileCache
+from codegen import MEMO_SIZE
+from lex import CobaltError
+
+# Per-worker state, set up once by initWorker() and reused for every file the worker compiles.
+options = None
+emit = "py"
+cache = None
+
+
+# Expand files, directories (searched recursively for .cb files) and glob patterns into a list of files.
+def expandInputs(patterns):
+    """Expand files, directories and glob patterns into a list of files."""
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for root, dirs, files in os.walk(pattern):
+                dirs.sort()
+                paths.extend(os.path.join(root, name) for name in sorted(files) if name.endswith(".cb"))
+        elif any(char in pattern for char in "*?["):
+            paths.extend(sorted(glob.glob(pattern, recursive=True)))
+        else:
+            paths.append(pattern)
+    return list(dict.fromkeys(paths))  # Drop duplicates, keep order.
+
+
+# Set up a worker: remember the compile options and open its own handle on the cache.
+def initWorker(optimize, codegen, emitAs, cacheDir, cacheBytes, memoSize, flush):
+    """Set up a worker: remember the compile options and open its own handle on the cache."""
+    global options, emit, cache
+    options = {"optimize": optimize, "codegen": codegen, "memoSize": memoSize, "flush": flush}
+    emit = emitAs
+    cache = TranspileCache(cacheDir, cobalt.VERSION, cacheBytes) if cacheDir else None
+
+
+# Transpile one file next to its source; returns (path, seconds, cache hit, error message or None).
+def compileOne(path):
+    """Transpile one file next to its source; returns (path, seconds, cache hit, error message or None)."""
+    start = time.perf_counter()
+    hits = cache.hits if cache is not None else 0
+    try:
+        with open(path) as f:
+            source = f.read()
+        code = cobalt.transpile_source(source, cache=cache, **options)
+        bytecode.writeOutput(code, f"{path[:-3]}.py", emit)
+        if options["flush"] != "unbuffered":
+            bytecode.writeRuntime(os.path.dirname(path))
+        error = None
+    except CobaltError as e:
+        error = str(e)
+    except (OSError, UnicodeDecodeError) as e:
+        error = f"{type(e).__name__}: {e}"
+    hit = cache is not None and cache.hits > hits
+    return path, time.perf_counter() - start, hit, error
+
+
+# Compile many files across `jobs` worker processes; returns the list of compileOne() results.
+def compileFiles(
+    paths,
+    jobs,
+    optimize=0,
+    codegen="script",
+    emit="py",
+    cacheDir=None,
+    cacheBytes=None,
+    memoSize=MEMO_SIZE,
+    flush="size",
+):
+    """Compile many files across `jobs` worker processes; returns the list of compileOne() results."""
+    settings = (optimize, codegen, emit, cacheDir, cacheBytes, memoSize, flush)
+    if jobs <= 1 or len(paths) <= 1:
+        initWorker(*settings)
+        return [compileOne(path) for path in paths]
+
+    # Hand out files in chunks so that per-file IPC does not dominate for small files.
+    chunksize = max(1, len(paths) // (jobs * 8))
+    with concurrent.futures.ProcessPoolExecutor(
+        jobs, initializer=initWorker, initargs=settings
+    ) as executor:
+        return list(executor.map(compileOne, paths, chunksize=chunksize))
@@ -0,0 +1 @@
+"""Benchmarks for the Cobalt transpiler. Run from the repository root, e.g. `python -m bench.lexer`."""
@@ -0,0 +1,123 @@
+"""Runtime comparison of the Python and C backends.
+
+Builds every kernel in bench/programs/ with both backends, runs each build as its own process,
+checks that both print the same thing and reports the speedup of the native executable:
+
+    python -m bench.backends --scale 10 --repeat 3
+
+Times are wall times of whole processes, so the Python column includes interpreter start-up.
+The examples/ programs are also built with both backends and their outputs compared; they are
+not timed, and programs that never stop are compared on the start of their output.
+"""
+
+import argparse
+import glob
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import bytecode
+import cbackend
+import cobalt
+from bench.runtime import ITERATIONS, withIterations
+from lex import Lexer
+from optimize import Optimizer
+from parse import Parser
+
+PROGRAMS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "programs")
+EXAMPLES = os.path.join(ROOT, "examples")
+
+# Output compared for programs that do not stop, and how long to let them run.
+OUTPUT_LIMIT = 1 << 16
+TIMEOUT = 5.0
+
+
+# Build `source` with both backends into `directory`; returns (python command, native command).
+def buildBoth(source, name, directory, level, mode):
+    """Build `source` with both backends into `directory`; returns (python command, native command)."""
+    script = os.path.join(directory, name + ".py")
+    with open(script, "w") as f:
+        f.write(cobalt.transpile_source(source, level, mode))
+    bytecode.writeRuntime(directory)
+    module = Parser(Lexer(source)).program()
+    Optimizer(level).optimize(module)
+    native = os.path.join(directory, name)
+    cbackend.build(cbackend.CGenerator(mode).generate(module), native)
+    return [sys.executable, script], [native]
+
+
+# Run a command; returns (the start of its output, exit status or None if it was stopped, seconds).
+def run(command):
+    """Run a command; returns (the start of its output, exit status or None if it was stopped, seconds)."""
+    start = time.perf_counter()
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    try:
+        output = process.stdout.read(OUTPUT_LIMIT)
+        status = process.wait(TIMEOUT) if len(output) < OUTPUT_LIMIT else None
+    except subprocess.TimeoutExpired:
+        status = None
+    finally:
+        process.kill()
+        process.wait()
+        process.stdout.close()
+    return output, status, time.perf_counter() - start
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Runtime comparison of the Python and C backends")
+    ap.add_argument("--scale", type=int, default=1, help="Multiply each kernel's iteration count")
+    ap.add_argument("--repeat", type=int, default=3, help="Best-of-N timing runs")
+    ap.add_argument("-O", dest="optimize", type=int, choices=[0, 1, 2, 3], default=2)
+    ap.add_argument("--codegen", choices=["script", "main"], default="main")
+    args = ap.parse_args(argv)
+
+    mismatches = []
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"{'kernel':>14} {'python s':>9} {'native s':>9} {'speedup':>8}")
+        for path in sorted(glob.glob(os.path.join(PROGRAMS, "*.cb"))):
+            name = os.path.splitext(os.path.basename(path))[0]
+            with open(path) as f:
+                source = f.read()
+            iterations = int(re.search(r"\d+", ITERATIONS.search(source).group()).group())
+            source = withIterations(source, iterations * args.scale)
+            python, native = buildBoth(source, name, directory, args.optimize, args.codegen)
+            results = []
+            for command in (python, native):
+                runs = [run(command) for _ in range(args.repeat)]
+                results.append((runs[0][0], runs[0][1], min(seconds for _, _, seconds in runs)))
+            (pyOut, pyStatus, pySeconds), (cOut, cStatus, cSeconds) = results
+            flag = ""
+            if (pyOut, pyStatus) != (cOut, cStatus):
+                flag = "  OUTPUT DIFFERS"
+                mismatches.append(name)
+            print(f"{name:>14} {pySeconds:9.3f} {cSeconds:9.3f} {pySeconds / cSeconds:7.1f}x{flag}")
+
+        for path in sorted(glob.glob(os.path.join(EXAMPLES, "*", "*.cb"))):
+            name = os.path.splitext(os.path.basename(path))[0]
+            with open(path) as f:
+                source = f.read()
+            python, native = buildBoth(source, name, directory, args.optimize, args.codegen)
+            pyOut, pyStatus, _ = run(python)
+            cOut, cStatus, _ = run(native)
+            if pyStatus is None or cStatus is None:
+                # Stopped early; each wrote whole buffers, so compare what both got to.
+                length = min(len(pyOut), len(cOut))
+                same = length > 0 and pyOut[:length] == cOut[:length]
+            else:
+                same = (pyOut, pyStatus) == (cOut, cStatus)
+            print(f"{name:>14} {'same output' if same else 'OUTPUT DIFFERS'}")
+            if not same:
+                mismatches.append(name)
+
+    if mismatches:
+        sys.exit("Output differs between the backends for: " + ", ".join(mismatches))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""Compiler throughput benchmark.
+
+Generates synthetic programs (see bench.generate) for a set of workloads, times each compiler
+phase separately and reports tokens/sec, lines/sec and peak memory:
+
+    python -m bench.compiler --lines 50000 --save before.json
+    python -m bench.compiler --lines 50000 --compare before.json --threshold 0.1
+
+With --compare, any phase time or peak memory that got worse than the saved run by more than the
+threshold is flagged and the exit status is 1.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench.generate import generate
+from codegen import CodeGenerator
+from emit import Emitter
+from lex import Lexer, TokenBuffer
+from optimize import Optimizer
+from parse import Parser
+
+# Workload name -> generate() keyword arguments (besides the number of lines).
+WORKLOADS = {
+    "typical": {},
+    "nested": {"depth": 24},
+    "long-expressions": {"exprLength": 20},
+    "comments": {"comments": 0.8},
+    "strings": {"strings": 0.9},
+}
+
+# Metrics compared between runs; for all of them, bigger is worse.
+COMPARED = ("lex", "parse", "optimize", "emit", "total", "peak_bytes")
+
+
+# Run every phase once over `source`; returns ({phase: seconds}, token count).
+def timePhases(source, level):
+    """Run every phase once over `source`; returns ({phase: seconds}, token count)."""
+    start = time.perf_counter()
+    tokens = TokenBuffer(Lexer(source))
+    lexed = time.perf_counter()
+    module = Parser(tokens).program()
+    parsed = time.perf_counter()
+    Optimizer(level).optimize(module)
+    optimized = time.perf_counter()
+    emitter = Emitter(None)
+    CodeGenerator(emitter).generate(module)
+    emitter.getCode()
+    done = time.perf_counter()
+    phases = {
+        "lex": lexed - start,
+        "parse": parsed - lexed,
+        "optimize": optimized - parsed,
+        "emit": done - optimized,
+        "total": done - start,
+    }
+    return phases, len(tokens)
+
+
+# Return the peak traced memory, in bytes, of compiling `source` end to end.
+def peakMemory(source, level):
+    """Return the peak traced memory, in bytes, of compiling `source` end to end."""
+    tracemalloc.start()
+    try:
+        module = Parser(Lexer(source)).program()
+        Optimizer(level).optimize(module)
+        emitter = Emitter(None)
+        CodeGenerator(emitter).generate(module)
+        emitter.getCode()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+# Benchmark one workload; returns its result record.
+def runWorkload(options, lines, level, repeat):
+    """Benchmark one workload; returns its result record."""
+    source = generate(lines, **options)
+    runs = [timePhases(source, level) for _ in range(repeat)]
+    tokens = runs[0][1]
+    # Best of N for each phase separately; the least disturbed run is the most repeatable.
+    best = {phase: min(run[0][phase] for run in runs) for phase in runs[0][0]}
+    lineCount = source.count("\n")
+    return dict(
+        best,
+        bytes=len(source),
+        lines=lineCount,
+        tokens=tokens,
+        tokens_per_sec=tokens / best["lex"],
+        lines_per_sec=lineCount / best["total"],
+        peak_bytes=peakMemory(source, level),
+    )
+
+
+# Return the current git commit, or None outside a checkout.
+def currentCommit():
+    """Return the current git commit, or None outside a checkout."""
+    result = subprocess.run(
+        ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True
+    )
+    return result.stdout.strip() or None
+
+
+# Return a list of (workload, metric, old, new) for every metric that got worse by more than `threshold`.
+def regressions(old, new, threshold):
+    """Return a list of (workload, metric, old, new) for every metric that got worse by more than `threshold`."""
+    found = []
+    for workload, result in new["results"].items():
+        before = old["results"].get(workload)
+        if before is None:
+            continue
+        for metric in COMPARED:
+            if metric in before and result[metric] > before[metric] * (1 + threshold):
+                found.append((workload, metric, before[metric], result[metric]))
+    return found
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Compiler throughput benchmark")
+    ap.add_argument("--lines", type=int, default=10000, help="Lines per generated program")
+    ap.add_argument("--repeat", type=int, default=3, help="Best-of-N timing runs")
+    ap.add_argument("-O", dest="optimize", type=int, choices=[0, 1, 2, 3], default=1)
+    ap.add_argument(
+        "--workload", action="append", choices=WORKLOADS, help="Run only these workloads"
+    )
+    ap.add_argument("--save", default=None, help="Write the results to this JSON file")
+    ap.add_argument("--compare", default=None, help="Compare with results saved by --save")
+    ap.add_argument(
+        "--threshold", type=float, default=0.1, help="Relative slowdown flagged as a regression"
+    )
+    args = ap.parse_args(argv)
+
+    report = {
+        "commit": currentCommit(),
+        "python": platform.python_version(),
+        "lines": args.lines,
+        "optimize": args.optimize,
+        "results": {},
+    }
+    print(
+        f"{'workload':>17} {'lex':>8} {'parse':>8} {'optimize':>8} {'emit':>8}"
+        f" {'tokens/s':>11} {'lines/s':>9} {'peak MiB':>9}"
+    )
+    for name in args.workload or WORKLOADS:
+        result = runWorkload(WORKLOADS[name], args.lines, args.optimize, args.repeat)
+        report["results"][name] = result
+        phases = " ".join(
+            f"{result[phase] * 1000:6.0f}ms" for phase in ("lex", "parse", "optimize", "emit")
+        )
+        print(
+            f"{name:>17} {phases} {result['tokens_per_sec']:11,.0f}"
+            f" {result['lines_per_sec']:9,.0f} {result['peak_bytes'] / 2**20:9.1f}"
+        )
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+        if (old["lines"], old["optimize"]) != (args.lines, args.optimize):
+            print("warning: comparing runs made with different --lines or -O", file=sys.stderr)
+        found = regressions(old, report, args.threshold)
+        for workload, metric, before, after in found:
+            print(
+                f"REGRESSION {workload} {metric}: {before:.4g} -> {after:.4g}"
+                f" ({(after / before - 1) * 100:+.0f}%, commit {old['commit']} -> {report['commit']})"
+            )
+        if found:
+            sys.exit(1)
+        print(f"No regressions beyond {args.threshold:.0%} against {old['commit']}.")
+
+
+if __name__ == "__main__":
+    main()
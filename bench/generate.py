@@ -0,0 +1,144 @@
+"""Synthetic Cobalt program generator.
+
+Writes a valid (parseable, though not necessarily terminating) Cobalt program with a given
+number of lines, nesting depth, expression length, and density of comments and string prints:
+
+    python -m bench.generate --lines 100000 --depth 6 --expr-length 8 --comments 0.3 -o big.cb
+"""
+
+import argparse
+import random
+
+# Variables declared at the top of every generated program, so any expression may read them.
+NAMES = ["a", "b", "count", "total", "Width", "height", "x1", "y2"]
+
+WORDS = "the quick brown fox jumps over lazy dog while counting sheep and numbers".split()
+
+
+# Builds one program; each method appends lines to `self.lines`.
+class Generator:
+    def __init__(self, lines, depth, exprLength, comments, strings, seed):
+        self.target = lines  # Approximate number of lines to generate.
+        self.depth = depth  # Maximum nesting depth of If/While blocks.
+        self.exprLength = exprLength  # Number of operands in each expression.
+        self.comments = comments  # Probability that a statement is preceded by a comment.
+        self.strings = strings  # Probability that a print statement prints a string literal.
+        self.random = random.Random(seed)
+        self.lines = []
+        self.funcs = 0  # Number of functions defined so far.
+
+    # Return the whole program as a string.
+    def program(self):
+        """Return the whole program as a string."""
+        self.lines.append("Module {")
+        for name in NAMES:
+            self.lines.append(f"    Var {name} = {self.random.randint(1, 99)};")
+        while len(self.lines) < self.target:
+            if self.random.random() < 0.1:
+                self.func()
+            else:
+                self.statement(1)
+        self.lines.append("};")
+        return "\n".join(self.lines) + "\n"
+
+    # Return an expression with `exprLength` operands.
+    def expression(self):
+        """Return an expression with `exprLength` operands."""
+        parts = [self.operand()]
+        for _ in range(self.exprLength - 1):
+            parts.append(self.random.choice("+-*/"))
+            parts.append(self.operand())
+        return " ".join(parts)
+
+    def operand(self):
+        roll = self.random.random()
+        if roll < 0.5:
+            return self.random.choice(NAMES)
+        if roll < 0.8:
+            return str(self.random.randint(1, 999))
+        if roll < 0.9:
+            return f"{self.random.randint(1, 99)}.{self.random.randint(0, 99)}"
+        return "-" + self.random.choice(NAMES)
+
+    def comparison(self):
+        op = self.random.choice(["<", "<=", ">", ">=", "==", "!="])
+        return f"{self.expression()} {op} {self.expression()}"
+
+    def comment(self, indent):
+        words = " ".join(self.random.choices(WORDS, k=self.random.randint(3, 10)))
+        if self.random.random() < 0.7:
+            self.lines.append(f"{indent}# {words}")
+        else:
+            self.lines.append(f"{indent}~ {words}")
+            self.lines.append(f"{indent}  {words} ~")
+
+    # Append one statement at nesting `level`, recursing into blocks while depth allows.
+    def statement(self, level, inFunc=False):
+        """Append one statement at nesting `level`, recursing into blocks while depth allows."""
+        indent = "    " * level
+        if self.random.random() < self.comments:
+            self.comment(indent)
+
+        roll = self.random.random()
+        if roll < 0.15 and level < self.depth:
+            keyword = "If" if self.random.random() < 0.6 else "While"
+            self.lines.append(f"{indent}{keyword} {self.comparison()} {{")
+            for _ in range(self.random.randint(1, 4)):
+                self.statement(level + 1, inFunc)
+            if keyword == "If" and self.random.random() < 0.3:
+                self.lines.append(f"{indent}}} Else {{")
+                self.statement(level + 1, inFunc)
+            self.lines.append(f"{indent}}};")
+        elif roll < 0.55:
+            self.lines.append(f"{indent}Var {self.random.choice(NAMES)} = {self.expression()};")
+        elif roll < 0.85:
+            keyword = self.random.choice(["Print", "PrintLn"])
+            if self.random.random() < self.strings:
+                words = " ".join(self.random.choices(WORDS, k=self.random.randint(1, 8)))
+                self.lines.append(f'{indent}{keyword}("{words}");')
+            else:
+                self.lines.append(f"{indent}{keyword}({self.expression()});")
+        elif roll < 0.95 and self.funcs:
+            self.lines.append(f"{indent}f{self.random.randrange(self.funcs)}();")
+        elif inFunc:
+            self.lines.append(f"{indent}Return {self.expression()};")
+        else:
+            self.lines.append(f"{indent}Var {self.random.choice(NAMES)} = {self.expression()};")
+
+    # Append a top-level function definition.
+    def func(self):
+        """Append a top-level function definition."""
+        self.lines.append(f"    Func f{self.funcs} {{")
+        for _ in range(self.random.randint(2, 8)):
+            self.statement(2, inFunc=True)
+        self.lines.append("    };")
+        self.funcs += 1
+
+
+# Return a generated Cobalt program.
+def generate(lines=1000, depth=4, exprLength=4, comments=0.1, strings=0.2, seed=0):
+    """Return a generated Cobalt program."""
+    return Generator(lines, depth, exprLength, comments, strings, seed).program()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Generate a synthetic Cobalt program")
+    ap.add_argument("--lines", type=int, default=1000, help="Approximate number of lines")
+    ap.add_argument("--depth", type=int, default=4, help="Maximum block nesting depth")
+    ap.add_argument("--expr-length", type=int, default=4, help="Operands per expression")
+    ap.add_argument("--comments", type=float, default=0.1, help="Comment density (0-1)")
+    ap.add_argument("--strings", type=float, default=0.2, help="String print density (0-1)")
+    ap.add_argument("--seed", type=int, default=0, help="Random seed")
+    ap.add_argument("-o", default=None, help="Output file (default: stdout)")
+    args = ap.parse_args(argv)
+
+    source = generate(args.lines, args.depth, args.expr_length, args.comments, args.strings, args.seed)
+    if args.o:
+        with open(args.o, "w") as f:
+            f.write(source)
+    else:
+        print(source, end="")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""Lexer throughput benchmark.
+
+Lexes a generated Cobalt source with the current `lex.Lexer` and with the `lex.py` committed at a
+baseline git revision (the root commit by default) and reports tokens/sec for each:
+
+    python -m bench.lexer --size 2000000
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import lex
+
+# One loop body's worth of representative Cobalt code, repeated to reach the requested size.
+BLOCK = """\
+    # Fibonacci step with a counter.
+    Var c = a;
+    Var a = b;
+    Var b = b + c * 2 - 1 / 3.25;
+    ~ Block comments can
+      span lines. ~
+    If NumberOfTimes >= 10 {
+        PrintLn("Still counting down");
+    };
+    While NumberOfTimes != 0 {
+        Print(NumberOfTimes);
+        Var NumberOfTimes = NumberOfTimes - 1;
+    };
+"""
+
+
+# Build a Cobalt module of roughly `size` characters.
+def makeSource(size):
+    """Build a Cobalt module of roughly `size` characters."""
+    header = "Module {\n    Var a = 1;\n    Var b = 1;\n    Var NumberOfTimes = 10;\n"
+    return header + BLOCK * max(1, size // len(BLOCK)) + "};\n"
+
+
+# Load lex.py as committed at `rev` into a fresh module object.
+def loadBaseline(rev):
+    """Load lex.py as committed at `rev` into a fresh module object."""
+    if rev is None:
+        rev = subprocess.run(
+            ["git", "rev-list", "--max-parents=0", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.split()[0]
+    code = subprocess.run(
+        ["git", "show", f"{rev}:lex.py"], cwd=ROOT, capture_output=True, text=True, check=True
+    ).stdout
+    module = types.ModuleType(f"lex_{rev}")
+    exec(compile(code, f"{rev}:lex.py", "exec"), module.__dict__)
+    return rev, module
+
+
+# Lex the whole source and return (token count, seconds).
+def timeLexer(module, source):
+    """Lex the whole source and return (token count, seconds)."""
+    eof = module.TokenType.EOF
+    start = time.perf_counter()
+    lexer = module.Lexer(source)
+    count = 0
+    while lexer.getToken().kind != eof:
+        count += 1
+    return count, time.perf_counter() - start
+
+
+# Tokenize the whole source into a list of tokens.
+def tokenList(module, source):
+    """Tokenize the whole source into a list of tokens."""
+    eof = module.TokenType.EOF
+    lexer = module.Lexer(source)
+    tokens = []
+    token = lexer.getToken()
+    while token.kind != eof:
+        tokens.append(token)
+        token = lexer.getToken()
+    return tokens
+
+
+# Run `tokenize(source)` under tracemalloc and return (peak bytes, live allocation count).
+def measureLexer(tokenize, source):
+    """Run `tokenize(source)` under tracemalloc and return (peak bytes, live allocation count)."""
+    tracemalloc.start()
+    tokens = tokenize(source)
+    snapshot = tracemalloc.take_snapshot()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    blocks = sum(stat.count for stat in snapshot.statistics("filename"))
+    return peak, blocks
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Lexer throughput benchmark")
+    ap.add_argument("--size", type=int, default=1_000_000, help="Approximate source size in bytes")
+    ap.add_argument("--repeat", type=int, default=3, help="Best-of-N timing runs")
+    ap.add_argument("--baseline", default=None, help="Git revision of the reference lexer")
+    ap.add_argument("--memory", action="store_true", help="Also measure whole-file token memory")
+    args = ap.parse_args(argv)
+
+    source = makeSource(args.size)
+    rev, baseline = loadBaseline(args.baseline)
+    print(f"source: {len(source)} bytes")
+
+    lexers = ((f"baseline ({rev[:10]})", baseline), ("current", lex))
+    results = {}
+    for name, module in lexers:
+        count, seconds = min(
+            (timeLexer(module, source) for _ in range(args.repeat)), key=lambda r: r[1]
+        )
+        results[name] = seconds
+        print(f"{name:>22}: {count} tokens in {seconds:.3f}s = {count / seconds:,.0f} tokens/sec")
+
+    base, current = results.values()
+    print(f"{'speedup':>22}: {base / current:.1f}x")
+
+    if args.memory:
+        for name, tokenize in (
+            (f"baseline ({rev[:10]})", lambda source: tokenList(baseline, source)),
+            ("current, token list", lambda source: tokenList(lex, source)),
+            ("current, TokenBuffer", lambda source: lex.Lexer(source).tokenize()),
+        ):
+            peak, blocks = measureLexer(tokenize, source)
+            print(f"{name:>22}: peak {peak / 2**20:.1f} MiB, {blocks:,} live allocations")
+
+
+if __name__ == "__main__":
+    main()
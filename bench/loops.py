@@ -0,0 +1,90 @@
+"""Counting-loop benchmark.
+
+Transpiles a fibonacci-style Cobalt program whose While loop counts down, at -O1 (plain `while`)
+and at -O2 (lowered to a `range()` loop), in both code generation modes, runs each result and
+reports its run time:
+
+    python -m bench.loops --iterations 2000000
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROGRAM = """\
+Module {{
+    Var a = 0;
+    Var b = 1;
+    Var total = 0;
+    Var NumberOfTimes = {iterations};
+
+    While NumberOfTimes > 0 {{
+        Var c = a;
+        Var a = b;
+        Var b = b + c - a;
+        Var total = total + a + b;
+        Var NumberOfTimes = NumberOfTimes - 1;
+    }};
+    PrintLn(total);
+    PrintLn(NumberOfTimes);
+}};
+"""
+
+
+# Transpile `source` with extra CLI arguments and return the path of the generated file.
+def transpile(source, directory, name, args):
+    """Transpile `source` with extra CLI arguments and return the path of the generated file."""
+    cbPath = os.path.join(directory, "loops.cb")
+    with open(cbPath, "w") as f:
+        f.write(source)
+    pyPath = os.path.join(directory, f"{name}.py")
+    subprocess.run(
+        [sys.executable, os.path.join(ROOT, "cobalt.py"), cbPath, "-o", pyPath, *args],
+        check=True,
+        capture_output=True,
+    )
+    return pyPath
+
+
+# Run a generated program; returns (stdout, best wall time in seconds).
+def run(path, repeat):
+    """Run a generated program; returns (stdout, best wall time in seconds)."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, path], check=True, capture_output=True, text=True
+        ).stdout
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return output, best
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Counting-loop benchmark")
+    ap.add_argument("--iterations", type=int, default=2_000_000, help="Loop iterations")
+    ap.add_argument("--repeat", type=int, default=3, help="Best-of-N timing runs")
+    args = ap.parse_args(argv)
+
+    source = PROGRAM.format(iterations=args.iterations)
+    with tempfile.TemporaryDirectory() as directory:
+        for mode in ("script", "main"):
+            results = []
+            for level in ("-O1", "-O2"):
+                path = transpile(source, directory, f"{mode}{level}", [level, "--codegen", mode])
+                results.append((level, *run(path, args.repeat)))
+            outputs = {output for _, output, _ in results}
+            if len(outputs) != 1:
+                sys.exit(f"{mode}: outputs differ between optimisation levels")
+            for level, _, seconds in results:
+                print(f"{mode:>6} {level}: {seconds:.3f}s")
+            print(f"{mode:>6} speedup: {results[0][2] / results[1][2]:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
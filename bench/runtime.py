@@ -0,0 +1,153 @@
+"""Runtime benchmark for generated code.
+
+Transpiles every kernel in bench/programs/ under each code generation mode and optimisation
+level, runs the results with stdout captured, checks that every configuration prints the same
+output, and reports wall time and bytecode instructions per iteration:
+
+    python -m bench.runtime --repeat 5 --json runtime.json
+
+Each kernel starts with `Var Iterations = N;`. Instructions per iteration are counted by running
+the kernel under an opcode tracer at two small iteration counts and dividing the difference in
+instructions by the difference in iterations, so setup and printing cancel out.
+"""
+
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import re
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import cobalt
+import cobaltrt
+from codegen import MODES
+
+PROGRAMS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "programs")
+
+# Every configuration compared: (codegen mode, optimisation level).
+CONFIGS = [(mode, level) for mode in MODES for level in (0, 1, 2)]
+
+ITERATIONS = re.compile(r"Var Iterations = \d+;")
+
+# Iteration counts used when counting instructions.
+COUNT_AT = (100, 200)
+
+
+# Return a copy of `source` that runs `iterations` iterations.
+def withIterations(source, iterations):
+    """Return a copy of `source` that runs `iterations` iterations."""
+    if not ITERATIONS.search(source):
+        raise ValueError("kernel does not start with 'Var Iterations = N;'")
+    return ITERATIONS.sub(f"Var Iterations = {iterations};", source, count=1)
+
+
+# Run a code object with stdout captured; returns (output, seconds).
+def run(code):
+    """Run a code object with stdout captured; returns (output, seconds)."""
+    output = io.StringIO()
+    namespace = {"__name__": "__main__"}
+    with contextlib.redirect_stdout(output):
+        start = time.perf_counter()
+        exec(code, namespace)
+        cobaltrt.close()
+        seconds = time.perf_counter() - start
+    return output.getvalue(), seconds
+
+
+# Return the number of bytecode instructions executed running a code object.
+def countInstructions(code):
+    """Return the number of bytecode instructions executed running a code object."""
+    count = 0
+
+    def trace(frame, event, arg):
+        nonlocal count
+        if event == "call":
+            frame.f_trace_opcodes = True
+        elif event == "opcode":
+            count += 1
+        return trace
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        sys.settrace(trace)
+        try:
+            exec(code, {"__name__": "__main__"})
+        finally:
+            sys.settrace(None)
+    return count
+
+
+# Return the bytecode instructions per iteration of a kernel in one configuration.
+def instructionsPerIteration(source, mode, level):
+    """Return the bytecode instructions per iteration of a kernel in one configuration."""
+    low, high = (
+        countInstructions(cobalt.compile_source(withIterations(source, n), optimize=level, codegen=mode))
+        for n in COUNT_AT
+    )
+    return (high - low) / (COUNT_AT[1] - COUNT_AT[0])
+
+
+# Benchmark one kernel in every configuration; returns {"mode -Olevel": result}.
+def benchKernel(source, repeat):
+    """Benchmark one kernel in every configuration; returns {"mode -Olevel": result}."""
+    results = {}
+    expected = None
+    for mode, level in CONFIGS:
+        code = cobalt.compile_source(source, optimize=level, codegen=mode)
+        runs = [run(code) for _ in range(repeat)]
+        output = runs[0][0]
+        if expected is None:
+            expected = output
+        results[f"{mode} -O{level}"] = {
+            "mode": mode,
+            "optimize": level,
+            "seconds": min(seconds for _, seconds in runs),
+            "instructions_per_iteration": instructionsPerIteration(source, mode, level),
+            "output_matches": output == expected,
+        }
+    return results
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Runtime benchmark for generated code")
+    ap.add_argument(
+        "programs", nargs="*", help="Kernels to run (default: every .cb file in bench/programs)"
+    )
+    ap.add_argument("--repeat", type=int, default=3, help="Best-of-N timing runs")
+    ap.add_argument("--json", default=None, help="Also write the results to this JSON file")
+    args = ap.parse_args(argv)
+
+    paths = args.programs or sorted(glob.glob(os.path.join(PROGRAMS, "*.cb")))
+    report = {}
+    mismatches = []
+    print(f"{'kernel':>10} {'config':>12} {'seconds':>9} {'speedup':>8} {'instr/iter':>11}")
+    for path in paths:
+        name = os.path.splitext(os.path.basename(path))[0]
+        with open(path) as f:
+            source = f.read()
+        results = benchKernel(source, args.repeat)
+        report[name] = results
+        base = next(iter(results.values()))["seconds"]
+        for config, result in results.items():
+            flag = "" if result["output_matches"] else "  OUTPUT DIFFERS"
+            print(
+                f"{name:>10} {config:>12} {result['seconds']:9.4f} {base / result['seconds']:7.2f}x"
+                f" {result['instructions_per_iteration']:11.1f}{flag}"
+            )
+            if not result["output_matches"]:
+                mismatches.append(f"{name} {config}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    if mismatches:
+        sys.exit("Output differs from the first configuration for: " + ", ".join(mismatches))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Stress test for very long expressions and very deep nesting.
+
+Compiles a program with one expression of N terms and a program with N nested If/While blocks
+and a Func ending in an If/Else chain N levels deep that returns on every branch, at N and 2N, through every phase at -O2 in both code generation modes. It fails if any phase
+hits the recursion limit or its time per byte clearly grows with the input (for emit, per byte
+of output: the generated Python of deep nesting is quadratic in size, from its indentation):
+
+    python -m bench.stress --terms 100000 --depth 5000
+
+(CPython itself cannot compile the generated Python for inputs this big: it allows 100 levels of
+indentation and overflows its own compiler on long operator chains. This checks the transpiler.)
+"""
+
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from codegen import MODES, CodeGenerator
+from emit import Emitter
+from lex import Lexer
+from optimize import Optimizer
+from parse import Parser
+
+# Doubling the input may multiply a phase's time per byte by at most this much.
+MAX_GROWTH = 1.5
+
+
+# Return a program whose single expression has `terms` operands and every binary operator.
+def longExpression(terms):
+    """Return a program whose single expression has `terms` operands and every binary operator."""
+    ops = " + 2 * a - 3 / a"
+    body = "a" + ops * ((terms - 1) // 4)
+    return f"Module {{\n    Var a = 5;\n    Var x = {body};\n    PrintLn(x - -a + 1);\n}};\n"
+
+
+# Return a program with `depth` nested blocks, alternating If/Else, While and Func, and a Func
+# whose body is an If/Else chain `depth` levels deep that ends in a Return on every branch.
+def deepNesting(depth):
+    """Return a program with `depth` nested blocks, and a Func ending in a `depth`-level If/Else chain."""
+    opening, closing = [], []
+    indent = "    "  # Unindented, so the source grows linearly with the depth.
+    for level in range(depth):
+        kind = level % 3
+        if kind == 0:
+            opening.append(f"{indent}If a > {level} {{")
+            closing.append(f"{indent}}} Else {{\n{indent}    Var a = a - 1;\n{indent}}};")
+        elif kind == 1:
+            opening.append(f"{indent}While a < {level} {{")
+            closing.append(f"{indent}    Var a = a + 1;\n{indent}}};")
+        else:
+            opening.append(f"{indent}Func f{level} {{")
+            closing.append(f"{indent}}};")
+    inner = indent + "PrintLn(a * 2);"
+    chain = [f"{indent}If n > {level} {{" for level in range(depth)]
+    ends = [f"{indent}}} Else {{\n{indent}    Return {level};\n{indent}}};" for level in range(depth)]
+    pick = [f"{indent}Func pick(n) {{"] + chain + [f"{indent}Return n;"] + ends[::-1] + [f"{indent}}};"]
+    lines = ["Module {", "    Var a = 1;"] + opening + [inner] + closing[::-1] + pick
+    lines += [f"{indent}PrintLn(pick(a));", "};"]
+    return "\n".join(lines) + "\n"
+
+
+# Compile `source` through every phase; returns {phase: seconds per byte}.
+def timePhases(source, mode):
+    """Compile `source` through every phase; returns {phase: seconds per byte}."""
+    start = time.perf_counter()
+    module = Parser(Lexer(source)).program()
+    parsed = time.perf_counter()
+    Optimizer(2).optimize(module)
+    optimized = time.perf_counter()
+    emitter = Emitter(None)
+    CodeGenerator(emitter, mode).generate(module)
+    code = emitter.getCode()
+    return {
+        "parse": (parsed - start) / len(source),
+        "optimize": (optimized - parsed) / len(source),
+        "emit": (time.perf_counter() - optimized) / len(code),
+    }
+
+
+# Best of `repeat` runs of timePhases(), for each phase separately.
+def bestOf(source, mode, repeat):
+    """Best of `repeat` runs of timePhases(), for each phase separately."""
+    runs = [timePhases(source, mode) for _ in range(repeat)]
+    return {phase: min(run[phase] for run in runs) for phase in runs[0]}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Stress test for long expressions and deep nesting")
+    ap.add_argument("--terms", type=int, default=100_000, help="Operands in the long expression")
+    ap.add_argument("--depth", type=int, default=5_000, help="Levels of block nesting")
+    ap.add_argument("--repeat", type=int, default=3, help="Best-of-N timing runs")
+    args = ap.parse_args(argv)
+
+    failures = []
+    print(f"{'case':>16} {'mode':>6} {'phase':>8} {'ns/byte N':>10} {'2N':>8} {'growth':>7}")
+    for name, build, size in (
+        ("long expression", longExpression, args.terms),
+        ("deep nesting", deepNesting, args.depth),
+    ):
+        for mode in MODES:
+            try:
+                small = bestOf(build(size), mode, args.repeat)
+                large = bestOf(build(2 * size), mode, args.repeat)
+            except RecursionError:
+                failures.append(f"{name} ({mode}): RecursionError")
+                continue
+            for phase in small:
+                growth = large[phase] / small[phase]
+                if growth > MAX_GROWTH:
+                    failures.append(f"{name} ({mode}) {phase}: {growth:.2f}x the time per byte")
+                print(
+                    f"{name:>16} {mode:>6} {phase:>8} {small[phase] * 1e9:10.0f}"
+                    f" {large[phase] * 1e9:8.0f} {growth:6.2f}x"
+                )
+    if failures:
+        sys.exit("\n".join(failures))
+    print("All phases linear.")
+
+
+if __name__ == "__main__":
+    main()
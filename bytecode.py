@@ -0,0 +1,165 @@
+import importlib.util
+import marshal
+import os
+import sys
+import zipfile
+
+from codegen import RUNTIME
+
+# Bytecode output for `cobalt.py --emit` and `cobalt.py bundle`. A .pyc file is the code object
+# marshalled behind a 16-byte header (PEP 552): the interpreter's magic number, a flags word and
+# two words that say which source the bytecode was compiled from. Writing it at transpile time
+# means the generated Python is never parsed or compiled again where it runs.
+
+# Header flags: bit 0 marks a hash-based .pyc, bit 1 asks the import system to check that hash.
+FLAG_HASH = 0b01
+
+# What --emit writes: the Python source, a sourceless .pyc, or the source plus its cached bytecode.
+EMIT = ("py", "pyc", "both")
+
+
+# Compile generated Python text to a code object that reports `filename` in tracebacks.
+def compileText(text, filename):
+    """Compile generated Python text to a code object that reports `filename` in tracebacks."""
+    return compile(text, filename, "exec", dont_inherit=True)
+
+
+# Return the .pyc data for a code object validated by the mtime and size of its source file.
+def timestampPyc(code, mtime, size):
+    """Return the .pyc data for a code object validated by the mtime and size of its source file."""
+    header = importlib.util.MAGIC_NUMBER + (0).to_bytes(4, "little")
+    header += (int(mtime) & 0xFFFFFFFF).to_bytes(4, "little")
+    header += (size & 0xFFFFFFFF).to_bytes(4, "little")
+    return header + marshal.dumps(code)
+
+
+# Return the .pyc data for a code object, stamped with a hash of the source it came from.
+# The hash is not checked on import, and the output only depends on the source, so builds are
+# reproducible.
+def hashPyc(code, source):
+    """Return the .pyc data for a code object, stamped with a hash of the source it came from."""
+    header = importlib.util.MAGIC_NUMBER + FLAG_HASH.to_bytes(4, "little")
+    header += importlib.util.source_hash(source)
+    return header + marshal.dumps(code)
+
+
+# Timestamp of every file in a bundle, so that the same inputs always give the same archive.
+ZIP_DATE = (1980, 1, 1, 0, 0, 0)
+
+
+# Atomically write `data` to `path` (bytes, or a function that writes to an open file).
+def writeAtomic(path, data):
+    """Atomically write `data` to `path` (bytes, or a function that writes to an open file)."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            if callable(data):
+                data(f)
+            else:
+                f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+# Return the source of the runtime module that generated programs import.
+def runtimeSource():
+    """Return the source of the runtime module that generated programs import."""
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), RUNTIME + ".py")) as f:
+        return f.read()
+
+
+# Write the runtime module into `directory`, where the programs compiled into it find it, unless
+# an identical copy is already there.
+def writeRuntime(directory):
+    """Write the runtime module into `directory`, unless an identical copy is already there."""
+    data = runtimeSource().encode()
+    path = os.path.join(directory or ".", RUNTIME + ".py")
+    try:
+        with open(path, "rb") as f:
+            if f.read() == data:
+                return
+    except OSError:
+        pass
+    writeAtomic(path, data)
+
+
+# Write the bytecode of a Python file that is already on disk into its __pycache__ entry, where
+# `import` will find it instead of compiling the file.
+def writeCached(text, path):
+    """Write the bytecode of a Python file that is already on disk into its __pycache__ entry."""
+    stat = os.stat(path)
+    data = timestampPyc(compileText(text, path), stat.st_mtime, stat.st_size)
+    writeAtomic(importlib.util.cache_from_source(path), data)
+
+
+# Write generated Python text as a sourceless .pyc that `python file.pyc` runs and `import` loads.
+def writeSourceless(text, path, filename):
+    """Write generated Python text as a sourceless .pyc."""
+    writeAtomic(path, hashPyc(compileText(text, filename), text.encode()))
+
+
+# Write generated Python text to `path` (a .py file name) in the form `emit` asks for.
+def writeOutput(text, path, emit):
+    """Write generated Python text to `path` (a .py file name) in the form `emit` asks for."""
+    if emit == "pyc":
+        writeSourceless(text, path[:-3] + ".pyc", path)
+        return
+    with open(path, "w") as f:
+        f.write(text)
+    if emit == "both":
+        writeCached(text, path)
+
+
+# Source of the __main__ module of a bundle. It stays source so that it can check the Python
+# version before loading any bytecode, whose format changes between versions.
+BUNDLE_MAIN = '''\
+# Entry point of a Cobalt bundle: `python {archive} [module]` runs one of its compiled modules.
+import importlib.util
+import runpy
+import sys
+
+MAGIC = {magic!r}
+MODULES = {modules!r}
+DEFAULT = {default!r}
+
+if importlib.util.MAGIC_NUMBER != MAGIC:
+    sys.exit("This bundle was built for Python {version}; it cannot run on " + sys.version.split()[0] + ".")
+if len(sys.argv) > 1 and sys.argv[1] in MODULES:
+    name = sys.argv.pop(1)
+elif DEFAULT is not None:
+    name = DEFAULT
+else:
+    sys.exit("usage: python " + sys.argv[0] + " MODULE; modules: " + ", ".join(MODULES))
+runpy.run_module(name, run_name="__main__", alter_sys=True)
+'''
+
+
+# Write a zipapp of precompiled modules. `modules` maps module names to generated Python text;
+# `default` is the module run when none is named on the command line, or None.
+def writeBundle(target, modules, default=None, interpreter=None):
+    """Write a zipapp of precompiled modules."""
+    main = BUNDLE_MAIN.format(
+        archive=os.path.basename(target),
+        magic=importlib.util.MAGIC_NUMBER,
+        modules=sorted(modules),
+        default=default,
+        version=".".join(map(str, sys.version_info[:2])),
+    )
+
+    def write(f):
+        if interpreter:
+            f.write(b"#!" + interpreter.encode() + b"\n")
+        with zipfile.ZipFile(f, "w") as archive:
+            files = [("__main__.py", main.encode())]
+            for name, text in sorted(modules.items()):
+                files.append((f"{name}.pyc", hashPyc(compileText(text, f"{name}.py"), text.encode())))
+            for name, data in files:
+                archive.writestr(zipfile.ZipInfo(name, ZIP_DATE), data, zipfile.ZIP_DEFLATED)
+
+    writeAtomic(target, write)
+    if interpreter:
+        os.chmod(target, os.stat(target).st_mode | 0o111)
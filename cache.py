@@ -0,0 +1,204 @@
+import hashlib
+import json
+import marshal
+import os
+import sys
+import tempfile
+
+# Default size bound for the cache directory.
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# When the cache grows past its bound, evict down to this fraction of it.
+EVICT_TO = 0.9
+
+# Name of the file holding the saved hit/miss/eviction counters.
+STATS_FILE = "stats.json"
+
+
+# Return the default cache directory: $COBALT_CACHE_DIR, else $XDG_CACHE_HOME/cobalt, else ~/.cache/cobalt.
+def defaultDirectory():
+    """Return the default cache directory."""
+    if os.environ.get("COBALT_CACHE_DIR"):
+        return os.environ["COBALT_CACHE_DIR"]
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "cobalt")
+
+
+# TranspileCache keeps generated Python code (and optionally compiled code objects) on disk,
+# keyed by a hash of the Cobalt source, the compiler version and the compile options.
+#
+# Entries are written to a temporary file and renamed into place, so concurrent builds never see
+# a partial entry. Reading an entry refreshes its modification time, and when the directory grows
+# past `maxBytes` the least recently used entries are deleted.
+class TranspileCache:
+    def __init__(self, directory, version, maxBytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.version = version  # Compiler version; part of every key.
+        self.maxBytes = maxBytes
+        self.size = None  # Total bytes of entries, scanned lazily.
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+
+    # Return the key for a source text (str or bytes) compiled with the given options.
+    def key(self, source, **options):
+        """Return the key for a source text (str or bytes) compiled with the given options."""
+        if isinstance(source, str):
+            source = source.encode()
+        digest = hashlib.sha256()
+        digest.update(f"cobalt {self.version} {sorted(options.items())!r}\0".encode())
+        digest.update(source)
+        return digest.hexdigest()
+
+    # Return the cached Python code for a key, or None.
+    def get(self, key):
+        """Return the cached Python code for a key, or None."""
+        data = self.read(f"{key}.py")
+        if data is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return data.decode()
+
+    # Store the Python code for a key.
+    def put(self, key, code):
+        """Store the Python code for a key."""
+        self.write(f"{key}.py", code.encode())
+
+    # Return the cached code object for a key and file name, or None.
+    def getCode(self, key, filename):
+        """Return the cached code object for a key and file name, or None."""
+        data = self.read(self.codeName(key, filename))
+        if data is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return marshal.loads(data)
+
+    # Store the code object for a key and file name.
+    def putCode(self, key, filename, code):
+        """Store the code object for a key and file name."""
+        self.write(self.codeName(key, filename), marshal.dumps(code))
+
+    # Code objects depend on the Python version and embed the file name they were compiled for.
+    def codeName(self, key, filename):
+        """Return the entry name for a code object."""
+        tag = hashlib.sha256(filename.encode()).hexdigest()[:16]
+        return f"{key}.{tag}.{sys.implementation.cache_tag}.code"
+
+    # Read an entry and mark it as recently used; returns None if it is missing.
+    def read(self, name):
+        """Read an entry and mark it as recently used; returns None if it is missing."""
+        path = os.path.join(self.directory, name)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            return None
+        return data
+
+    # Atomically write an entry, then evict old entries if the cache is over its bound.
+    def write(self, name, data):
+        """Atomically write an entry, then evict old entries if the cache is over its bound."""
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, os.path.join(self.directory, name))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        if self.size is None:
+            self.size = sum(size for _, size, _ in self.entries())
+        else:
+            self.size += len(data)
+        if self.size > self.maxBytes:
+            self.evict()
+
+    # Return (path, size, last use) for every entry.
+    def entries(self):
+        """Return (path, size, last use) for every entry."""
+        result = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.startswith(".") or entry.name == STATS_FILE:
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue  # Removed by another process.
+                result.append((entry.path, stat.st_size, stat.st_mtime))
+        return result
+
+    # Delete least recently used entries until the cache is comfortably under its bound.
+    def evict(self):
+        """Delete least recently used entries until the cache is comfortably under its bound."""
+        entries = sorted(self.entries(), key=lambda entry: entry[2])
+        self.size = sum(size for _, size, _ in entries)
+        target = self.maxBytes * EVICT_TO
+        for path, size, _ in entries:
+            if self.size <= target:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            self.size -= size
+            self.evictions += 1
+
+    # Delete every entry.
+    def clear(self):
+        """Delete every entry."""
+        for path, _, _ in self.entries():
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+        self.size = 0
+
+    # Add this process's counters to the totals saved in the cache directory.
+    def saveStats(self):
+        """Add this process's counters to the totals saved in the cache directory."""
+        if not (self.hits or self.misses or self.evictions):
+            return
+        totals = self.loadStats()
+        totals["hits"] += self.hits
+        totals["misses"] += self.misses
+        totals["evictions"] += self.evictions
+        self.hits = self.misses = self.evictions = 0
+        # Concurrent processes may lose each other's updates, but never corrupt the file.
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        with os.fdopen(fd, "w") as f:
+            json.dump(totals, f)
+        os.replace(tmp, os.path.join(self.directory, STATS_FILE))
+
+    # Return the hit/miss/eviction totals saved in the cache directory.
+    def loadStats(self):
+        """Return the hit/miss/eviction totals saved in the cache directory."""
+        totals = {"hits": 0, "misses": 0, "evictions": 0}
+        try:
+            with open(os.path.join(self.directory, STATS_FILE)) as f:
+                totals.update(json.load(f))
+        except (OSError, ValueError):
+            pass
+        return totals
+
+    # Return a summary of the cache contents and counters.
+    def stats(self):
+        """Return a summary of the cache contents and counters."""
+        entries = self.entries()
+        totals = self.loadStats()
+        return {
+            "directory": self.directory,
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.maxBytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "total_hits": totals["hits"] + self.hits,
+            "total_misses": totals["misses"] + self.misses,
+            "total_evictions": totals["evictions"] + self.evictions,
+        }
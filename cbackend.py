@@ -0,0 +1,813 @@
+import ast
+import collections
+import keyword
+import os
+import re
+import shutil
+import subprocess
+import unicodedata
+import warnings
+
+from codegen import MEMO_RECURSION_LIMIT
+from emit import Emitter
+from nodes import *
+from optimize import assigned, operands, walk
+from scope import mainGlobals
+from typeinfer import FLOAT, INT, inferTypes
+
+# The C backend: lowers a Cobalt syntax tree to C and builds it into a native executable.
+#
+# Generated programs behave like the Python backend's: values are tagged ints or floats mixed
+# with Python's rules (exact int/float comparisons, correctly rounded int division, the same
+# float repr), reading a name that was never assigned fails like it does in Python, Funcs keep
+# Python's scoping, and the call depth at which Python raises RecursionError is reproduced.
+# Arithmetic on expressions that type inference proves are ints or floats is done on plain
+# int64_t and double values, without tag checks. Failures print Python's exception line to
+# stderr and exit with status 1. The one difference is that ints are 64-bit: a result that does
+# not fit stops the program with an error instead of growing. Programs using anything else
+# (string values, arrays, nested or conditional Funcs, names that would clash in the generated Python,
+# constants the Python backend cannot express) raise Unsupported, and the caller falls back to
+# the Python backend.
+
+# CPython's default recursion limit, which generated Python programs run with unless they have
+# memoized Funcs; those raise it to codegen.MEMO_RECURSION_LIMIT.
+RECURSION_LIMIT = 1000
+
+# Python frames already in use when module-level code runs, per code generation mode.
+BASE_DEPTH = {"script": 1, "main": 2}
+
+# Flags for the C compiler. No contraction of a * b + c into a fused multiply-add, which rounds
+# differently from Python's two operations.
+CFLAGS = ["-O2", "-ffp-contract=off"]
+
+# Python names generated code relies on, so Cobalt programs using them are left to the Python backend.
+RESERVED = {"script": {"print", "range"}, "main": {"print", "range", "main"}}
+
+BINARY_FUNCTIONS = {"+": "cb_add", "-": "cb_sub", "*": "cb_mul", "/": "cb_div"}
+UNARY_FUNCTIONS = {"+": "cb_pos", "-": "cb_neg"}
+
+# The same operators on ints known to be ints (int64_t); "/" gives a double.
+INT_FUNCTIONS = {"+": "cb_iadd", "-": "cb_isub", "*": "cb_imul", "/": "cb_idiv"}
+
+# C type of a generated expression: an unboxed int or float, or a tagged cb_value.
+C_TYPES = {INT: "int64_t", FLOAT: "double"}
+VALUE = "cb_value"
+COMPARE_FUNCTIONS = {
+    "==": "cb_eq",
+    "!=": "cb_ne",
+    "<": "cb_lt",
+    "<=": "cb_le",
+    ">": "cb_gt",
+    ">=": "cb_ge",
+}
+
+# Integer literals Python accepts: no leading zeros, ASCII digits only.
+INT_LITERAL = re.compile(r"0+|[1-9][0-9]*", re.ASCII)
+
+INT64_MIN = -(2**63)
+INT64_MAX = 2**63 - 1
+
+RUNTIME = r"""
+#include <inttypes.h>
+#include <math.h>
+#include <stdint.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
+enum { CB_UNBOUND, CB_INT, CB_FLOAT };
+
+typedef struct {
+	int tag;
+	union {
+		int64_t i;
+		double f;
+	} u;
+} cb_value;
+
+/* Python frames in use, counted like CPython counts them against the recursion limit. */
+static int cb_depth = CB_BASE_DEPTH;
+
+static void cb_fail(const char *message, const char *name) {
+	fflush(stdout);
+	fprintf(stderr, message, name);
+	fputc('\n', stderr);
+	exit(1);
+}
+
+static void cb_overflow(void) {
+	cb_fail("OverflowError: integer overflow (the C backend uses 64-bit integers)", "");
+}
+
+static void cb_check_depth(int frames) {
+	if (cb_depth + frames > CB_RECURSION_LIMIT)
+		cb_fail("RecursionError: maximum recursion depth exceeded", "");
+}
+
+#define cb_call(f) do { cb_check_depth(1); cb_depth++; f(); cb_depth--; } while (0)
+
+static inline cb_value cb_int(int64_t i) {
+	cb_value v;
+	v.tag = CB_INT;
+	v.u.i = i;
+	return v;
+}
+
+static inline cb_value cb_float(double f) {
+	cb_value v;
+	v.tag = CB_FLOAT;
+	v.u.f = f;
+	return v;
+}
+
+static inline cb_value cb_global(cb_value v, const char *name) {
+	if (v.tag == CB_UNBOUND)
+		cb_fail("NameError: name '%s' is not defined", name);
+	return v;
+}
+
+static inline cb_value cb_local(cb_value v, const char *name) {
+	if (v.tag == CB_UNBOUND)
+		cb_fail("UnboundLocalError: cannot access local variable '%s' where it is not associated with a value", name);
+	return v;
+}
+
+static inline double cb_to_float(cb_value v) {
+	return v.tag == CB_INT ? (double)v.u.i : v.u.f;
+}
+
+/* Arithmetic on values type inference found to be ints or floats, without tags. */
+static inline int64_t cb_iadd(int64_t a, int64_t b) {
+	int64_t r;
+	if (__builtin_add_overflow(a, b, &r))
+		cb_overflow();
+	return r;
+}
+
+static inline int64_t cb_isub(int64_t a, int64_t b) {
+	int64_t r;
+	if (__builtin_sub_overflow(a, b, &r))
+		cb_overflow();
+	return r;
+}
+
+static inline int64_t cb_imul(int64_t a, int64_t b) {
+	int64_t r;
+	if (__builtin_mul_overflow(a, b, &r))
+		cb_overflow();
+	return r;
+}
+
+static inline int64_t cb_ineg(int64_t a) {
+	if (a == INT64_MIN)
+		cb_overflow();
+	return -a;
+}
+
+static inline cb_value cb_add(cb_value a, cb_value b) {
+	if (a.tag == CB_INT && b.tag == CB_INT)
+		return cb_int(cb_iadd(a.u.i, b.u.i));
+	return cb_float(cb_to_float(a) + cb_to_float(b));
+}
+
+static inline cb_value cb_sub(cb_value a, cb_value b) {
+	if (a.tag == CB_INT && b.tag == CB_INT)
+		return cb_int(cb_isub(a.u.i, b.u.i));
+	return cb_float(cb_to_float(a) - cb_to_float(b));
+}
+
+static inline cb_value cb_mul(cb_value a, cb_value b) {
+	if (a.tag == CB_INT && b.tag == CB_INT)
+		return cb_int(cb_imul(a.u.i, b.u.i));
+	return cb_float(cb_to_float(a) * cb_to_float(b));
+}
+
+/* a / b for ints, correctly rounded like Python's int true division. */
+static double cb_int_div(int64_t a, int64_t b) {
+	int negative = (a < 0) != (b < 0);
+	uint64_t n = a < 0 ? -(uint64_t)a : (uint64_t)a;
+	uint64_t d = b < 0 ? -(uint64_t)b : (uint64_t)b;
+	double result;
+	if (n < (UINT64_C(1) << 53) && d < (UINT64_C(1) << 53)) {
+		result = (double)n / (double)d; /* Both exact, so one rounding. */
+	} else if (n == 0) {
+		result = 0.0;
+	} else {
+		/* Scale to a quotient of 55-56 bits, fold the remainder into a sticky bit and let the
+		   conversion to double do the one rounding. */
+		int shift = 55 + (64 - __builtin_clzll(d)) - (64 - __builtin_clzll(n));
+		unsigned __int128 num = n, den = d;
+		if (shift >= 0)
+			num <<= shift;
+		else
+			den <<= -shift;
+		uint64_t q = (uint64_t)(num / den) | (num % den != 0);
+		result = ldexp((double)q, -shift);
+	}
+	return negative ? -result : result;
+}
+
+static inline double cb_idiv(int64_t a, int64_t b) {
+	if (b == 0)
+		cb_fail("ZeroDivisionError: division by zero", "");
+	return cb_int_div(a, b);
+}
+
+static inline double cb_fdiv(double a, double b) {
+	if (b == 0.0)
+		cb_fail("ZeroDivisionError: float division by zero", "");
+	return a / b;
+}
+
+static inline cb_value cb_div(cb_value a, cb_value b) {
+	if (a.tag == CB_INT && b.tag == CB_INT)
+		return cb_float(cb_idiv(a.u.i, b.u.i));
+	return cb_float(cb_fdiv(cb_to_float(a), cb_to_float(b)));
+}
+
+static inline cb_value cb_neg(cb_value a) {
+	if (a.tag == CB_INT)
+		return cb_int(cb_ineg(a.u.i));
+	return cb_float(-a.u.f);
+}
+
+static inline cb_value cb_pos(cb_value a) {
+	return a;
+}
+
+/* Exact comparison of an int with a float: -1, 0 or 1, or 2 if unordered (NaN). */
+static int cb_compare_int_float(int64_t i, double f) {
+	if (isnan(f))
+		return 2;
+	if (f >= 9223372036854775808.0)
+		return -1;
+	if (f < -9223372036854775808.0)
+		return 1;
+	double t = trunc(f);
+	int64_t ti = (int64_t)t;
+	if (i != ti)
+		return i < ti ? -1 : 1;
+	return f > t ? -1 : f < t ? 1 : 0;
+}
+
+/* Comparison of values that are not both ints: -1, 0 or 1, or 2 if unordered (NaN). */
+static int cb_compare_mixed(cb_value a, cb_value b) {
+	if (a.tag == CB_FLOAT && b.tag == CB_FLOAT) {
+		if (isnan(a.u.f) || isnan(b.u.f))
+			return 2;
+		return (a.u.f > b.u.f) - (a.u.f < b.u.f);
+	}
+	if (a.tag == CB_INT)
+		return cb_compare_int_float(a.u.i, b.u.f);
+	int c = cb_compare_int_float(b.u.i, a.u.f);
+	return c == 2 ? 2 : -c;
+}
+
+#define CB_COMPARISON(name, op, test) \
+	static inline int name(cb_value a, cb_value b) { \
+		if (a.tag == CB_INT && b.tag == CB_INT) \
+			return a.u.i op b.u.i; \
+		int c = cb_compare_mixed(a, b); \
+		return test; \
+	}
+
+CB_COMPARISON(cb_eq, ==, c == 0)
+CB_COMPARISON(cb_ne, !=, c != 0)
+CB_COMPARISON(cb_lt, <, c == -1)
+CB_COMPARISON(cb_le, <=, c == -1 || c == 0)
+CB_COMPARISON(cb_gt, >, c == 1)
+CB_COMPARISON(cb_ge, >=, c == 0 || c == 1)
+
+static inline int cb_truth(cb_value v) {
+	return v.tag == CB_INT ? v.u.i != 0 : v.u.f != 0.0;
+}
+
+/* Format a float like Python's repr(): the shortest digits that read back as the same value,
+   in positional notation unless the exponent is below -4 or above 15. */
+static void cb_format_float(double x, char *out) {
+	if (isnan(x)) {
+		strcpy(out, "nan");
+		return;
+	}
+	if (isinf(x)) {
+		strcpy(out, x > 0 ? "inf" : "-inf");
+		return;
+	}
+	char buf[40], digits[20];
+	int precision, n = 0, i;
+	for (precision = 0; precision < 17; precision++) {
+		snprintf(buf, sizeof buf, "%.*e", precision, x);
+		if (strtod(buf, NULL) == x)
+			break;
+	}
+	const char *p = buf;
+	if (*p == '-') {
+		*out++ = '-';
+		p++;
+	}
+	for (; *p != 'e'; p++)
+		if (*p != '.')
+			digits[n++] = *p;
+	int exponent = atoi(p + 1);
+	while (n > 1 && digits[n - 1] == '0')
+		n--;
+	int point = exponent + 1; /* Digits before the decimal point. */
+	if (point <= -4 || point > 16) {
+		*out++ = digits[0];
+		if (n > 1) {
+			*out++ = '.';
+			memcpy(out, digits + 1, n - 1);
+			out += n - 1;
+		}
+		sprintf(out, "e%c%02d", exponent < 0 ? '-' : '+', abs(exponent));
+	} else if (point <= 0) {
+		*out++ = '0';
+		*out++ = '.';
+		for (i = 0; i < -point; i++)
+			*out++ = '0';
+		memcpy(out, digits, n);
+		out[n] = '\0';
+	} else if (point >= n) {
+		memcpy(out, digits, n);
+		out += n;
+		for (i = n; i < point; i++)
+			*out++ = '0';
+		strcpy(out, ".0");
+	} else {
+		memcpy(out, digits, point);
+		out += point;
+		*out++ = '.';
+		memcpy(out, digits + point, n - point);
+		out[n - point] = '\0';
+	}
+}
+
+static void cb_print(cb_value v, int newline) {
+	cb_check_depth(2); /* print() and the write() it calls. */
+	if (v.tag == CB_INT) {
+		printf("%" PRId64, v.u.i);
+	} else {
+		char buf[40];
+		cb_format_float(v.u.f, buf);
+		fputs(buf, stdout);
+	}
+	if (newline)
+		putchar('\n');
+}
+
+static void cb_print_text(const char *text, size_t length, int newline) {
+	cb_check_depth(2);
+	fwrite(text, 1, length, stdout);
+	if (newline)
+		putchar('\n');
+}
+
+/* The checks range(start, stop, step) makes before a counting loop runs. */
+static void cb_range(cb_value start, cb_value stop) {
+	cb_check_depth(1);
+	if (start.tag != CB_INT || stop.tag != CB_INT)
+		cb_fail("TypeError: 'float' object cannot be interpreted as an integer", "");
+}
+"""
+
+
+# Raised for programs the C backend cannot lower; `pos` is the source offset of the statement.
+class Unsupported(Exception):
+    """Raised for programs the C backend cannot lower."""
+
+    def __init__(self, message, node=None):
+        super().__init__(message)
+        self.pos = getattr(node, "pos", None)
+
+
+# Raised when the C compiler is missing or fails.
+class BuildError(Exception):
+    """Raised when the C compiler is missing or fails."""
+
+
+# Return the name Python uses for a Cobalt identifier; Python normalises identifiers to NFKC.
+def pythonName(name):
+    """Return the name Python uses for a Cobalt identifier."""
+    return unicodedata.normalize("NFKC", name)
+
+
+# Return a C identifier for a Cobalt name: a prefix, then the name with anything that is not an
+# ASCII letter or digit spelled out as _<hex code point>_.
+def cName(prefix, name):
+    """Return a C identifier for a Cobalt name."""
+    return prefix + "".join(
+        char if char.isascii() and char.isalnum() else f"_{ord(char):x}_" for char in pythonName(name)
+    )
+
+
+# Return a C string literal for some text, encoded as UTF-8.
+def cString(text):
+    """Return a C string literal for some text, encoded as UTF-8."""
+    chars = []
+    for byte in text.encode("utf-8", "surrogatepass"):
+        if 32 <= byte < 127 and chr(byte) not in '"\\?':
+            chars.append(chr(byte))
+        else:
+            chars.append(f"\\{byte:03o}")
+    return '"' + "".join(chars) + '"'
+
+
+# Return a C expression for a float.
+def floatLiteral(value):
+    """Return a C expression for a float."""
+    if value != value:
+        return "NAN"
+    if value in (float("inf"), float("-inf")):
+        return "INFINITY" if value > 0 else "-INFINITY"
+    return value.hex()
+
+
+# Return a C expression for an int, or raise Unsupported if it does not fit in 64 bits.
+def intLiteral(value, node):
+    """Return a C expression for an int, or raise Unsupported if it does not fit in 64 bits."""
+    if not INT64_MIN <= value <= INT64_MAX:
+        raise Unsupported(f"the integer {value} does not fit in 64 bits", node)
+    if value == INT64_MIN:
+        return "INT64_MIN"
+    return f"INT64_C({value})"
+
+
+# CGenerator walks the syntax tree and writes a C program that behaves like the Python backend's.
+# Func bodies go to one Emitter and module-level code, which becomes main(), to another.
+class CGenerator:
+    def __init__(self, mode="script"):
+        self.mode = mode  # The Python code generation mode whose behaviour to reproduce.
+        self.functions = Emitter(None)  # C functions, one per Func.
+        self.main = Emitter(None)  # The body of main().
+        self.emitter = self.main  # Where statements are generated.
+        self.globals = set()  # C names of module-level variables.
+        self.prototypes = []  # C names of the functions, in definition order.
+        self.locals = None  # Python names local to the Func being generated, or None at module level.
+        self.mainLocals = set()  # Python names that are locals of main() in the Python code.
+        self.temps = 0  # Most temporaries any comparison chain needs.
+        self.loops = 0  # Counting loops generated so far; numbers their C variables.
+        self.statementNode = None  # Statement being generated, for error positions.
+        self.types = None  # typeinfer.Types of the module.
+        self.scope = None  # Func being generated, or None at module level; for type lookups.
+        self.recursionLimit = RECURSION_LIMIT  # The limit the Python program runs with.
+
+    # Generate a whole module; returns the C source.
+    def generate(self, module):
+        """Generate a whole module; returns the C source."""
+        with nestingLimit(module.depth):
+            self.types = module.types if module.types is not None else inferTypes(module)
+            self.check(module)
+            if any(type(node) is Func and node.memo for node in walk(module.body)):
+                # The cache itself is left out: memoized Funcs are pure, so calling them again
+                # gives the same result.
+                self.recursionLimit = MEMO_RECURSION_LIMIT
+            if self.mode == "main":
+                shared = {pythonName(name) for name in mainGlobals(module)}
+                self.mainLocals = {pythonName(name) for name in assigned(module.body)} - shared
+            self.main.id = 1
+            for node in module.body:
+                self.statement(node)
+        return self.source()
+
+    # Raise Unsupported for programs whose Python behaviour this backend does not reproduce.
+    def check(self, module):
+        """Raise Unsupported for programs whose Python behaviour this backend does not reproduce."""
+        topLevel = {id(node) for node in module.body if type(node) is Func}
+        funcs = collections.Counter()
+        variables = set()
+        for node in walk(module.body):
+            kind = type(node)
+            if kind is Func:
+                if id(node) not in topLevel:
+                    raise Unsupported("Funcs defined inside blocks or other Funcs", node)
+                if node.params:
+                    raise Unsupported("Func parameters", node)
+                funcs[pythonName(node.name)] += 1
+                self.checkName(node.name, node)
+            elif kind is Var or kind is For:
+                variables.add(pythonName(node.name))
+                self.checkName(node.name, node)
+            elif kind is Array or kind is Store:
+                raise Unsupported("arrays", node)
+            elif kind is Import:
+                raise Unsupported("Import", node)
+        for name, count in funcs.items():
+            if count > 1:
+                raise Unsupported(f"Func '{name}' is defined more than once")
+            if name in variables:
+                raise Unsupported(f"'{name}' is both a Func and a variable")
+
+    # Raise Unsupported for a name the generated Python could not use as written.
+    def checkName(self, name, node):
+        """Raise Unsupported for a name the generated Python could not use as written."""
+        name = pythonName(name)
+        if not name.isidentifier() or keyword.iskeyword(name) or name in RESERVED[self.mode]:
+            raise Unsupported(f"the name '{name}'", node)
+
+    # Return the whole C program.
+    def source(self):
+        """Return the whole C program."""
+        parts = [
+            "/* Generated by the Cobalt C backend. */\n",
+            f"#define CB_BASE_DEPTH {BASE_DEPTH[self.mode]}\n",
+            f"#define CB_RECURSION_LIMIT {self.recursionLimit}\n",
+            RUNTIME,
+            "\n",
+        ]
+        if self.temps:
+            parts.append(f"static cb_value cb_t[{self.temps}];\n")
+        parts += [f"static cb_value {name};\n" for name in sorted(self.globals)]
+        parts += [f"static void {name}(void);\n" for name in self.prototypes]
+        parts += ["\n", self.functions.getCode(), "int main(void) {\n", self.main.getCode()]
+        parts.append("\treturn 0;\n}\n")
+        return "".join(parts)
+
+    # Generate code for one statement.
+    def statement(self, node):
+        """Generate code for one statement."""
+        outer = self.statementNode
+        self.statementNode = node
+        getattr(self, "gen" + type(node).__name__)(node)
+        self.statementNode = outer
+
+    # Generate the statements of a block, one level further in.
+    def block(self, body):
+        """Generate the statements of a block, one level further in."""
+        self.emitter.id += 1
+        for node in body:
+            self.statement(node)
+        self.emitter.id -= 1
+
+    def genPrint(self, node):
+        newline = int(node.newline)
+        if type(node.value) is String:
+            text = self.stringValue(node.value)
+            self.emitter.emitLine(
+                f"cb_print_text({cString(text)}, {len(text.encode('utf-8', 'surrogatepass'))}, {newline});"
+            )
+        else:
+            self.emitter.emitLine(f"cb_print({self.expr(node.value)}, {newline});")
+
+    def genIf(self, node):
+        self.emitter.emitLine(f"if ({self.cond(node.cond)}) {{")
+        self.block(node.body)
+        for clause in node.elifs:
+            self.emitter.emitLine(f"}} else if ({self.cond(clause.cond)}) {{")
+            self.block(clause.body)
+        if node.orelse is not None:
+            self.emitter.emitLine("} else {")
+            self.block(node.orelse.body)
+        self.emitter.emitLine("}")
+
+    def genWhile(self, node):
+        self.emitter.emitLine(f"while ({self.cond(node.cond)}) {{")
+        self.block(node.body)
+        self.emitter.emitLine("}")
+
+    def genFor(self, node):
+        # Mirrors the Python backend: if cond: for name in range(name, stop, step): body; then name += step.
+        self.loops += 1
+        start, stop, i = (f"cb_{part}{self.loops}" for part in ("start", "stop", "i"))
+        target = self.target(node.name)
+        test = "<" if node.step > 0 else ">"
+        emit = self.emitter.emitLine
+        emit(f"if ({self.cond(node.cond)}) {{")
+        self.emitter.id += 1
+        emit(f"cb_value {start} = {self.read(node.name)};")
+        emit(f"cb_value {stop} = {self.expr(node.stop)};")
+        emit(f"cb_range({start}, {stop});")
+        emit(f"for (int64_t {i} = {start}.u.i; {i} {test} {stop}.u.i;) {{")
+        self.emitter.id += 1
+        emit(f"{target} = cb_int({i});")
+        for child in node.body:
+            self.statement(child)
+        emit(f"if (__builtin_add_overflow({i}, {intLiteral(node.step, node)}, &{i}))")
+        emit("\tbreak;")
+        self.emitter.id -= 1
+        emit("}")
+        emit(f"{target} = cb_add({self.read(node.name)}, cb_int({intLiteral(node.step, node)}));")
+        self.emitter.id -= 1
+        emit("}")
+
+    def genFunc(self, node):
+        name = cName("f_", node.name)
+        self.prototypes.append(name)
+        outer = (self.emitter, self.locals, self.scope)
+        self.emitter, self.scope = self.functions, node
+        self.locals = {pythonName(local) for local in assigned(node.body)}
+        self.emitter.emitLine(f"static void {name}(void) {{")
+        self.emitter.id += 1
+        for local in sorted(self.locals):
+            self.emitter.emitLine(f"cb_value {cName('l_', local)} = {{0}};")
+        for child in node.body:
+            self.statement(child)
+        self.emitter.id -= 1
+        self.emitter.emitLine("}")
+        self.emitter.emitLine("")
+        self.emitter, self.locals, self.scope = outer
+
+    def genVar(self, node):
+        self.emitter.emitLine(f"{self.target(node.name)} = {self.expr(node.value)};")
+
+    def genCall(self, node):
+        self.emitter.emitLine(f"cb_call({cName('f_', node.name)});")
+
+    def genReturn(self, node):
+        # Calls are statements, so the value is only evaluated for its errors.
+        if type(node.value) is not String:
+            self.emitter.emitLine(f"(void){self.expr(node.value)};")
+        self.emitter.emitLine("return;")
+
+    # Return the C lvalue a Var assigns to.
+    def target(self, name):
+        """Return the C lvalue a Var assigns to."""
+        if self.locals is not None and pythonName(name) in self.locals:
+            return cName("l_", name)
+        variable = cName("v_", name)
+        self.globals.add(variable)
+        return variable
+
+    # Return a C expression reading a variable, failing like Python if it is unbound.
+    def read(self, name):
+        """Return a C expression reading a variable, failing like Python if it is unbound."""
+        message = cString(pythonName(name))
+        if self.locals is not None and pythonName(name) in self.locals:
+            return f"cb_local({cName('l_', name)}, {message})"
+        variable = cName("v_", name)
+        self.globals.add(variable)
+        if self.locals is None and pythonName(name) in self.mainLocals:
+            return f"cb_local({variable}, {message})"
+        return f"cb_global({variable}, {message})"
+
+    # Return the text of a string literal as Python reads it.
+    def stringValue(self, node):
+        """Return the text of a string literal as Python reads it."""
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                return ast.literal_eval(f'"{node.text}"')
+        except (SyntaxError, ValueError):
+            raise Unsupported("a string literal that is not valid Python", self.statementNode)
+
+    # Return a C condition (an int) for an If/While condition.
+    def cond(self, node):
+        """Return a C condition (an int) for an If/While condition."""
+        kind = type(node)
+        if kind is Constant and type(node.value) is bool:
+            return "1" if node.value else "0"
+        if kind is not Compare:
+            ctype = self.ctypes(node)[id(node)]
+            if ctype == VALUE:
+                return f"cb_truth({self.expr(node)})"
+            return f"({self.expr(node, ctype)} != 0)"
+        if len(node.ops) == 1:
+            left, right = node.left, node.comparators[0]
+            ctype = self.ctypes(left)[id(left)]
+            if ctype != VALUE and self.ctypes(right)[id(right)] == ctype:
+                # Both ints or both floats: C compares them as Python does, NaN included.
+                return f"({self.expr(left, ctype)} {node.ops[0]} {self.expr(right, ctype)})"
+            return f"{COMPARE_FUNCTIONS[node.ops[0]]}({self.expr(left)}, {self.expr(right)})"
+        # A chain evaluates each operand once, left to right, and stops at the first false link.
+        # Expressions cannot call Funcs, so static temporaries are safe.
+        self.temps = max(self.temps, len(node.ops) + 1)
+        links = []
+        for index, (op, comparator) in enumerate(zip(node.ops, node.comparators)):
+            load = f"cb_t[{index + 1}] = {self.expr(comparator)}"
+            if index == 0:
+                load = f"cb_t[0] = {self.expr(node.left)}, {load}"
+            links.append(f"({load}, {COMPARE_FUNCTIONS[op]}(cb_t[{index}], cb_t[{index + 1}]))")
+        return " && ".join(links)
+
+    # Return {id(node): C type} for an expression and its subexpressions: int64_t or double where
+    # type inference proves the value is always an int or always a float, else cb_value.
+    def ctypes(self, node):
+        """Return {id(node): C type} for an expression and its subexpressions."""
+        found = {}
+        stack = [(node, False)]
+        while stack:
+            node, ready = stack.pop()
+            kind = type(node)
+            if kind is BinOp or kind is UnaryOp:
+                if not ready:
+                    stack.append((node, True))
+                    stack.extend((child, False) for child in operands(node))
+                    continue
+                children = [found[id(child)] for child in operands(node)]
+                if VALUE in children:
+                    found[id(node)] = VALUE
+                elif kind is BinOp and (node.op == "/" or "double" in children):
+                    found[id(node)] = "double"
+                else:
+                    found[id(node)] = children[0]
+            elif kind is Name:
+                found[id(node)] = C_TYPES.get(self.types.variable(node.name, self.scope), VALUE)
+            elif kind is Number:
+                found[id(node)] = "double" if "." in node.text else "int64_t"
+            elif kind is Constant and type(node.value) in (int, float):
+                found[id(node)] = "double" if type(node.value) is float else "int64_t"
+            else:
+                found[id(node)] = VALUE
+        return found
+
+    # Return the C expression of a Cobalt expression, as a value of C type `want`: a cb_value, or
+    # an int64_t or double for expressions whose type is known.
+    def expr(self, node, want=VALUE):
+        """Return the C expression of a Cobalt expression, as a value of C type `want`."""
+        ctypes = self.ctypes(node)
+        parts = []
+        stack = [(node, want)]  # (node, C type wanted) still to generate and text to copy, in reverse order.
+        while stack:
+            item = stack.pop()
+            if type(item) is str:
+                parts.append(item)
+                continue
+            node, want = item
+            kind = type(node)
+            ctype = ctypes[id(node)]
+            if ctype != want and kind is not Name:
+                # Convert: box an unboxed value, or widen an int to a double.
+                if want == VALUE:
+                    stack += [")", (node, ctype), "cb_int(" if ctype == "int64_t" else "cb_float("]
+                else:
+                    stack += [")", (node, ctype), "((double)"]
+                continue
+            if kind is Name:
+                read = self.read(node.name)
+                if ctype == want:
+                    parts.append(read if want == VALUE else read + (".u.i" if want == "int64_t" else ".u.f"))
+                elif want == VALUE:
+                    parts.append(read)
+                else:
+                    parts.append(f"((double){read}.u.i)")
+            elif kind is Number:
+                parts.append(self.number(node.text, ctype))
+            elif kind is Constant:
+                parts.append(self.constant(node.value, ctype))
+            elif kind is BinOp:
+                if ctype == VALUE:
+                    function, operand = BINARY_FUNCTIONS[node.op], VALUE
+                elif ctypes[id(node.left)] == ctypes[id(node.right)] == "int64_t":
+                    function, operand = INT_FUNCTIONS[node.op], "int64_t"
+                elif node.op == "/":
+                    function, operand = "cb_fdiv", "double"
+                else:
+                    stack += [")", (node.right, "double"), f" {node.op} ", (node.left, "double"), "("]
+                    continue
+                stack += [")", (node.right, operand), ", ", (node.left, operand), function + "("]
+            elif kind is UnaryOp:
+                if ctype == VALUE:
+                    stack += [")", (node.operand, VALUE), UNARY_FUNCTIONS[node.op] + "("]
+                elif node.op == "+":
+                    stack.append((node.operand, ctype))
+                elif ctype == "int64_t":
+                    stack += [")", (node.operand, ctype), "cb_ineg("]
+                else:
+                    stack += [")", (node.operand, ctype), "(- "]
+            elif kind is String:
+                raise Unsupported("string values", self.statementNode)
+            elif kind is Index or kind is Length:
+                raise Unsupported("arrays", self.statementNode)
+            else:
+                raise Unsupported(f"a {kind.__name__} used as a value", self.statementNode)
+        return "".join(parts)
+
+    # Return a numeric literal, which must also be valid Python, as C type `ctype`.
+    def number(self, text, ctype=VALUE):
+        """Return a numeric literal, which must also be valid Python, as C type `ctype`."""
+        if not text.isascii():
+            raise Unsupported(f"the number {text}", self.statementNode)
+        if "." in text:
+            # Unlike a folded constant, a literal too big for a float is valid Python: it is inf.
+            literal = floatLiteral(float(text))
+            return literal if ctype == "double" else f"cb_float({literal})"
+        if not INT_LITERAL.fullmatch(text):
+            raise Unsupported(f"the number {text} (Python does not allow leading zeros)", self.statementNode)
+        return self.constant(int(text), ctype)
+
+    # Return a constant computed by the optimizer as C type `ctype`.
+    def constant(self, value, ctype=VALUE):
+        """Return a constant computed by the optimizer as C type `ctype`."""
+        if type(value) is int:
+            literal = intLiteral(value, self.statementNode)
+            return literal if ctype == "int64_t" else f"cb_int({literal})"
+        if type(value) is float and value - value == 0:
+            literal = floatLiteral(value)
+            return literal if ctype == "double" else f"cb_float({literal})"
+        # Bools only appear as conditions, and Python code cannot spell inf or nan as a literal.
+        raise Unsupported(f"the constant {value!r}", self.statementNode)
+
+
+# Write C source next to `target` (as target.c) and compile it into the executable `target`.
+def build(source, target, cc=None):
+    """Write C source next to `target` (as target.c) and compile it into the executable `target`."""
+    cc = cc or os.environ.get("CC", "cc")
+    if shutil.which(cc) is None:
+        raise BuildError(f"no C compiler '{cc}' found (set $CC)")
+    cfile = target + ".c"
+    with open(cfile, "w") as f:
+        f.write(source)
+    result = subprocess.run(
+        [cc, *CFLAGS, "-o", target, cfile, "-lm"], capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise BuildError(f"{cc} failed:\n{result.stderr.strip()}")
@@ -1,31 +1,722 @@
 import argparse
+import os
+import sys
+import time
 
+from cache import *
+from codegen import *
 from emit import *
 from lex import *
+from optimize import *
 from parse import *
+import bytecode
+import cobaltrt
+import sourcemap
 
-if __name__ == "__main__":
-    ap = argparse.ArgumentParser(description="Cobalt transpiler to Python")
-    ap.add_argument("infile", type=str, help="Cobalt source file")
-    ap.add_argument("-o", help="Python output file", default=None)
 
-    args = ap.parse_args()
+# Compiler version; part of every cache key.
+VERSION = "0.5.0"
+
+
+# Library API.
+
+
+# Transpile Cobalt source (a string or file object) to Python source text.
+# With a TranspileCache, unchanged sources skip the lexer, parser and code generator entirely.
+def transpile_source(source, optimize=0, codegen="script", cache=None, memoSize=MEMO_SIZE, flush="size"):
+    """Transpile Cobalt source (a string or file object) to Python source text."""
+    if cache is not None:
+        if not isinstance(source, str):
+            source = source.read()
+        key = cache.key(source, optimize=optimize, codegen=codegen, memoSize=memoSize, flush=flush)
+        code = cache.get(key)
+        if code is None:
+            code = transpile_source(source, optimize, codegen, memoSize=memoSize, flush=flush)
+            cache.put(key, code)
+        return code
+
+    module = Parser(Lexer(source)).program()
+    Optimizer(optimize).optimize(module)
+    emitter = Emitter(None)
+    CodeGenerator(emitter, codegen, memoSize, flush).generate(module)
+    return emitter.getCode()
+
+
+# Transpile Cobalt source text to Python, also returning a SourceMap back to `filename`.
+def transpile_with_map(
+    source, filename="<cobalt>", optimize=0, codegen="script", memoSize=MEMO_SIZE, flush="size"
+):
+    """Transpile Cobalt source text to Python, also returning a SourceMap back to `filename`."""
+    module = Parser(Lexer(source)).program()
+    Optimizer(optimize).optimize(module)
+    emitter = Emitter(None, sourceMap=True)
+    CodeGenerator(emitter, codegen, memoSize, flush).generate(module)
+    return emitter.getCode(), sourcemap.build(source, emitter.lineOffsets(), filename)
+
+
+# Return the name code compiled from the Cobalt file `filename` reports in tracebacks. Its line
+# numbers are those of the generated Python, so it must not name the .cb file: traceback and
+# linecache would show whatever Cobalt lines have those numbers.
+def codeFilename(filename):
+    """Return the name code compiled from the Cobalt file `filename` reports in tracebacks."""
+    if filename.startswith("<"):
+        return filename
+    return f"<cobalt:{filename}>"
+
+
+# Compile Cobalt source to a Python code object, entirely in memory.
+def compile_source(
+    source, filename="<cobalt>", optimize=0, codegen="script", cache=None, memoSize=MEMO_SIZE, flush="size"
+):
+    """Compile Cobalt source to a Python code object, entirely in memory."""
+    filename = codeFilename(filename)
+    if cache is None:
+        python = transpile_source(source, optimize, codegen, memoSize=memoSize, flush=flush)
+        return compile(python, filename, "exec")
+
+    if not isinstance(source, str):
+        source = source.read()
+    key = cache.key(source, optimize=optimize, codegen=codegen, memoSize=memoSize, flush=flush)
+    code = cache.getCode(key, filename)
+    if code is None:
+        # One lookup per compile, so that a miss is counted once.
+        python = transpile_source(source, optimize, codegen, memoSize=memoSize, flush=flush)
+        code = compile(python, filename, "exec")
+        cache.putCode(key, filename, code)
+    return code
+
+
+# Compile and run Cobalt source in this process; returns the program's global namespace. The
+# program's buffered output is all written out by the time this returns, or raises.
+def run_source(
+    source, filename="<cobalt>", optimize=0, codegen="script", cache=None, memoSize=MEMO_SIZE, flush="size"
+):
+    """Compile and run Cobalt source in this process; returns the program's global namespace."""
+    code = compile_source(source, filename, optimize, codegen, cache, memoSize, flush)
+    namespace = {"__name__": "__main__", "__file__": filename}
+    try:
+        exec(code, namespace)
+    finally:
+        cobaltrt.close()
+    return namespace
+
+
+# Command line.
+
+
+# Add the options shared by every command that generates code.
+def addCodegenOptions(ap):
+    """Add the options shared by every command that generates code."""
+    ap.add_argument(
+        "-O",
+        dest="optimize",
+        type=int,
+        choices=[0, 1, 2, 3],
+        default=0,
+        help="Optimisation level: 0 none, 1 fold constants and remove dead branches, 2 also remove dead stores"
+        " and memoize pure Funcs, 3 also remove array bounds checks",
+    )
+    ap.add_argument(
+        "--codegen",
+        choices=MODES,
+        default="script",
+        help="Code generation mode: 'main' wraps the program in main() so its variables are fast locals",
+    )
+    ap.add_argument(
+        "--memo-size",
+        type=int,
+        default=MEMO_SIZE,
+        help=f"Results each memoized Func keeps (default: {MEMO_SIZE}; 0 disables caching)",
+    )
+    ap.add_argument(
+        "--flush",
+        choices=cobaltrt.POLICIES,
+        default="size",
+        help="When the program's buffered output is written: when 64 KiB are waiting (size), after"
+        " every line (line) or when the program ends (exit)",
+    )
+    ap.add_argument(
+        "--unbuffered",
+        dest="flush",
+        action="store_const",
+        const="unbuffered",
+        help="Print with print(), without the runtime module's output buffer, e.g. for interactive use",
+    )
+
+
+# Add the options that control the transpilation cache.
+def addCacheOptions(ap):
+    """Add the options that control the transpilation cache."""
+    ap.add_argument("--no-cache", action="store_true", help="Do not read or write the cache")
+    ap.add_argument(
+        "--cache-dir", default=None, help="Cache directory (default: $COBALT_CACHE_DIR or ~/.cache/cobalt)"
+    )
+    ap.add_argument(
+        "--cache-size",
+        type=int,
+        default=DEFAULT_MAX_BYTES // 2**20,
+        help="Evict least recently used entries beyond this many MiB",
+    )
+    ap.add_argument(
+        "--cache-stats", action="store_true", help="Print cache hit/miss counters when done"
+    )
 
-    with open(args.infile) as infile:
-        code = infile.read()
 
-    # Initialize the lexer, emitter, and parser.
-    lexer = Lexer(code)
+# Return the TranspileCache selected by the command line options, or None if caching is off.
+def openCache(args):
+    """Return the TranspileCache selected by the command line options, or None if caching is off."""
+    if args.no_cache:
+        return None
+    return TranspileCache(args.cache_dir or defaultDirectory(), VERSION, args.cache_size * 2**20)
+
+
+# Save a cache's counters and print them if asked to.
+def closeCache(cache, args):
+    """Save a cache's counters and print them if asked to."""
+    if cache is None:
+        return
+    if args.cache_stats:
+        printCacheStats(cache)
+    cache.saveStats()
+
+
+def printCacheStats(cache):
+    stats = cache.stats()
+    print(
+        f"cache: {stats['hits']} hits, {stats['misses']} misses, {stats['evictions']} evictions"
+        f" (all time: {stats['total_hits']} hits, {stats['total_misses']} misses);"
+        f" {stats['entries']} entries, {stats['bytes'] / 2**20:.1f} of"
+        f" {stats['max_bytes'] / 2**20:.0f} MiB in {stats['directory']}",
+        file=sys.stderr,
+    )
+
+
+# cobalt.py infile [-o outfile]: transpile a Cobalt file to a Python file.
+def compileCommand(argv):
+    """Transpile a Cobalt file to a Python file."""
+    ap = argparse.ArgumentParser(
+        description="Cobalt transpiler to Python",
+        epilog="Other commands: " + ", ".join(f"'{name}'" for name in COMMANDS),
+    )
+    ap.add_argument(
+        "infile",
+        nargs="+",
+        help="Cobalt source file; several files, directories or glob patterns compile them all",
+    )
+    ap.add_argument("-o", help="Python output file, or - for stdout", default=None)
+    ap.add_argument(
+        "--emit",
+        choices=bytecode.EMIT,
+        default="py",
+        help="Write Python source, a sourceless .pyc instead, or both (the .pyc in __pycache__)",
+    )
+    ap.add_argument(
+        "-j",
+        dest="jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of worker processes when compiling several files",
+    )
+    ap.add_argument(
+        "--stream",
+        action="store_true",
+        help="Write each top-level statement out as soon as it is compiled",
+    )
+    addCodegenOptions(ap)
+    ap.add_argument(
+        "--backend",
+        choices=["python", "c"],
+        default="python",
+        help="'c' builds a native executable (OUTFILE, with its C source in OUTFILE.c) with $CC,"
+        " falling back to Python for programs it cannot lower",
+    )
+    ap.add_argument(
+        "--report", action="store_true", help="List every change made by the optimizer"
+    )
+    ap.add_argument(
+        "--timings",
+        action="store_true",
+        help="Print wall and CPU time and peak memory per phase, and token counts by type",
+    )
+    ap.add_argument(
+        "--productions", action="store_true", help="Count the calls to each grammar production"
+    )
+    ap.add_argument(
+        "--profile", metavar="FILE", default=None, help="Save a cProfile dump of the compile to FILE"
+    )
+    ap.add_argument(
+        "--source-map",
+        choices=["file", "inline"],
+        default=None,
+        help="Map generated lines back to Cobalt lines, in OUTFILE.map or in a comment at the end",
+    )
+    addCacheOptions(ap)
+
+    args = ap.parse_args(argv)
+    # Measuring a compile means doing one: these flags bypass the cache.
+    instrumented = args.timings or args.productions or args.profile
+    if args.stream and args.optimize >= 2:
+        ap.error("-O2 and -O3 need the whole module and cannot be combined with --stream")
+    if args.stream and args.codegen == "main":
+        ap.error("--codegen main needs the whole module and cannot be combined with --stream")
+    if args.stream and instrumented:
+        ap.error("--timings, --productions and --profile cannot be combined with --stream")
+    if args.stream and args.source_map:
+        ap.error("--source-map needs the whole source and cannot be combined with --stream")
+    if args.stream and args.emit != "py":
+        ap.error("--emit pyc and both need the whole output and cannot be combined with --stream")
+
+    if args.backend == "c" and (args.stream or instrumented or args.source_map or args.emit != "py"):
+        ap.error("--backend c cannot be combined with --stream, --emit, --source-map or instrumentation")
+
+    if len(args.infile) > 1 or not os.path.isfile(args.infile[0]):
+        if args.o or args.stream:
+            ap.error("-o and --stream need a single input file")
+        if args.backend == "c":
+            ap.error("--backend c needs a single input file")
+        return batchCommand(args)
+    args.infile = args.infile[0]
+
+    if args.backend == "c":
+        if args.o == "-":
+            ap.error("--backend c needs an output file")
+        if buildNative(args):
+            return
 
     outfile = args.o
 
     if not outfile:
-        emitter = Emitter(f"{args.infile[:-3]}.py")
+        outfile = f"{args.infile[:-3]}.py"
+    elif outfile != "-" and outfile[-3:] != ".py":
+        outfile = f"{outfile}.py"
+    if outfile == "-" and args.source_map == "file":
+        ap.error("--source-map file needs an output file; use --source-map inline with -o -")
+    if outfile == "-" and args.emit != "py":
+        ap.error("--emit pyc and both need an output file")
+    emitter = Emitter(outfile, stream=args.stream, sourceMap=args.source_map is not None)
+    generator = CodeGenerator(emitter, args.codegen, args.memo_size, args.flush)
+    optimizer = Optimizer(args.optimize)
+    # Streaming never holds the whole source, so it cannot be hashed up front. Source maps are
+    # built from the compile itself, so they bypass the cache too.
+    cache = None if args.stream or instrumented or args.source_map else openCache(args)
+    cached = False  # True if the output came from the cache.
+
+    if instrumented:
+        import profiling
+
+        with open(args.infile) as infile:
+            source = infile.read()
+        run = lambda: profiling.transpileInstrumented(source, generator, optimizer, args.productions)
+        report = profiling.profile(run, args.profile) if args.profile else run()
+        if args.timings:
+            profiling.measureMemory(source, args.codegen, args.optimize, report)
+        writeOutput(emitter, args.emit)
+    elif args.source_map:
+        with open(args.infile) as infile:
+            source = infile.read()
+        transpileFile(source, emitter, generator, optimizer)
+        sourceMap = sourcemap.build(source, emitter.lineOffsets(), args.infile)
+        if args.source_map == "inline":
+            emitter.emitLine(sourceMap.comment())
+        else:
+            with open(outfile + ".map", "w") as f:
+                f.write(sourceMap.dumps())
+        writeOutput(emitter, args.emit)
+    elif cache is not None:
+        with open(args.infile, "rb") as infile:
+            source = infile.read()
+        key = cache.key(
+            source, optimize=args.optimize, codegen=args.codegen, memoSize=args.memo_size, flush=args.flush
+        )
+        code = cache.get(key)
+        if code is not None:
+            cached = True
+            emitter.code.append(code)
+        else:
+            transpileFile(source.decode(), emitter, generator, optimizer)
+            cache.put(key, emitter.getCode())
+        writeOutput(emitter, args.emit)
     else:
-        emitter = Emitter(f"{outfile}.py") if outfile[-3:] != ".py" else Emitter(f"{outfile}")
+        with open(args.infile) as infile:
+            # The lexer reads the source in chunks.
+            transpileFile(infile, emitter, generator, optimizer, args.stream)
+        writeOutput(emitter, args.emit)  # Write the output to file.
+
+    if outfile != "-":
+        if args.flush != "unbuffered":
+            bytecode.writeRuntime(os.path.dirname(outfile))
+        print("Transpiling completed.")
+    if args.optimize and not cached:
+        print(f"Optimised (-O{args.optimize}): {optimizer.summary()}.", file=sys.stderr)
+        if args.report:
+            for change in optimizer.changes:
+                print(f"  {change}", file=sys.stderr)
+    if args.timings or args.productions:
+        profiling.printReport(report, sys.stderr if outfile == "-" else sys.stdout)
+    closeCache(cache, args)
+
+
+# Build a Cobalt file into a native executable with the C backend. Returns False, after saying
+# why, if the program cannot be lowered to C or the C compiler fails.
+def buildNative(args):
+    """Build a Cobalt file into a native executable with the C backend."""
+    import cbackend
+
+    with open(args.infile) as infile:
+        source = infile.read()
+    module = Parser(Lexer(source)).program()
+    optimizer = Optimizer(args.optimize)
+    optimizer.optimize(module)
+    target = args.o or args.infile[:-3]
+    try:
+        cbackend.build(cbackend.CGenerator(args.codegen).generate(module), target)
+    except cbackend.Unsupported as e:
+        where = f":{source.count(chr(10), 0, e.pos) + 1}" if e.pos is not None else ""
+        print(
+            f"{args.infile}{where}: the C backend does not support {e};"
+            " using the Python backend instead.",
+            file=sys.stderr,
+        )
+        return False
+    except cbackend.BuildError as e:
+        print(f"{e}\nUsing the Python backend instead.", file=sys.stderr)
+        return False
+    print(f"Built {target}.")
+    if args.optimize:
+        print(f"Optimised (-O{args.optimize}): {optimizer.summary()}.", file=sys.stderr)
+        if args.report:
+            for change in optimizer.changes:
+                print(f"  {change}", file=sys.stderr)
+    return True
+
+
+# Write out the emitter's code as Python source, bytecode or both, as --emit asks.
+def writeOutput(emitter, emit):
+    """Write out the emitter's code as Python source, bytecode or both, as --emit asks."""
+    if emit == "py":
+        emitter.writeFile()
+    else:
+        bytecode.writeOutput(emitter.getCode(), emitter.fullPath, emit)
+
+
+# Compile every file named by the inputs in parallel and print a summary.
+def batchCommand(args):
+    """Compile every file named by the inputs in parallel and print a summary."""
+    import batch
 
-    parser = Parser(lexer, emitter)
+    paths = batch.expandInputs(args.infile)
+    if not paths:
+        sys.exit("No Cobalt files found.")
+    cache = openCache(args)
 
-    parser.program()  # Start the parser.
-    emitter.writeFile()  # Write the output to file.
-    print("Transpiling completed.")
+    start = time.perf_counter()
+    results = batch.compileFiles(
+        paths,
+        args.jobs,
+        args.optimize,
+        args.codegen,
+        args.emit,
+        cache.directory if cache is not None else None,
+        cache.maxBytes if cache is not None else None,
+        args.memo_size,
+        args.flush,
+    )
+    wall = time.perf_counter() - start
+
+    failed = [(path, error) for path, _, _, error in results if error is not None]
+    for path, error in failed:
+        print(f"{path}: {error}", file=sys.stderr)
+    if cache is not None:
+        # Workers count into their own handles; fold their hits and misses into ours.
+        hits = sum(hit for _, _, hit, error in results if error is None)
+        cache.hits += hits
+        cache.misses += len(results) - len(failed) - hits
+    if args.timings:
+        for path, seconds, hit, _ in sorted(results, key=lambda result: -result[1])[:10]:
+            print(f"{seconds * 1000:8.1f} ms  {path}{' (cached)' if hit else ''}")
+    print(
+        f"Transpiled {len(results) - len(failed)} of {len(results)} files"
+        f" ({len(failed)} failed) in {wall:.2f}s: {len(results) / wall:.0f} files/sec"
+        f" with {min(args.jobs, len(results))} jobs."
+    )
+    closeCache(cache, args)
+    if failed:
+        sys.exit(1)
+
+
+# Transpile a source (string or file object) into `emitter`; the caller writes the output out.
+def transpileFile(source, emitter, generator, optimizer, stream=False):
+    """Transpile a source (string or file object) into `emitter`."""
+    parser = Parser(Lexer(source))
+
+    if stream:
+        # Generate each top-level statement as soon as it is parsed.
+        for statement in parser.moduleStatements():
+            with nestingLimit(parser.depth):
+                for node in optimizer.optimizeStatement(statement):
+                    generator.statement(node)
+            emitter.endStatement()
+        return
+
+    module = parser.program()  # Start the parser.
+    optimizer.optimize(module)
+    generator.generate(module)
+
+
+# cobalt.py run infile: compile a Cobalt file in memory and run it in this process.
+def runCommand(argv):
+    """Compile a Cobalt file in memory and run it in this process."""
+    ap = argparse.ArgumentParser(
+        prog="cobalt.py run", description="Compile a Cobalt program in memory and run it"
+    )
+    ap.add_argument("infile", type=str, help="Cobalt source file")
+    addCodegenOptions(ap)
+    addCacheOptions(ap)
+    args = ap.parse_args(argv)
+
+    cache = openCache(args)
+    with open(args.infile) as infile:
+        try:
+            run_source(infile, args.infile, args.optimize, args.codegen, cache, args.memo_size, args.flush)
+        finally:
+            closeCache(cache, args)
+
+
+# cobalt.py cache: show or clear the transpilation cache.
+def cacheCommand(argv):
+    """Show or clear the transpilation cache."""
+    ap = argparse.ArgumentParser(prog="cobalt.py cache", description="Show or clear the cache")
+    ap.add_argument("--clear", action="store_true", help="Delete every cache entry")
+    ap.add_argument("--cache-dir", default=None, help="Cache directory")
+    args = ap.parse_args(argv)
+
+    cache = TranspileCache(args.cache_dir or defaultDirectory(), VERSION)
+    if args.clear:
+        cache.clear()
+    printCacheStats(cache)
+
+
+# cobalt.py serve: answer compile requests on a Unix socket, avoiding per-file interpreter startup.
+def serveCommand(argv):
+    """Answer compile requests on a Unix socket, avoiding per-file interpreter startup."""
+    import server
+
+    ap = argparse.ArgumentParser(
+        prog="cobalt.py serve",
+        description="Run a compile server; cobaltc.py sends it files to transpile",
+    )
+    ap.add_argument("--socket", default=None, help="Socket path (default: $COBALT_SOCKET)")
+    ap.add_argument("-v", "--verbose", action="store_true", help="Log every request and its timing")
+    addCacheOptions(ap)
+    args = ap.parse_args(argv)
+
+    cache = openCache(args)
+    try:
+        server.serve(args.socket, cache, args.verbose)
+    except OSError as e:
+        sys.exit(str(e))
+    finally:
+        closeCache(cache, args)
+
+
+# cobalt.py build directory: build a project of modules that Import each other.
+def buildCommand(argv):
+    """Build a project of modules, rebuilding only those whose inputs changed."""
+    import project
+
+    ap = argparse.ArgumentParser(
+        prog="cobalt.py build",
+        description="Build every Cobalt module in a directory; modules can Import each other by name",
+    )
+    ap.add_argument("directory", help="Project directory; each .cb file in it is one module")
+    ap.add_argument(
+        "-o", dest="outdir", default=None, help="Directory for the .py and .cbi files (default: the project's)"
+    )
+    ap.add_argument(
+        "-j",
+        dest="jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of worker processes",
+    )
+    ap.add_argument(
+        "--emit",
+        choices=bytecode.EMIT,
+        default="py",
+        help="Write Python source, a sourceless .pyc instead, or both (the .pyc in __pycache__)",
+    )
+    ap.add_argument("--timings", action="store_true", help="Print how long each module took")
+    addCodegenOptions(ap)
+    args = ap.parse_args(argv)
+
+    start = time.perf_counter()
+    results = project.build(
+        args.directory,
+        args.outdir,
+        args.jobs,
+        args.optimize,
+        args.codegen,
+        args.memo_size,
+        args.emit,
+        args.flush,
+    )
+    wall = time.perf_counter() - start
+
+    for name, status, _, error in results:
+        if error is not None:
+            print(f"{name}: {error}", file=sys.stderr)
+    if args.timings:
+        for name, status, seconds, _ in results:
+            print(f"{seconds * 1000:8.1f} ms  {name} ({status})")
+    counts = {status: 0 for status in ("built", "up to date", "failed")}
+    for _, status, _, _ in results:
+        counts[status] += 1
+    print(
+        f"Built {counts['built']} of {len(results)} modules ({counts['up to date']} up to date,"
+        f" {counts['failed']} failed) in {wall:.2f}s."
+    )
+    if counts["failed"]:
+        sys.exit(1)
+
+
+# cobalt.py watch directory: recompile .cb files as they change, reusing unchanged functions.
+def watchCommand(argv):
+    """Recompile .cb files as they change, reusing unchanged functions."""
+    import watch
+
+    ap = argparse.ArgumentParser(
+        prog="cobalt.py watch",
+        description="Recompile the Cobalt files in a directory whenever they change",
+    )
+    ap.add_argument("directory", help="Directory to watch (searched recursively for .cb files)")
+    ap.add_argument(
+        "--interval", type=float, default=0.1, help="Seconds between checks (default: %(default)s)"
+    )
+    addCodegenOptions(ap)
+    args = ap.parse_args(argv)
+
+    try:
+        watch.watch(
+            args.directory, args.optimize, args.codegen, args.interval, memoSize=args.memo_size, flush=args.flush
+        )
+    except KeyboardInterrupt:
+        pass
+
+
+# cobalt.py profile infile: run a program under a line tracer and report hot spots by Cobalt line.
+def profileCommand(argv):
+    """Run a program under a line profiler and report hot spots by Cobalt line."""
+    import profiling
+
+    ap = argparse.ArgumentParser(
+        prog="cobalt.py profile",
+        description="Run a Cobalt program and report where it spends its time, by Cobalt line and Func",
+    )
+    ap.add_argument("infile", type=str, help="Cobalt source file")
+    addCodegenOptions(ap)
+    ap.add_argument("--top", type=int, default=15, help="Number of lines to report")
+    args = ap.parse_args(argv)
+
+    with open(args.infile) as infile:
+        text = infile.read()
+    code, sourceMap = transpile_with_map(
+        text, args.infile, args.optimize, args.codegen, args.memo_size, args.flush
+    )
+    filename = args.infile[:-3] + ".py"
+    profiler = profiling.LineProfiler(filename)
+    try:
+        profiler.run(compile(code, filename, "exec"), {"__name__": "__main__", "__file__": filename})
+    finally:
+        cobaltrt.close()
+        sys.stdout.flush()
+        profiling.printHotSpots(profiler, sourceMap, text, args.top)
+
+
+# cobalt.py bundle inputs -o app.pyz: precompile Cobalt files and package them as one zipapp.
+def bundleCommand(argv):
+    """Precompile Cobalt files and package them as one zipapp."""
+    import batch
+
+    ap = argparse.ArgumentParser(
+        prog="cobalt.py bundle",
+        description="Compile Cobalt files to bytecode and package them into one zipapp;"
+        " run it with `python APP [MODULE]`",
+    )
+    ap.add_argument(
+        "infile",
+        nargs="+",
+        help="Cobalt files, directories or glob patterns; .py files are included as helper modules",
+    )
+    ap.add_argument("-o", required=True, help="Archive to write, e.g. app.pyz")
+    ap.add_argument(
+        "--main",
+        default=None,
+        help="Module run when none is named (default: the only Cobalt module, if there is one)",
+    )
+    ap.add_argument(
+        "--python", default=None, help="Interpreter for a #! line, making the archive executable"
+    )
+    addCodegenOptions(ap)
+    addCacheOptions(ap)
+    args = ap.parse_args(argv)
+
+    paths = batch.expandInputs(args.infile)
+    if not paths:
+        sys.exit("No Cobalt files found.")
+    cache = openCache(args)
+    modules = {}
+    programs = []  # Names of the modules compiled from Cobalt.
+    try:
+        for path in paths:
+            name, extension = os.path.splitext(os.path.basename(path))
+            if "." in name or name == "__main__" or name == RUNTIME:
+                ap.error(f"{path}: '{name}' cannot be used as a module name")
+            if name in modules:
+                ap.error(f"{path}: more than one module is called '{name}'")
+            with open(path) as f:
+                source = f.read()
+            if extension == ".py":
+                modules[name] = source
+            else:
+                modules[name] = transpile_source(
+                    source, args.optimize, args.codegen, cache, args.memo_size, args.flush
+                )
+                programs.append(name)
+    finally:
+        closeCache(cache, args)
+    if programs and args.flush != "unbuffered":
+        modules[RUNTIME] = bytecode.runtimeSource()
+
+    default = args.main
+    if default is None and len(programs) == 1:
+        default = programs[0]
+    if default is not None and default not in modules:
+        ap.error(f"--main {default}: no such module in the bundle")
+    bytecode.writeBundle(args.o, modules, default, args.python)
+    print(f"Bundled {len(modules)} modules into {args.o}.")
+
+
+# Subcommands; anything else is treated as a file to transpile.
+COMMANDS = {
+    "run": runCommand,
+    "build": buildCommand,
+    "cache": cacheCommand,
+    "serve": serveCommand,
+    "watch": watchCommand,
+    "profile": profileCommand,
+    "bundle": bundleCommand,
+}
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    try:
+        if argv and argv[0] in COMMANDS:
+            return COMMANDS[argv[0]](argv[1:])
+        return compileCommand(argv)
+    except CobaltError as e:
+        sys.exit(str(e))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Thin client for the Cobalt compile server (`cobalt.py serve`).
+
+It imports nothing from the compiler, so a call costs one interpreter start and a socket round trip.
+"""
+import argparse
+import json
+import os
+import shutil
+import socket
+import sys
+
+# Runtime module that programs with buffered output import; written next to each output.
+RUNTIME = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cobaltrt.py")
+
+
+# Where the server listens unless told otherwise: $COBALT_SOCKET, else a per-user socket.
+def defaultSocket():
+    """Where the server listens unless told otherwise: $COBALT_SOCKET, else a per-user socket."""
+    if os.environ.get("COBALT_SOCKET"):
+        return os.environ["COBALT_SOCKET"]
+    runtime = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime:
+        return os.path.join(runtime, "cobalt.sock")
+    return f"/tmp/cobalt-{os.getuid()}.sock"
+
+
+# Copy the runtime module next to an output file, unless an identical copy is already there.
+def writeRuntime(outfile):
+    """Copy the runtime module next to an output file, unless an identical copy is already there."""
+    target = os.path.join(os.path.dirname(outfile), os.path.basename(RUNTIME))
+    with open(RUNTIME, "rb") as f:
+        data = f.read()
+    if os.path.exists(target):
+        with open(target, "rb") as f:
+            if f.read() == data:
+                return
+    shutil.copyfile(RUNTIME, target)
+
+
+# Send one request to the server and return its reply. The default socket may be in /tmp, where
+# anyone can create a file by that name, so only a socket owned by this user is connected to.
+def request(path, **fields):
+    """Send one request to the server and return its reply."""
+    if os.stat(path).st_uid != os.getuid():
+        raise PermissionError(f"{path} is owned by another user")
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path)
+        sock.sendall(json.dumps(fields).encode() + b"\n")
+        with sock.makefile("rb") as reply:
+            return json.loads(reply.readline())
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Transpile a Cobalt file using the compile server")
+    ap.add_argument("infile", help="Cobalt source file")
+    ap.add_argument("-o", help="Python output file, or - for stdout", default=None)
+    ap.add_argument("-O", dest="optimize", type=int, choices=[0, 1, 2, 3], default=0)
+    ap.add_argument("--codegen", default="script")
+    ap.add_argument("--memo-size", type=int, default=None, help="Results each memoized Func keeps")
+    ap.add_argument("--flush", choices=["size", "line", "exit"], default="size", help="Output flush policy")
+    ap.add_argument(
+        "--unbuffered", dest="flush", action="store_const", const="unbuffered", help="Print with print()"
+    )
+    ap.add_argument("--check", action="store_true", help="Only report errors; write nothing")
+    ap.add_argument("--timings", action="store_true", help="Print the server's phase timings")
+    ap.add_argument("--socket", default=None, help="Server socket (default: %(default)s)")
+    args = ap.parse_args(argv)
+
+    with open(args.infile) as infile:
+        source = infile.read()
+    fields = {
+        "op": "check" if args.check else "compile",
+        "source": source,
+        "filename": args.infile,
+        "optimize": args.optimize,
+        "codegen": args.codegen,
+        "flush": args.flush,
+    }
+    if args.memo_size is not None:
+        fields["memoSize"] = args.memo_size
+    try:
+        reply = request(args.socket or defaultSocket(), **fields)
+    except (FileNotFoundError, ConnectionRefusedError, PermissionError) as e:
+        # No server of ours running: compile in this process instead, paying the import cost once.
+        reason = e if isinstance(e, PermissionError) else "no compile server running"
+        print(f"cobaltc: {reason}; compiling in-process", file=sys.stderr)
+        import server
+
+        reply = server.handle(fields)
+
+    if args.timings:
+        for phase, seconds in reply.get("timings", {}).items():
+            print(f"{phase}: {seconds * 1000:.1f} ms", file=sys.stderr)
+    if not reply["ok"]:
+        sys.exit(f"{args.infile}: {reply['error']}")
+    if args.check:
+        return
+
+    outfile = args.o or f"{args.infile[:-3]}.py"
+    if outfile == "-":
+        sys.stdout.write(reply["code"])
+        return
+    if outfile[-3:] != ".py":
+        outfile = f"{outfile}.py"
+    with open(outfile, "w") as f:
+        f.write(reply["code"])
+    if args.flush != "unbuffered":
+        writeRuntime(outfile)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import atexit
+import io
+import sys
+
+# Runtime support that generated programs import: buffered output for Print and PrintLn.
+#
+# print() is slow in programs that print in loops: every call parses its keyword arguments and
+# makes two writes, and sys.stdout flushes at every line when it is a terminal or Python runs
+# unbuffered. A program instead asks writer() for a function that writes whole lines of text to
+# a buffer of its own over the standard output file, flushed by one of these policies:
+#   size: whenever BUFFER_SIZE bytes are waiting.
+#   line: after every line, so output shows up as it is printed, even through a pipe.
+#   exit: only when the program ends; all of its output is kept in memory until then.
+# The modules of a program share one buffer, flushed by the policy of the first one to start.
+# Whatever is still buffered is written when the interpreter exits, also after an error.
+# Programs compiled with --unbuffered do not use this module and call print() as before.
+
+POLICIES = ("size", "line", "exit")
+BUFFER_SIZE = 1 << 16
+
+
+# Output is the buffer a program's Prints write to, over the stream that was sys.stdout when it started.
+class Output:
+    def __init__(self, stream, policy="size"):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown flush policy {policy!r}")
+        self.stream = stream  # Where the output finally goes.
+        self.policy = policy
+        self.file = None  # Buffered file written to, or None to write to the stream directly.
+        stream.flush()  # Whatever the stream holds comes before the program's output.
+        if policy == "exit":
+            self.file = io.StringIO()
+        else:
+            try:
+                fd = stream.fileno()
+            except (AttributeError, OSError, ValueError):
+                fd = None  # Not a file, e.g. output captured in memory; already fast to write to.
+            if fd is not None:
+                self.file = io.TextIOWrapper(
+                    open(fd, "wb", buffering=BUFFER_SIZE, closefd=False),
+                    encoding=getattr(stream, "encoding", None),
+                    errors=getattr(stream, "errors", None),
+                    line_buffering=policy == "line",
+                )
+        self.write = (self.file or stream).write  # Bound once; generated code calls it directly.
+
+    # Write out everything buffered so far.
+    def flush(self):
+        """Write out everything buffered so far."""
+        if self.policy == "exit":
+            text = self.file.getvalue()
+            self.file.seek(0)
+            self.file.truncate()
+            self.stream.write(text)
+            self.stream.flush()
+        elif self.file is not None:
+            self.file.flush()
+        else:
+            self.stream.flush()
+
+    # Flush the buffer and stop using it; the stream itself stays open.
+    def close(self):
+        """Flush the buffer and stop using it; the stream itself stays open."""
+        try:
+            self.flush()
+        finally:
+            if self.file is not None:
+                self.file.close()
+            self.file = None
+
+
+# Output of the program running now, or None.
+current = None
+
+
+# Return the function a module's Prints write text with, starting to buffer the program's output
+# unless another of its modules already has.
+def writer(policy="size"):
+    """Return the function a module's Prints write text with."""
+    global current
+    if current is None or current.stream is not sys.stdout:
+        close()  # Output that went to where sys.stdout was before.
+        current = Output(sys.stdout, policy)
+    return current.write
+
+
+# Write out the running program's buffered output.
+def flush():
+    """Write out the running program's buffered output."""
+    if current is not None:
+        current.flush()
+
+
+# Write out the running program's buffered output and stop buffering it; the next program run in
+# this process starts a buffer of its own.
+def close():
+    """Write out the running program's buffered output and stop buffering it."""
+    global current
+    output, current = current, None
+    if output is not None:
+        output.close()
+
+
+# At exit, write out what is left. Output to a pipe whose reader has gone is dropped quietly.
+@atexit.register
+def closeAtExit():
+    """At exit, write out what is left."""
+    try:
+        close()
+    except BrokenPipeError:
+        pass
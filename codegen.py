@@ -0,0 +1,354 @@
+from nodes import *
+from optimize import constantValue, expressions, knownIndex, operands, walk
+from scope import mainGlobals
+from typeinfer import FLOATS, INTS, STRING
+
+# Binding strength of each operator; higher binds tighter.
+PRECEDENCE = {"+": 1, "-": 1, "*": 2, "/": 2}
+UNARY_PRECEDENCE = 3
+ATOM_PRECEDENCE = 4
+
+# Arrays are array.array objects: 64-bit signed ints (typecode "q") or doubles ("d").
+ARRAY_IMPORT = "from array import array as _array"
+
+# Python builtins the generated code calls are imported under names Cobalt programs cannot
+# declare, since a program may have variables of its own named like them.
+BUILTIN_IMPORT = "from builtins import {name} as _{name}"
+
+# Memo Funcs are wrapped in a bounded functools.lru_cache. typed=True keeps the results for 1 and
+# 1.0 apart, since Cobalt's operators treat ints and floats differently. If $COBALT_MEMO_STATS is
+# set, each cache's statistics are printed to stderr when the program exits. A call through the
+# cache counts twice against the recursion limit, so the limit is raised to twice Python's default
+# to let memoized recursion go as deep as it would without the cache.
+MEMO_SIZE = 1024
+MEMO_RECURSION_LIMIT = 2000
+MEMO_PRELUDE = """\
+import atexit as _atexit, functools as _functools, os as _os, sys as _sys
+_memoized = []
+_sys.setrecursionlimit(max(_sys.getrecursionlimit(), {limit}))
+
+
+def _memo(function):
+    cached = _functools.lru_cache(maxsize={size}, typed=True)(function)
+    _memoized.append(cached)
+    return cached
+
+
+@_atexit.register
+def _memoStats():
+    if _os.environ.get("COBALT_MEMO_STATS"):
+        for cached in _memoized:
+            print(f"{{cached.__name__}}: {{cached.cache_info()}}", file=_sys.stderr)
+"""
+
+
+# Print and PrintLn write through the runtime module (cobaltrt.py), which buffers output and
+# flushes it by the policy chosen at compile time; the compiler writes the module next to the
+# programs that need it. "unbuffered" calls print() instead and needs no runtime. Values are
+# converted with str() under another name, since a program may have a variable named str.
+RUNTIME = "cobaltrt"
+FLUSH_POLICIES = ("size", "line", "exit", "unbuffered")
+RUNTIME_PRELUDE = """\
+import cobaltrt as _cobaltrt
+from builtins import str as _str
+_write = _cobaltrt.writer({policy!r})
+"""
+
+# Characters that keep an expression out of an f-string replacement field.
+FSTRING_UNSAFE = set("'\"\\{}:!")
+
+
+# Code generation modes:
+#   script: module-level statements run at module level, as written.
+#   main: the module body is wrapped in a main() function so its variables are fast locals.
+MODES = ("script", "main")
+
+
+# CodeGenerator walks the syntax tree and drives the Emitter to write Python code.
+class CodeGenerator:
+    def __init__(self, emitter, mode="script", memoSize=MEMO_SIZE, flush="size"):
+        self.emitter = emitter
+        self.mode = mode
+        self.memoSize = memoSize  # Results each Memo Func keeps; 0 keeps none.
+        self.flush = flush  # Flush policy of the program's output, one of FLUSH_POLICIES.
+        self.types = None  # typeinfer.Types of the module, if known; picks array typecodes.
+        self.scope = None  # Func being generated, or None at module level; for type lookups.
+        # Preludes written, or known unneeded: "array", "memo", "output", "range" and "len".
+        self.written = set()
+
+    # Generate code for a whole module.
+    def generate(self, module):
+        """Generate code for a whole module."""
+        self.types = module.types
+        for line in self.preludes(module.body):
+            self.emitter.headerLine(line)
+        self.written = {"array", "memo", "output", "range", "len"}
+        with nestingLimit(module.depth):
+            if self.mode == "main":
+                self.generateMain(module)
+                return
+            for node in module.body:
+                self.statement(node)
+                self.emitter.endStatement()
+
+    # Wrap the module body in main(), declaring the names functions share with it as globals.
+    def generateMain(self, module):
+        """Wrap the module body in main(), declaring the names functions share with it as globals."""
+        # Imports all come first; they stay at module level, where every function can see them.
+        count = sum(type(node) is Import for node in module.body)
+        for node in module.body[:count]:
+            self.statement(node)
+        self.emitter.emitLine("def main():")
+        self.emitter.id += 1
+        shared = mainGlobals(module)
+        if shared:
+            self.emitter.emitLine("global " + ", ".join(sorted(shared)))
+        self.emitter.id -= 1
+        self.block(module.body[count:])
+        if module.library:
+            # Modules importing this one read its variables after main() returns.
+            self.emitter.id += 1
+            self.emitter.emitLine("globals().update(locals())")
+            self.emitter.id -= 1
+        self.emitter.emitLine("")
+        self.emitter.emitLine("")
+        self.emitter.emitLine("main()")
+        self.emitter.endStatement()
+
+    # Generate code for one statement.
+    def statement(self, node):
+        """Generate code for one statement."""
+        if self.emitter.id == 0:
+            # Streaming: write each prelude before the first top-level statement that needs it.
+            for line in self.preludes([node]):
+                self.emitter.emitLine(line)
+        outer = self.emitter.position
+        self.emitter.position = getattr(node, "pos", None)
+        getattr(self, "gen" + type(node).__name__)(node)
+        self.emitter.position = outer
+
+    # Return the lines of the preludes the statements in `body` need that are not written yet.
+    def preludes(self, body):
+        """Return the lines of the preludes the statements in `body` need that are not written yet."""
+        lines = []
+        for node in walk(body):
+            kind = type(node)
+            if kind is Array and "array" not in self.written:
+                self.written.add("array")
+                lines.append(ARRAY_IMPORT)
+            elif kind is Func and node.memo and "memo" not in self.written:
+                self.written.add("memo")
+                lines += MEMO_PRELUDE.format(size=self.memoSize, limit=MEMO_RECURSION_LIMIT).splitlines() + [""]
+            elif kind is Print and self.flush != "unbuffered" and "output" not in self.written:
+                self.written.add("output")
+                lines += RUNTIME_PRELUDE.format(policy=self.flush).splitlines()
+            elif kind is For and "range" not in self.written:
+                self.written.add("range")
+                lines.append(BUILTIN_IMPORT.format(name="range"))
+            if "len" not in self.written and callsLen(node):
+                self.written.add("len")
+                lines.append(BUILTIN_IMPORT.format(name="len"))
+        return lines
+
+    # Generate an indented block; Python needs at least one statement in it.
+    def block(self, body):
+        """Generate an indented block; Python needs at least one statement in it."""
+        self.emitter.id += 1
+        if not body:
+            self.emitter.emitLine("pass")
+        for node in body:
+            self.statement(node)
+        self.emitter.id -= 1
+
+    def genPrint(self, node):
+        if self.flush == "unbuffered":
+            end = "" if node.newline else ", end=''"
+            self.emitter.emitLine(f"print({self.expr(node.value)}{end})")
+            return
+        self.emitter.emitLine(f"_write({self.printText(node)})")
+
+    # Return the Python expression for the text a Print writes: what print() would.
+    def printText(self, node):
+        """Return the Python expression for the text a Print writes: what print() would."""
+        end = "\n" if node.newline else ""
+        value = node.value
+        kind = type(value)
+        if kind is String:
+            return f'"{value.text}\\n"' if end else f'"{value.text}"'
+        if kind is Constant or kind is Number:
+            return repr(f"{constantValue(value)}{end}")
+        text = self.expr(value)
+        if self.types is not None and self.types.expression(value, self.scope) == STRING:
+            return f'{text} + "\\n"' if end else text
+        if not end:
+            return f"_str({text})"
+        if FSTRING_UNSAFE.isdisjoint(text):
+            return f'f"{{{text}}}\\n"'
+        return f'_str({text}) + "\\n"'
+
+    def genIf(self, node):
+        self.emitter.emitLine(f"if {self.expr(node.cond)}:")
+        self.block(node.body)
+        for clause in node.elifs:
+            self.emitter.emitLine(f"elif {self.expr(clause.cond)}:")
+            self.block(clause.body)
+        if node.orelse is not None:
+            self.emitter.emitLine("else:")
+            self.block(node.orelse.body)
+
+    def genWhile(self, node):
+        self.emitter.emitLine(f"while {self.expr(node.cond)}:")
+        self.block(node.body)
+
+    def genFor(self, node):
+        # The guard and the final update leave the counter with the value the While loop would have.
+        self.emitter.emitLine(f"if {self.expr(node.cond)}:")
+        self.emitter.id += 1
+        stop = self.expr(node.stop)
+        self.emitter.emitLine(f"for {node.name} in _range({node.name}, {stop}, {node.step}):")
+        self.block(node.body)
+        op = "+" if node.step > 0 else "-"
+        self.emitter.emitLine(f"{node.name} = {node.name} {op} {abs(node.step)}")
+        self.emitter.id -= 1
+
+    def genFunc(self, node):
+        self.emitter.emitLine("")
+        if node.memo:
+            self.emitter.emitLine("@_memo")
+        self.emitter.emitLine(f"def {node.name}({', '.join(node.params)}):")
+        outer, self.scope = self.scope, node
+        self.block(node.body)
+        self.scope = outer
+        self.emitter.emitLine("")
+
+    def genImport(self, node):
+        names = sorted(set(node.variables) | {func.name for func, _, _ in node.funcs})
+        if names:
+            self.emitter.emitLine(f"from {node.name} import {', '.join(names)}")
+        else:
+            self.emitter.emitLine(f"import {node.name}")
+
+    def genVar(self, node):
+        self.emitter.emitLine(f"{node.name} = {self.expr(node.value)}")
+
+    def genArray(self, node):
+        fill = self.expr(node.fill)
+        if self.types is not None:
+            kinds = self.types.evaluate(node.fill, self.scope)[0]
+        else:
+            # Streaming, so no inferred types: only a constant fill's type is known.
+            kinds = {int: INTS, float: FLOATS}.get(type(constantValue(node.fill)))
+        if kinds == INTS or kinds == FLOATS:
+            typecode = "q" if kinds == INTS else "d"
+            value = f'_array("{typecode}", [{fill}])'
+        else:
+            # The fill's type decides when the array is made.
+            value = f'_array("d" if type(_v := {fill}) is float else "q", [_v])'
+        size = self.expr(node.size)
+        if precedence(node.size) <= PRECEDENCE["*"]:
+            size = f"({size})"
+        # Repeating a one-element array fills the whole array in one allocation.
+        self.emitter.emitLine(f"{node.name} = {value} * {size}")
+
+    def genStore(self, node):
+        target = self.expr(Index(Name(node.name), node.index, node.checked))
+        self.emitter.emitLine(f"{target} = {self.expr(node.value)}")
+
+    def genCall(self, node):
+        self.emitter.emitLine(self.expr(node))
+
+    def genReturn(self, node):
+        self.emitter.emitLine(f"return {self.expr(node.value)}")
+
+    # Return the Python source text of an expression.
+    def expr(self, node):
+        """Return the Python source text of an expression."""
+        parts = []
+        stack = [node]  # Nodes still to generate and text to copy, in reverse order.
+        while stack:
+            node = stack.pop()
+            kind = type(node)
+            if kind is str:
+                parts.append(node)
+            elif kind is Name:
+                parts.append(node.name)
+            elif kind is Number:
+                parts.append(node.text)
+            elif kind is String:
+                parts.append(f'"{node.text}"')
+            elif kind is Constant:
+                parts.append(repr(node.value))
+            elif kind is BinOp:
+                prec = PRECEDENCE[node.op]
+                # Operators are left-associative, so a right operand of equal precedence needs parentheses.
+                pushOperand(stack, node.right, prec + 1)
+                stack.append(f" {node.op} ")
+                pushOperand(stack, node.left, prec)
+            elif kind is UnaryOp:
+                pushOperand(stack, node.operand, UNARY_PRECEDENCE)
+                stack.append(node.op)
+            elif kind is Compare:
+                pending = [node.left]
+                for op, comparator in zip(node.ops, node.comparators):
+                    pending += [f" {op} ", comparator]
+                stack.extend(reversed(pending))
+            elif kind is Index:
+                name, index = node.array.name, node.index
+                if not node.checked or knownIndex(index):
+                    stack += ["]", index, f"{name}["]
+                elif type(index) is Name:
+                    # A negative index must fail like one past the end, not count from the end.
+                    stack += [f" >= 0 else _len({name})]", index, " if ", index, f"{name}["]
+                else:
+                    stack += [f") >= 0 else _len({name})]", index, f"{name}[_i if (_i := "]
+            elif kind is Call:
+                pending = []
+                for arg in node.args:
+                    pending += [", ", arg]
+                stack += [")"] + pending[:0:-1] + [f"{node.name}("]
+            elif kind is Length:
+                parts.append(f"_len({node.array.name})")
+            else:
+                raise TypeError(f"Cannot generate code for {kind.__name__}")
+        return "".join(parts)
+
+
+# Return true if the code for a statement, not counting the statements in its blocks, calls len():
+# for Len, and for the bounds check of an index that may be negative.
+def callsLen(node):
+    """Return true if the code for a statement, not counting the statements in its blocks, calls len()."""
+    if type(node) is Store and node.checked and not knownIndex(node.index):
+        return True
+    stack = list(expressions(node))
+    while stack:
+        value = stack.pop()
+        kind = type(value)
+        if kind is Length or kind is Index and value.checked and not knownIndex(value.index):
+            return True
+        stack.extend(operands(value))
+    return False
+
+
+# Push an operand onto expr()'s stack, parenthesized if it binds looser than `prec`.
+def pushOperand(stack, node, prec):
+    """Push an operand onto expr()'s stack, parenthesized if it binds looser than `prec`."""
+    if precedence(node) < prec:
+        stack += [")", node, "("]
+    else:
+        stack.append(node)
+
+
+# Return how tightly an expression node binds.
+def precedence(node):
+    """Return how tightly an expression node binds."""
+    kind = type(node)
+    if kind is BinOp:
+        return PRECEDENCE[node.op]
+    if kind is UnaryOp:
+        return UNARY_PRECEDENCE
+    if kind is Compare:
+        return 0
+    if kind is Constant and not isinstance(node.value, bool) and node.value < 0:
+        # Negative values print with a leading minus sign.
+        return UNARY_PRECEDENCE
+    return ATOM_PRECEDENCE
@@ -1,26 +1,77 @@
+import sys
+
+
 # Emitter object keeps track of the generated code and outputs it.
 class Emitter:
-    def __init__(self, fullPath):
-        self.fullPath = fullPath
-        self.header = ""
-        self.code = ""
-        self.id = 0
+    def __init__(self, fullPath, stream=False, sourceMap=False):
+        self.fullPath = fullPath  # Output file, or "-" for stdout.
+        self.stream = stream  # Flush completed top-level statements as soon as they are done.
+        self.header = []  # Chunks of the header.
+        self.code = []  # Chunks of code not yet written out.
+        self.atLineStart = True  # True if the next chunk starts a new line.
+        self.id = 0  # Current indentation level.
+        self.outputFile = None  # Open output file while streaming.
+        self.position = None  # Cobalt source offset of the statement being generated, if known.
+        # Cobalt source offset (or None) of each line of code, kept only when a source map is wanted,
+        # so that streaming output holds nothing per line.
+        self.positions = [] if sourceMap else None
 
     def emit(self, code):
-        if self.code and self.code[-1] in "\n\t":
-            self.code += self.id * "\t" + code
-        else:
-            self.code += code
+        if self.atLineStart and code:
+            self.code.append(self.id * "\t")
+            self.atLineStart = False
+        self.code.append(code)
 
     def emitLine(self, code):
-        if self.code and self.code[-1] == "\n":
-            self.code += self.id * "\t" + code + "\n"
-        else:
-            self.code += code + "\n"
+        if self.atLineStart and code:
+            self.code.append(self.id * "\t")
+        self.code.append(code)
+        self.code.append("\n")
+        self.atLineStart = True
+        if self.positions is not None:
+            self.positions.append(self.position)
 
     def headerLine(self, code):
-        self.header += code + "\n"
+        if self.outputFile is not None:
+            raise RuntimeError("Header line emitted after streaming output started")
+        self.header.append(code + "\n")
+
+    # Return all of the buffered output as a single string.
+    def getCode(self):
+        """Return all of the buffered output as a single string."""
+        return "".join(self.header) + "".join(self.code)
+
+    # Return the Cobalt source offset (or None) of every output line, header included.
+    def lineOffsets(self):
+        """Return the Cobalt source offset (or None) of every output line, header included."""
+        return [None] * len(self.header) + self.positions
+
+    # Called after each top-level statement; in streaming mode, write out what has been generated so far.
+    def endStatement(self):
+        """Called after each top-level statement; in streaming mode, write out what has been generated so far."""
+        if self.stream and self.id == 0 and self.atLineStart:
+            self.flush()
+
+    # Write the header (once) and all buffered code to the output, then drop the buffer.
+    def flush(self):
+        """Write the header (once) and all buffered code to the output, then drop the buffer."""
+        if self.outputFile is None:
+            self.outputFile = self.open()
+            self.outputFile.writelines(self.header)
+        self.outputFile.writelines(self.code)
+        self.code.clear()
+
+    # Open the output destination.
+    def open(self):
+        """Open the output destination."""
+        if self.fullPath == "-":
+            return sys.stdout
+        return open(self.fullPath, "w")
 
     def writeFile(self):
-        with open(self.fullPath, "w") as outputFile:
-            outputFile.write(self.header + self.code)
+        self.flush()
+        if self.outputFile is not sys.stdout:
+            self.outputFile.close()
+        else:
+            self.outputFile.flush()
+        self.outputFile = None
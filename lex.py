@@ -1,28 +1,44 @@
+import codecs
 import enum
-import sys
+import re
+from array import array
 
 
-# Token contains the original text and the type of token.
+# Base class for errors in a Cobalt program; the message is ready to show to the user.
+class CobaltError(Exception):
+    """Base class for errors in a Cobalt program."""
+
+
+# Raised by the Lexer for input that is not a valid token.
+class LexError(CobaltError):
+    """Raised by the Lexer for input that is not a valid token."""
+
+
+# Token records the type of token and where its text lives in the source.
 class Token:
     """Token class for parsing."""
 
-    def __init__(self, tokenText, tokenKind):
-        self.text = (
-            tokenText  # The token"s actual text. Used for identifiers, strings, and numbers.
-        )
+    __slots__ = ("kind", "source", "start", "end")
+
+    def __init__(self, source, start, end, tokenKind):
         self.kind = tokenKind  # The TokenType that this token is classified as.
+        self.source = source  # String holding the token's text.
+        self.start = start  # Offset of the token's text in `source`.
+        self.end = end  # Offset just past the token's text in `source`.
+
+    # The token's actual text. Used for identifiers, strings, and numbers.
+    @property
+    def text(self):
+        """The token's actual text, sliced out of the source on demand."""
+        return self.source[self.start : self.end]
 
     @staticmethod
     def checkIfKeyword(tokenText):
-        for kind in TokenType:
-            # Relies on all keyword enum values being 1XX.
-            if kind.name == tokenText and kind.value >= 100 and kind.value < 200:
-                return kind
-        return None
+        return KEYWORDS.get(tokenText)
 
 
 # TokenType is our enum for all the types of tokens.
-class TokenType(enum.Enum):
+class TokenType(enum.IntEnum):
     """List of token types."""
 
     EOF = -1
@@ -37,6 +53,8 @@ class TokenType(enum.Enum):
     RPAREN = 8
     COLON = 9
     COMMA = 10
+    LBRACKET = 11
+    RBRACKET = 12
 
     # Keywords.
     Module = 100
@@ -49,6 +67,10 @@ class TokenType(enum.Enum):
     While = 107
     Func = 108
     Return = 109
+    Array = 110
+    Len = 111
+    Memo = 112
+    Import = 113
 
     # Operators.
     EQ = 201
@@ -64,170 +86,214 @@ class TokenType(enum.Enum):
     GTEQ = 211
 
 
-KEYWORDS = [tt for tt in TokenType]
+# Keyword text -> TokenType. Relies on all keyword enum values being 1XX.
+KEYWORDS = {tt.name: tt for tt in TokenType if 100 <= tt.value < 200}
+
+# Integer value -> TokenType, for rebuilding kinds stored in arrays.
+KINDS = {tt.value: tt for tt in TokenType}
+
+# Punctuation and operator text -> TokenType.
+OPERATORS = {
+    "+": TokenType.PLUS,
+    "-": TokenType.MINUS,
+    "*": TokenType.ASTERISK,
+    "/": TokenType.SLASH,
+    ";": TokenType.SEMI,
+    "\n": TokenType.NEWLINE,
+    "{": TokenType.LBRACE,
+    "}": TokenType.RBRACE,
+    "(": TokenType.LPAREN,
+    ")": TokenType.RPAREN,
+    ",": TokenType.COMMA,
+    "[": TokenType.LBRACKET,
+    "]": TokenType.RBRACKET,
+    "=": TokenType.EQ,
+    "==": TokenType.EQEQ,
+    "!=": TokenType.NOTEQ,
+    "<": TokenType.LT,
+    "<=": TokenType.LTEQ,
+    ">": TokenType.GT,
+    ">=": TokenType.GTEQ,
+}
+
+# Shared token for the newline the lexer adds at the end of the input.
+NEWLINE = Token("\n", 0, 1, TokenType.NEWLINE)
+
+# Default number of characters (or bytes) a streaming Lexer reads at a time.
+CHUNK_SIZE = 1 << 16
+
+# Master pattern: skip whitespace (except newlines) and comments, then match exactly one token,
+# or END once only whitespace and comments are left. The skip prefix is wrapped in a lookahead + backreference so it behaves like an atomic group
+# and can never give characters back to the token alternatives.
+TOKEN_PATTERN = re.compile(
+    r"""
+    (?=(?P<skip>[ \t\r]*(?:(?:~[^~]*~|\#[^\n]*)[ \t\r]*)*))(?P=skip)
+    (?:
+        (?P<NUMBER>\d+(?:\.\d*)?)
+      | (?P<IDENT>[^\W\d_][^\W_]*)
+      | "(?P<STRING>[^"]*)"
+      | (?P<OP>==|!=|<=|>=|[-+*/;\n{}()\[\],=<>])
+      | (?P<ERROR>.)
+      | (?P<END>\Z)
+    )
+    """,
+    re.VERBOSE | re.DOTALL,
+)
 
 
 class Lexer:
     """Lexer class to easily generate tokens."""
 
-    def __init__(self, input):
-        self.source = (
-            input + "\n"
-        )  # Source code to lex as a string. Append a newline to simplify lexing/parsing the last token/statement.
-        self.curChar = ""  # Current character in the string.
-        self.curPos = -1  # Current position in the string.
-        self.nextChar()
-
-    # Process the next character.
-    def nextChar(self):
-        """Process the next character."""
-        self.curPos += 1
-        if self.curPos >= len(self.source):
-            self.curChar = "\0"  # EOF
+    def __init__(self, input, chunkSize=CHUNK_SIZE):
+        if isinstance(input, str):
+            self.source = input  # Source code to lex as a string.
+            self.reader = None
         else:
-            self.curChar = self.source[self.curPos]
-
-    # Return the lookahead character.
-    def peek(self):
-        """Return the lookahead character."""
-        if self.curPos + 1 >= len(self.source):
-            return "\0"
-        return self.source[self.curPos + 1]
+            self.source = None
+            self.reader = input  # File object or mmap to read the source from in chunks.
+        self.chunkSize = chunkSize  # Number of characters (or bytes) read at a time.
+        self.decoder = None  # Incremental UTF-8 decoder for binary readers.
+        self.tokens = self.scan()  # Generator producing the token stream.
 
-    # Invalid token found, print error message and exit.
+    # Invalid token found, raise an error with the message.
     def abort(self, message):
-        """Invalid token found, print error message and exit."""
-        sys.exit("Lexing error. " + message)
-
-    # Skip whitespace except newlines, which we will use to indicate the end of a statement.
-    def skipWhitespace(self):
-        """Skip whitespace except newlines, which we will use to indicate the end of a statement."""
-        while self.curChar == " " or self.curChar == "\t" or self.curChar == "\r":
-            self.nextChar()
-
-    # Skip comments in the code.
-    def skipComment(self):
-        """Skip comments in the code."""
-        if self.curChar == "~":
-            self.nextChar()
-            while self.curChar != "~":
-                self.nextChar()
-            self.nextChar()
-        elif self.curChar == "#":
-            while self.curChar != "\n":
-                self.nextChar()
+        """Invalid token found, raise an error with the message."""
+        raise LexError("Lexing error. " + message)
+
+    # Read the next chunk of source text; returns "" at the end of the input.
+    def read(self):
+        """Read the next chunk of source text; returns "" at the end of the input."""
+        while True:
+            chunk = self.reader.read(self.chunkSize)
+            if isinstance(chunk, str):
+                return chunk
+            # Binary files and mmaps hand us bytes; decode them without splitting characters.
+            if self.decoder is None:
+                self.decoder = codecs.getincrementaldecoder("utf-8")()
+            text = self.decoder.decode(chunk, final=not chunk)
+            if text or not chunk:
+                return text
+
+    # Lex the source in a single pass from `pos`, yielding tokens followed by EOF forever.
+    def scan(self, pos=0):
+        """Lex the source in a single pass from `pos`, yielding tokens followed by EOF forever."""
+        keywords = KEYWORDS
+        operators = OPERATORS
+        ident = TokenType.IDENT
+
+        if self.reader is None:
+            buf, final = self.source, True
+        else:
+            buf = self.read()
+            final = not buf
+
+        while True:
+            # A token that touches the end of the buffer may continue in the next chunk.
+            limit = len(buf) + 1 if final else len(buf)
+            for match in TOKEN_PATTERN.finditer(buf, pos):
+                group = match.lastgroup
+                start, end = match.span(group)
+                if end >= limit:
+                    break
+                if group == "OP":
+                    yield Token(buf, start, end, operators[buf[start:end]])
+                elif group == "IDENT":
+                    yield Token(buf, start, end, keywords.get(buf[start:end], ident))
+                elif group == "NUMBER":
+                    if buf[end - 1] == ".":
+                        # Must have at least one digit after decimal.
+                        self.abort(f"Illegal character in number: {buf[start:end]}")
+                    yield Token(buf, start, end, TokenType.NUMBER)
+                elif group == "STRING":
+                    yield Token(buf, start, end, TokenType.STRING)
+                elif group == "END":
+                    # Finish with a newline to simplify parsing the last statement.
+                    yield NEWLINE
+                    eof = Token(buf, end, end, TokenType.EOF)
+                    while True:
+                        yield eof
+                elif not final and buf[start] in '~"':
+                    # Possibly an unterminated comment or string; its end may be in the next chunk.
+                    break
+                else:
+                    self.error(match, buf)
+
+            # Keep the unfinished tail and append the next chunk to it.
+            pos = match.start()
+            chunk = self.read()
+            final = not chunk
+            buf = buf[pos:] + chunk
+            pos = 0
+
+    # Report a character that does not start any token.
+    def error(self, match, buf):
+        """Report a character that does not start any token."""
+        char = match.group("ERROR")
+        if char == "!":
+            self.abort("Expected !=, got !" + buf[match.end() : match.end() + 1])
+        elif char == '"':
+            self.abort("Unterminated string")
+        elif char == "~":
+            self.abort("Unterminated comment")
+        self.abort("Unknown token: {}".format(char))
+
+    # Continue lexing a string source from character offset `pos`, which must start a token.
+    def seek(self, pos):
+        """Continue lexing a string source from character offset `pos`, which must start a token."""
+        if self.source is None:
+            raise ValueError("Only a Lexer over a string can seek")
+        self.tokens = self.scan(pos)
 
     # Return the next token.
     def getToken(self):
         """Return the next token."""
-        # Check the first character of this token to see if we can decide what it is.
-        # If it is a multiple character operator (e.g., !=), number, identifier, or keyword then we will process the rest.
-
-        # Skip all whitespace characters.
-        self.skipWhitespace()
-        self.skipComment()
-        token = None
-
-        if self.curChar == "+":
-            token = Token(self.curChar, TokenType.PLUS)
-        elif self.curChar == "-":
-            token = Token(self.curChar, TokenType.MINUS)
-        elif self.curChar == "*":
-            token = Token(self.curChar, TokenType.ASTERISK)
-        elif self.curChar == "/":
-            token = Token(self.curChar, TokenType.SLASH)
-        elif self.curChar == ";":
-            token = Token(self.curChar, TokenType.SEMI)
-        elif self.curChar == "\n":
-            token = Token(self.curChar, TokenType.NEWLINE)
-        elif self.curChar == "\0":
-            token = Token("", TokenType.EOF)
-        elif self.curChar == "{":
-            token = Token(self.curChar, TokenType.LBRACE)
-        elif self.curChar == "}":
-            token = Token(self.curChar, TokenType.RBRACE)
-        elif self.curChar == "(":
-            token = Token(self.curChar, TokenType.LPAREN)
-        elif self.curChar == ")":
-            token = Token(self.curChar, TokenType.RPAREN)
-        elif self.curChar == ",":
-            token = Token(self.curChar, TokenType.COMMA)
-        elif self.curChar == "=":
-            # Check whether this token is = or ==
-            if self.peek() == "=":
-                lastChar = self.curChar
-                self.nextChar()
-                token = Token(lastChar + self.curChar, TokenType.EQEQ)
-            else:
-                token = Token(self.curChar, TokenType.EQ)
-        elif self.curChar == ">":
-            # Check whether this is token is > or >=
-            if self.peek() == "=":
-                lastChar = self.curChar
-                self.nextChar()
-                token = Token(lastChar + self.curChar, TokenType.GTEQ)
-            else:
-                token = Token(self.curChar, TokenType.GT)
-        elif self.curChar == "<":
-            # Check whether this is token is < or <=
-            if self.peek() == "=":
-                lastChar = self.curChar
-                self.nextChar()
-                token = Token(lastChar + self.curChar, TokenType.LTEQ)
-            else:
-                token = Token(self.curChar, TokenType.LT)
-        elif self.curChar == "!":
-            if self.peek() == "=":
-                lastChar = self.curChar
-                self.nextChar()
-                token = Token(lastChar + self.curChar, TokenType.NOTEQ)
-            else:
-                self.abort("Expected !=, got !" + self.peek())
-        elif self.curChar == '"':
-            # Get characters between quotations.
-            self.nextChar()
-            startPos = self.curPos
-
-            while self.curChar != '"':
-                self.nextChar()
-
-            tokText = self.source[startPos : self.curPos]  # Get the substring.
-            token = Token(tokText, TokenType.STRING)
-        elif self.curChar.isdigit():
-            # Leading character is a digit, so this must be a number.
-            # Get all consecutive digits and decimal if there is one.
-            startPos = self.curPos
-            while self.peek().isdigit():
-                self.nextChar()
-            if self.peek() == ".":  # Decimal!
-                self.nextChar()
-
-                # Must have at least one digit after decimal.
-                if not self.peek().isdigit():
-                    # Error!
-                    self.abort(f"Illegal character in number: {self.curChar}")
-                while self.peek().isdigit():
-                    self.nextChar()
-
-            tokText = self.source[startPos : self.curPos + 1]  # Get the substring.
-            token = Token(tokText, TokenType.NUMBER)
-        elif self.curChar.isalpha():
-            # Leading character is a letter, so this must be an identifier or a keyword.
-            # Get all consecutive alpha numeric characters.
-            startPos = self.curPos
-            while self.peek().isalnum():
-                self.nextChar()
-
-            # Check if the token is in the list of keywords.
-            tokText = self.source[startPos : self.curPos + 1]  # Get the substring.
-            keyword = Token.checkIfKeyword(tokText)
-            if keyword == None:  # Identifier
-                token = Token(tokText, TokenType.IDENT)
-            else:  # Keyword
-                token = Token(tokText, keyword)
-        else:
-            # Unknown token!
-            self.abort("Unknown token: {}".format(self.curChar))
+        return next(self.tokens)
+
+    # Lex the rest of the source into a compact TokenBuffer.
+    def tokenize(self):
+        """Lex the rest of the source into a compact TokenBuffer."""
+        return TokenBuffer(self)
 
-        self.nextChar()
-        return token
+
+# TokenBuffer stores a whole token stream as parallel arrays of kinds and offsets.
+class TokenBuffer:
+    """Array-backed token stream; a drop-in replacement for a Lexer when parsing."""
+
+    def __init__(self, lexer):
+        if lexer.source is None:
+            raise ValueError("TokenBuffer needs a Lexer over a string, not a stream")
+        self.source = lexer.source
+        self.kinds = array("h")  # Integer TokenType of each token.
+        self.starts = array("q")  # Start offset of each token's text in `source`.
+        self.ends = array("q")  # End offset of each token's text in `source`.
+        self.pos = 0  # Index of the next token handed out by getToken().
+
+        kinds, starts, ends = self.kinds, self.starts, self.ends
+        eof = TokenType.EOF
+        while True:
+            token = lexer.getToken()
+            kinds.append(token.kind)
+            starts.append(token.start)
+            ends.append(token.end)
+            if token.kind == eof:
+                break
+
+    def __len__(self):
+        return len(self.kinds)
+
+    # Return the i-th token.
+    def token(self, i):
+        """Return the i-th token."""
+        kind = self.kinds[i]
+        if kind == TokenType.NEWLINE:
+            # Includes the newline the lexer adds at the end, which is not in the source.
+            return NEWLINE
+        return Token(self.source, self.starts[i], self.ends[i], KINDS[kind])
+
+    # Return the next token, repeating EOF once the end is reached.
+    def getToken(self):
+        """Return the next token, repeating EOF once the end is reached."""
+        i = self.pos
+        if i < len(self.kinds) - 1:
+            self.pos = i + 1
+        return self.token(i)
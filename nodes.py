@@ -0,0 +1,302 @@
+# Syntax tree nodes built by the Parser and consumed by the code generator and later passes.
+
+import contextlib
+import sys
+import threading
+
+# Most Python frames a pass over statements uses per level of block nesting (e.g. the code
+# generator's statement -> genIf -> block).
+FRAMES_PER_LEVEL = 4
+
+# The recursion limit is process-wide, and the compile server compiles on several threads at once.
+# The nestingLimit() blocks active in any thread share it: it covers the deepest of them, and the
+# limit from before the first one is put back when the last one ends.
+activeDepths = []  # Nesting depth of each active nestingLimit() block.
+baseLimit = None  # Recursion limit from before the first active block.
+limitLock = threading.Lock()
+
+
+# Context manager: raise the recursion limit enough for passes that recurse once per block level.
+# The parser and the expression walkers use explicit stacks; the statement passes recurse, which
+# costs heap rather than C stack on CPython 3.11+, so nesting is bounded by memory, not the limit.
+@contextlib.contextmanager
+def nestingLimit(depth):
+    """Raise the recursion limit enough for passes that recurse once per block level."""
+    global baseLimit
+    with limitLock:
+        if not activeDepths:
+            baseLimit = sys.getrecursionlimit()
+        activeDepths.append(depth)
+        sys.setrecursionlimit(baseLimit + FRAMES_PER_LEVEL * max(activeDepths))
+    try:
+        yield
+    finally:
+        with limitLock:
+            activeDepths.remove(depth)
+            sys.setrecursionlimit(baseLimit + FRAMES_PER_LEVEL * max(activeDepths, default=0))
+
+
+# Base class for all syntax tree nodes.
+class Node:
+    """Base class for all syntax tree nodes."""
+
+    # Statements also get `pos`: the character offset in the Cobalt source where they start.
+    # It is set by the Parser after construction and may be missing on nodes made by later passes.
+    __slots__ = ("pos",)
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+# Statements.
+
+
+class Module(Node):
+    """Module ::= "Module" "{" {statement} "}" ";" """
+
+    __slots__ = ("body", "depth", "types", "library")
+
+    def __init__(self, body, depth=0, types=None, library=False):
+        self.body = body  # List of statements.
+        self.depth = depth  # Deepest block nesting, for passes that recurse per level.
+        self.types = types  # typeinfer.Types for the statements as parsed, or None if not inferred.
+        self.library = library  # True if other modules may import its variables, built as a project.
+
+
+class Import(Node):
+    """Import ::= "Import" ident
+
+    Binds every Func and variable the module of that name defines at its top level, as its
+    interface file describes them."""
+
+    __slots__ = ("name", "variables", "funcs")
+
+    def __init__(self, name, variables=None, funcs=()):
+        self.name = name  # Name of the module.
+        self.variables = dict(variables or {})  # Variable name -> frozenset of the types it may hold.
+        # (Func, frozenset of the types a call returns, why it is not pure or None) per Func the
+        # module defines. Each Func has its name and parameters but an empty body.
+        self.funcs = list(funcs)
+
+
+class Func(Node):
+    """Function definition ::= ["Memo"] "Func" ident ["(" [ident {"," ident}] ")"] "{" {statement} "}" """
+
+    __slots__ = ("name", "body", "params", "memo")
+
+    def __init__(self, name, body, params=(), memo=False):
+        self.name = name
+        self.body = body
+        self.params = list(params)  # Parameter names.
+        self.memo = memo  # True if calls are cached: marked Memo, or found pure by the optimizer.
+
+
+class While(Node):
+    """While loop ::= "While" comparison "{" {statement} "}" """
+
+    __slots__ = ("cond", "body")
+
+    def __init__(self, cond, body):
+        self.cond = cond
+        self.body = body
+
+
+class For(Node):
+    """Counting loop produced by the optimizer from a While loop:
+    if cond: for name in range(name, stop, step): body; then name += step"""
+
+    __slots__ = ("name", "stop", "step", "cond", "body")
+
+    def __init__(self, name, stop, step, cond, body):
+        self.name = name  # Counter variable; the loop starts from its current value.
+        self.stop = stop  # Exclusive range bound expression.
+        self.step = step  # Non-zero int.
+        self.cond = cond  # The original While condition, checked once before the loop.
+        self.body = body  # The loop body without the counter update.
+
+
+class If(Node):
+    """If-statement ::= "If" comparison "{" {statement} "}" {ElseIf} [Else]"""
+
+    __slots__ = ("cond", "body", "elifs", "orelse")
+
+    def __init__(self, cond, body, elifs, orelse):
+        self.cond = cond
+        self.body = body
+        self.elifs = elifs  # List of ElseIf clauses.
+        self.orelse = orelse  # Else clause, or None.
+
+
+class ElseIf(Node):
+    """ElseIf ::= "ElseIf" comparison "{" {statement} "}" """
+
+    __slots__ = ("cond", "body")
+
+    def __init__(self, cond, body):
+        self.cond = cond
+        self.body = body
+
+
+class Else(Node):
+    """Else ::= "Else" "{" {statement} "}" """
+
+    __slots__ = ("body",)
+
+    def __init__(self, body):
+        self.body = body
+
+
+class Var(Node):
+    """Variable definition ::= "Var" ident "=" expression"""
+
+    __slots__ = ("name", "value")
+
+    def __init__(self, name, value):
+        self.name = name
+        self.value = value
+
+
+class Array(Node):
+    """Array definition ::= "Array" ident "[" expression "]" ["=" expression]"""
+
+    __slots__ = ("name", "size", "fill")
+
+    def __init__(self, name, size, fill):
+        self.name = name
+        self.size = size  # Number of elements.
+        self.fill = fill  # Initial value of every element; its type (int or float) is the array's.
+
+
+class Store(Node):
+    """Element assignment ::= "Var" ident "[" expression "]" "=" expression"""
+
+    __slots__ = ("name", "index", "value", "checked")
+
+    def __init__(self, name, index, value, checked=True):
+        self.name = name  # The array variable.
+        self.index = index
+        self.value = value
+        self.checked = checked  # False once -O3 drops the negative-index check.
+
+
+class Print(Node):
+    """Print ::= ("Print" | "PrintLn") "(" expression ")" """
+
+    __slots__ = ("value", "newline")
+
+    def __init__(self, value, newline):
+        self.value = value
+        self.newline = newline  # True for PrintLn.
+
+
+class Call(Node):
+    """Function call ::= ident "(" [expression {"," expression}] ")"
+
+    A statement on its own, or an expression whose value is what the Func returns."""
+
+    __slots__ = ("name", "args")
+
+    def __init__(self, name, args=()):
+        self.name = name
+        self.args = list(args)  # Argument expressions, one per parameter.
+
+
+class Return(Node):
+    """Return statement ::= "Return" expression"""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+
+# Expressions.
+
+
+class Compare(Node):
+    """comparison ::= expression {("==" | "!=" | ">" | ">=" | "<" | "<=") expression}"""
+
+    __slots__ = ("left", "ops", "comparators")
+
+    def __init__(self, left, ops, comparators):
+        self.left = left
+        self.ops = ops  # Operator texts, e.g. [">", "=="].
+        self.comparators = comparators  # Right-hand expressions, one per operator.
+
+
+class BinOp(Node):
+    """expression/term ::= operand ("+" | "-" | "*" | "/") operand"""
+
+    __slots__ = ("op", "left", "right")
+
+    def __init__(self, op, left, right):
+        self.op = op  # Operator text.
+        self.left = left
+        self.right = right
+
+
+class UnaryOp(Node):
+    """unary ::= ("+" | "-") primary"""
+
+    __slots__ = ("op", "operand")
+
+    def __init__(self, op, operand):
+        self.op = op
+        self.operand = operand
+
+
+class Index(Node):
+    """Element read ::= ident "[" expression "]" """
+
+    __slots__ = ("array", "index", "checked")
+
+    def __init__(self, array, index, checked=True):
+        self.array = array  # Name of the array variable.
+        self.index = index
+        self.checked = checked  # False once -O3 drops the negative-index check.
+
+
+class Length(Node):
+    """Array length ::= "Len" ident"""
+
+    __slots__ = ("array",)
+
+    def __init__(self, array):
+        self.array = array  # Name of the array variable.
+
+
+class Number(Node):
+    """Numeric literal, kept as its source text."""
+
+    __slots__ = ("text",)
+
+    def __init__(self, text):
+        self.text = text
+
+
+class Constant(Node):
+    """Value computed at compile time by the optimizer (int, float or bool)."""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+
+class Name(Node):
+    """Variable reference."""
+
+    __slots__ = ("name",)
+
+    def __init__(self, name):
+        self.name = name
+
+
+class String(Node):
+    """String literal, kept as its source text (without the quotes)."""
+
+    __slots__ = ("text",)
+
+    def __init__(self, text):
+        self.text = text
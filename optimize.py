@@ -0,0 +1,906 @@
+import itertools
+import operator
+
+from nodes import *
+
+# Python semantics of Cobalt's arithmetic and comparison operators.
+BINARY_OPS = {
+    "+": operator.add,
+    "-": operator.sub,
+    "*": operator.mul,
+    "/": operator.truediv,
+}
+UNARY_OPS = {"+": operator.pos, "-": operator.neg}
+COMPARE_OPS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+# Largest folded integer, in bits; bigger results are left for run time.
+MAX_INT_BITS = 1024
+
+# Marker returned by constantValue() for expressions not known at compile time.
+UNKNOWN = object()
+
+
+# Optimizer rewrites a syntax tree according to an optimisation level and records what it changed.
+#   -O0: no changes.
+#   -O1: constant folding and dead-branch elimination.
+#   -O2: -O1 plus dead-store elimination, lowering of counting While loops to range() loops and
+#        memoization of pure Funcs that loop or call Funcs.
+#   -O3: -O2 plus removal of array bounds checks: a negative index then counts from the end of the
+#        array, as in Python, instead of raising IndexError.
+class Optimizer:
+    def __init__(self, level):
+        self.level = level
+        self.changes = []  # Human-readable description of every change made.
+        self.counts = {}  # Number of changes of each kind.
+
+    # Optimise a whole module in place and return it.
+    def optimize(self, module):
+        """Optimise a whole module in place and return it."""
+        with nestingLimit(module.depth):
+            if self.level >= 2 and module.types is None:
+                from typeinfer import inferTypes
+
+                module.types = inferTypes(module)
+            before = funcLocals(module.body) if self.level >= 1 else {}
+            if self.level >= 1:
+                module.body = self.block(module.body)
+            if self.level >= 2:
+                self.memoize(module)
+                DeadStores(self, module.types).module(module)
+                CountingLoops(self, module.types).module(module)
+            if self.level >= 3:
+                self.removeBoundsChecks(module)
+            keepLocals(module.body, before)
+        return module
+
+    # Apply the per-statement optimisations to one top-level statement; returns a list of statements.
+    def optimizeStatement(self, node):
+        """Apply the per-statement optimisations to one top-level statement; returns a list of statements."""
+        if self.level >= 1:
+            before = funcLocals([node])
+            body = self.block([node])
+            keepLocals(body, before)
+            return body
+        return [node]
+
+    # Record one change.
+    def record(self, kind, message):
+        """Record one change."""
+        self.counts[kind] = self.counts.get(kind, 0) + 1
+        self.changes.append(message)
+
+    # Cache the calls of the pure top-level Funcs that loop or call Funcs. One that only computes
+    # an expression is cheaper to run again than to look up.
+    def memoize(self, module):
+        """Cache the calls of the pure top-level Funcs that loop or call Funcs."""
+        from purity import impurities
+
+        reasons = None
+        for node in module.body:
+            if type(node) is not Func or node.memo or not worthCaching(node):
+                continue
+            if reasons is None:
+                reasons = impurities(module, module.types)
+            if reasons[node] is None:
+                node.memo = True
+                self.record("Funcs memoized", f"memoized pure Func '{node.name}'")
+
+    # Let every array access in a module use Python's own indexing, which accepts negative indices.
+    def removeBoundsChecks(self, module):
+        """Let every array access in a module use Python's own indexing, which accepts negative indices."""
+        for statement in walk(module.body):
+            accesses = []
+            if type(statement) is Store:
+                accesses.append(statement)
+            stack = expressions(statement)
+            while stack:
+                node = stack.pop()
+                if type(node) is Index:
+                    accesses.append(node)
+                stack.extend(operands(node))
+            for node in accesses:
+                if node.checked and not knownIndex(node.index):
+                    node.checked = False
+                    name = node.name if type(node) is Store else node.array.name
+                    self.record("bounds checks removed", f"removed bounds check on {name}[{describe(node.index)}]")
+
+    # Return a one-line summary of the changes made.
+    def summary(self):
+        """Return a one-line summary of the changes made."""
+        if not self.counts:
+            return "no changes"
+        return ", ".join(f"{count} {kind}" for kind, count in self.counts.items())
+
+    # Constant folding and dead-branch elimination.
+
+    # Optimise a list of statements, returning the new list.
+    def block(self, body):
+        """Optimise a list of statements, returning the new list."""
+        result = []
+        for node in body:
+            kind = type(node)
+            if kind is If:
+                result.extend(self.optimizeIf(node))
+            elif kind is While:
+                node.cond = self.fold(node.cond)
+                value = constantValue(node.cond)
+                if value is not UNKNOWN and not value:
+                    self.record("dead branches removed", "removed While loop (condition always false)")
+                    continue
+                node.body = self.block(node.body)
+                result.append(node)
+            elif kind is Func:
+                node.body = self.block(node.body)
+                result.append(node)
+            elif kind is Var or kind is Print or kind is Return:
+                node.value = self.fold(node.value)
+                result.append(node)
+            elif kind is Array:
+                node.size, node.fill = self.fold(node.size), self.fold(node.fill)
+                result.append(node)
+            elif kind is Store:
+                node.index, node.value = self.fold(node.index), self.fold(node.value)
+                result.append(node)
+            elif kind is Call:
+                node.args = [self.fold(arg) for arg in node.args]
+                result.append(node)
+            else:
+                result.append(node)
+        return result
+
+    # Fold the conditions of an If chain and drop the clauses that can never run.
+    def optimizeIf(self, node):
+        """Fold the conditions of an If chain and drop the clauses that can never run; returns a list of statements."""
+        clauses = []  # (condition, body) pairs that may run.
+        orelse = node.orelse.body if node.orelse is not None else None
+        for keyword, clause in [("If", node)] + [("ElseIf", clause) for clause in node.elifs]:
+            cond = self.fold(clause.cond)
+            value = constantValue(cond)
+            if value is UNKNOWN:
+                clauses.append((cond, clause.body))
+            elif value:
+                # Always taken: it becomes the final Else, and the clauses after it are dead.
+                if not clauses:
+                    self.record("dead branches removed", f"replaced {keyword} with its body (condition always true)")
+                else:
+                    self.record("dead branches removed", f"turned {keyword} into Else (condition always true)")
+                orelse = clause.body
+                break
+            else:
+                self.record("dead branches removed", f"removed {keyword} branch (condition always false)")
+
+        if orelse is not None:
+            orelse = self.block(orelse)
+        if not clauses:
+            return orelse or []
+
+        node.cond, node.body = clauses[0][0], self.block(clauses[0][1])
+        node.elifs = [ElseIf(cond, self.block(body)) for cond, body in clauses[1:]]
+        node.orelse = Else(orelse) if orelse is not None else None
+        return [node]
+
+    # Return an expression with its constant subexpressions folded.
+    def fold(self, node):
+        """Return an expression with its constant subexpressions folded."""
+        # Post-order with explicit stacks, so the depth of an expression costs no recursion.
+        done = []  # (folded node, value or UNKNOWN) of each finished subexpression.
+        stack = [(node, False)]
+        while stack:
+            node, ready = stack.pop()
+            children = operands(node)
+            if not children:
+                done.append((node, constantValue(node)))
+                continue
+            if not ready:
+                stack.append((node, True))
+                stack.extend((child, False) for child in reversed(children))
+                continue
+
+            results = done[-len(children) :]
+            del done[-len(children) :]
+            setOperands(node, [child for child, _ in results])
+            value = evaluate(node, [value for _, value in results])
+            if value is UNKNOWN:
+                done.append((node, UNKNOWN))
+                continue
+            if not (type(node) is UnaryOp and type(node.operand) is Number):
+                # A sign on a literal is not worth reporting.
+                self.record("constants folded", f"folded {describe(node)} to {value!r}")
+            done.append((Constant(value), value))
+        return done[0][0]
+
+
+# Expression helpers. Expressions can be arbitrarily long chains of operators, so these walk them
+# with explicit stacks rather than recursion.
+
+
+# Return the direct subexpressions of an expression node.
+def operands(node):
+    """Return the direct subexpressions of an expression node."""
+    kind = type(node)
+    if kind is BinOp:
+        return (node.left, node.right)
+    if kind is UnaryOp:
+        return (node.operand,)
+    if kind is Compare:
+        return [node.left] + node.comparators
+    if kind is Index:
+        return (node.array, node.index)
+    if kind is Length:
+        return (node.array,)
+    if kind is Call:
+        return node.args
+    return ()
+
+
+# Replace the direct subexpressions of an expression node, in the order operands() returns them.
+def setOperands(node, children):
+    """Replace the direct subexpressions of an expression node, in the order operands() returns them."""
+    kind = type(node)
+    if kind is BinOp:
+        node.left, node.right = children
+    elif kind is UnaryOp:
+        (node.operand,) = children
+    elif kind is Index:
+        node.array, node.index = children
+    elif kind is Length:
+        (node.array,) = children
+    elif kind is Call:
+        node.args = list(children)
+    else:
+        node.left, node.comparators = children[0], children[1:]
+
+
+# Return the value of an expression if it is known at compile time, otherwise UNKNOWN.
+def constantValue(node):
+    """Return the value of an expression if it is known at compile time, otherwise UNKNOWN."""
+    values = []  # Value of each finished subexpression.
+    stack = [(node, False)]
+    while stack:
+        node, ready = stack.pop()
+        children = operands(node)
+        if not children:
+            kind = type(node)
+            if kind is Constant:
+                values.append(node.value)
+            elif kind is Number:
+                values.append(float(node.text) if "." in node.text else int(node.text))
+            else:
+                values.append(UNKNOWN)
+        elif not ready:
+            stack.append((node, True))
+            stack.extend((child, False) for child in reversed(children))
+        else:
+            args = values[-len(children) :]
+            del values[-len(children) :]
+            values.append(evaluate(node, args))
+    return values[0]
+
+
+# Return the value of an operator node given the values of its operands, or UNKNOWN.
+def evaluate(node, values):
+    """Return the value of an operator node given the values of its operands, or UNKNOWN."""
+    kind = type(node)
+    if kind is Index or kind is Length or kind is Call:
+        # Arrays and what Funcs return are only known at run time.
+        return UNKNOWN
+    if kind is UnaryOp:
+        if values[0] is UNKNOWN:
+            return UNKNOWN
+        return UNARY_OPS[node.op](values[0])
+    if kind is BinOp:
+        left, right = values
+        if left is UNKNOWN or right is UNKNOWN:
+            return UNKNOWN
+        try:
+            value = BINARY_OPS[node.op](left, right)
+        except (ArithmeticError, ValueError):
+            # E.g. division by zero: leave it to fail at run time.
+            return UNKNOWN
+        if isinstance(value, int) and value.bit_length() > MAX_INT_BITS:
+            return UNKNOWN
+        if isinstance(value, float) and (value != value or value in (float("inf"), float("-inf"))):
+            return UNKNOWN
+        return value
+    # Compare.
+    left = values[0]
+    if left is UNKNOWN:
+        return UNKNOWN
+    for op, right in zip(node.ops, values[1:]):
+        if right is UNKNOWN:
+            return UNKNOWN
+        if not COMPARE_OPS[op](left, right):
+            return False
+        left = right
+    return True
+
+
+# Return Cobalt-like source text for an expression, for reports.
+def describe(node):
+    """Return Cobalt-like source text for an expression, for reports."""
+    parts = []
+    stack = [node]  # Nodes still to describe and text to copy, in reverse order.
+    while stack:
+        node = stack.pop()
+        kind = type(node)
+        if kind is str:
+            parts.append(node)
+        elif kind is BinOp:
+            stack += [node.right, f" {node.op} ", node.left]
+        elif kind is UnaryOp:
+            stack += [node.operand, node.op]
+        elif kind is Index:
+            stack += ["]", node.index, "[", node.array]
+        elif kind is Length:
+            stack += [node.array, "Len "]
+        elif kind is Call:
+            pending = [f"{node.name}("]
+            for i, arg in enumerate(node.args):
+                pending += [", ", arg] if i else [arg]
+            stack += [")"] + pending[::-1]
+        elif kind is Compare:
+            pending = [node.left]
+            for op, comparator in zip(node.ops, node.comparators):
+                pending += [f" {op} ", comparator]
+            stack.extend(reversed(pending))
+        elif kind is Constant:
+            parts.append(repr(node.value))
+        elif kind is Number:
+            parts.append(node.text)
+        elif kind is Name:
+            parts.append(node.name)
+        else:
+            parts.append(f'"{node.text}"')
+    return "".join(parts)
+
+
+# Return the set of variable names an expression reads.
+def reads(node):
+    """Return the set of variable names an expression reads."""
+    names = set()
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if type(node) is Name:
+            names.add(node.name)
+        else:
+            stack.extend(operands(node))
+    return names
+
+
+# Return the set of Func names an expression calls.
+def calls(node):
+    """Return the set of Func names an expression calls."""
+    names = set()
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if type(node) is Call:
+            names.add(node.name)
+        stack.extend(operands(node))
+    return names
+
+
+# Return true if evaluating an expression in `scope` might raise (so it must not be removed).
+def mayRaise(node, types, scope):
+    """Return true if evaluating an expression in `scope` might raise (so it must not be removed)."""
+    if types.mayFail(node, scope):
+        return True
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        kind = type(node)
+        if kind is BinOp:
+            if node.op == "/" and constantValue(node.right) in (UNKNOWN, 0):
+                return True
+            stack += [node.left, node.right]
+        elif kind is UnaryOp:
+            stack.append(node.operand)
+        elif kind is Index:
+            return True  # The index may be out of range.
+        elif kind is Call:
+            return True  # The Func may print, or fail.
+    return False
+
+
+# DeadStores removes Var assignments whose value is never read, using backward liveness analysis.
+class DeadStores:
+    def __init__(self, optimizer, types):
+        self.optimizer = optimizer
+        self.types = types  # Inferred types, to tell which operators may raise TypeError.
+        self.funcReads = {}  # Function name -> every name a call to it may read.
+        self.scope = None  # Func whose body is being analysed, or None at module level.
+        self.unbound = set()  # Var statements whose value may read a local before it is bound.
+
+    def module(self, module):
+        self.funcReads = functionReads(module.body)
+        imported = set()
+        for node in module.body:
+            if type(node) is Import:
+                imported |= set(node.variables) | {func.name for func, _, _ in node.funcs}
+        self.unbound = unboundReads(module.body, localNames(module.body), imported)
+        # Nothing is read after the program ends, unless other modules may import its variables.
+        live = assigned(module.body) if module.library else set()
+        module.body = self.block(module.body, live, True)[0]
+
+    # Compute liveness backwards through a block; returns (new body, names live on entry).
+    # When `remove` is false, only the live set is computed and the body is left alone.
+    def block(self, body, live, remove):
+        """Compute liveness backwards through a block; returns (new body, names live on entry)."""
+        live = set(live)
+        result = []
+        for node in reversed(body):
+            kind = type(node)
+            if kind is Var:
+                if (
+                    node.name not in live
+                    and node not in self.unbound
+                    and not mayRaise(node.value, self.types, self.scope)
+                ):
+                    if remove:
+                        self.optimizer.record(
+                            "dead stores removed", f"removed dead store to '{node.name}'"
+                        )
+                        continue
+                else:
+                    live.discard(node.name)
+                    live |= self.uses(node.value)
+            elif kind is Array:
+                # Never removed: a huge size, or an int fill that needs more than 64 bits, fails at run time.
+                live.discard(node.name)
+                live |= self.uses(node.size) | self.uses(node.fill)
+            elif kind is Store:
+                live |= {node.name} | self.uses(node.index) | self.uses(node.value)
+            elif kind is Print:
+                live |= self.uses(node.value)
+            elif kind is Return:
+                # Nothing after a Return runs, and a function's variables die with it.
+                live = self.uses(node.value)
+            elif kind is Call:
+                live |= self.uses(node)
+            elif kind is If:
+                live = self.optimizeIf(node, live, remove)
+            elif kind is While:
+                live = self.optimizeWhile(node, live, remove)
+            elif kind is Func:
+                if remove:
+                    # Function variables are local, so none of them outlive a call.
+                    outer, self.scope = self.scope, node
+                    node.body = self.block(node.body, set(), True)[0]
+                    self.scope = outer
+            result.append(node)
+        result.reverse()
+        return result, live
+
+    # Return the names evaluating an expression may read, including those the Funcs it calls read.
+    def uses(self, node):
+        """Return the names evaluating an expression may read, including through the Funcs it calls."""
+        names = reads(node)
+        for name in calls(node):
+            # Imported Funcs read only the variables of their own module.
+            names |= self.funcReads.get(name, set())
+        return names
+
+    def optimizeIf(self, node, live, remove):
+        clauses = [node] + node.elifs
+        entry = set() if node.orelse is not None else set(live)
+        if node.orelse is not None:
+            node.orelse.body, branchLive = self.block(node.orelse.body, live, remove)
+            entry |= branchLive
+        for clause in clauses:
+            clause.body, branchLive = self.block(clause.body, live, remove)
+            entry |= branchLive | self.uses(clause.cond)
+        return entry
+
+    def optimizeWhile(self, node, live, remove):
+        # The loop head is reached from before the loop and from the end of the body; iterate to a fixed point.
+        head = set(live) | self.uses(node.cond)
+        while True:
+            bodyLive = self.block(node.body, head, False)[1]
+            newHead = head | bodyLive
+            if newHead == head:
+                break
+            head = newHead
+        if remove:
+            node.body = self.block(node.body, head, True)[0]
+        return head
+
+
+# Return the names read by each function's body, including through the functions it calls.
+def functionReads(body):
+    """Return the names read by each function's body, including through the functions it calls."""
+    direct = {}
+    called = {}
+    # One frame per open block, innermost last: [statements, Func name or None, reads, calls]. Blocks
+    # inside a Func share its sets; a nested Func's are merged into its parent's when it closes, so
+    # every statement is visited once however deeply the Funcs nest.
+    stack = [[iter(body), None, None, None]]
+    while stack:
+        frame = stack[-1]
+        names, callees = frame[2], frame[3]
+        for node in frame[0]:
+            kind = type(node)
+            if kind is Func:
+                stack.append([iter(node.body), node.name, set(), set()])
+                break
+            if names is not None:
+                for value in expressions(node):
+                    names |= reads(value)
+                    callees |= calls(value)
+                if kind is Store:
+                    names.add(node.name)
+            blocks = childBlocks(node)
+            if blocks:
+                stack.append([itertools.chain.from_iterable(blocks), None, names, callees])
+                break
+        else:
+            stack.pop()
+            if frame[1] is not None:
+                direct.setdefault(frame[1], set()).update(names)
+                called.setdefault(frame[1], set()).update(callees)
+                parent = stack[-1]
+                if parent[2] is not None:
+                    parent[2] |= names
+                    parent[3] |= callees
+
+    # Propagate reads through calls until nothing changes.
+    changed = True
+    while changed:
+        changed = False
+        for name, callees in called.items():
+            # Imported Funcs are not in `direct`: they read only the variables of their own module.
+            for callee in callees & direct.keys():
+                if not direct[callee] <= direct[name]:
+                    direct[name] |= direct[callee]
+                    changed = True
+    return direct
+
+
+# Return true if a Func's body loops or calls a Func, so that a call may be worth caching.
+def worthCaching(func):
+    """Return true if a Func's body loops or calls a Func."""
+    for node in walk(func.body):
+        kind = type(node)
+        if kind is While or kind is For or any(calls(value) for value in expressions(node)):
+            return True
+    return False
+
+
+# Return the expressions a statement evaluates, not counting those in its blocks.
+def expressions(node):
+    """Return the expressions a statement evaluates, not counting those in its blocks."""
+    kind = type(node)
+    if kind is Var or kind is Print or kind is Return:
+        return [node.value]
+    if kind is Array:
+        return [node.size, node.fill]
+    if kind is Store:
+        return [node.index, node.value]
+    if kind is Call:
+        return [node]  # A call statement is a call expression whose value is dropped.
+    if kind is If:
+        return [node.cond] + [clause.cond for clause in node.elifs]
+    if kind is While:
+        return [node.cond]
+    if kind is For:
+        return [node.cond, node.stop]
+    return []
+
+
+# Return true if an array index is a non-negative int constant, which needs no bounds check.
+def knownIndex(node):
+    """Return true if an array index is a non-negative int constant, which needs no bounds check."""
+    value = constantValue(node)
+    return type(value) is int and value >= 0
+
+
+# Return the blocks nested directly in a statement, in source order.
+def childBlocks(node):
+    """Return the blocks nested directly in a statement, in source order."""
+    kind = type(node)
+    if kind is If:
+        blocks = [node.body] + [clause.body for clause in node.elifs]
+        if node.orelse is not None:
+            blocks.append(node.orelse.body)
+        return blocks
+    if kind is While or kind is For or kind is Func:
+        return [node.body]
+    return []
+
+
+# Yield every statement in a block, including those nested inside other statements.
+def walk(body):
+    """Yield every statement in a block, including those nested inside other statements."""
+    stack = [iter(body)]  # One iterator per open block, innermost last.
+    while stack:
+        for node in stack[-1]:
+            yield node
+            blocks = childBlocks(node)
+            if blocks:
+                stack.append(itertools.chain.from_iterable(blocks))
+                break
+        else:
+            stack.pop()
+
+
+# Comparison operator -> the operator that gives the same result with its operands swapped.
+SWAPPED = {"<": ">", "<=": ">=", ">": "<", ">=": "<="}
+
+
+# CountingLoops replaces While loops of the form
+#     While n > bound { ...; Var n = n - step; };
+# with For nodes, which are emitted as range() loops. The counter must hold an int on entry and
+# only be written by the final statement, with a constant step; the bound must be an int that the
+# body does not change. Int-ness is tracked by a forward pass over each block, starting from the
+# variables type inference found only ever hold ints.
+class CountingLoops:
+    def __init__(self, optimizer, types):
+        self.optimizer = optimizer
+        self.types = types
+        self.scopeInts = frozenset()  # Names that hold ints wherever they are bound, in the current scope.
+
+    # Rewrite the loops of a whole module.
+    def module(self, module):
+        """Rewrite the loops of a whole module."""
+        self.scopeInts = self.types.ints(None)
+        self.block(module.body, self.scopeInts)
+
+    # Rewrite the loops in a block; `ints` holds the names known to be ints on entry. Returns the ints on exit.
+    def block(self, body, ints):
+        """Rewrite the loops in a block; `ints` holds the names known to be ints on entry. Returns the ints on exit."""
+        ints = set(ints)
+        for i, node in enumerate(body):
+            kind = type(node)
+            if kind is Var:
+                if isInt(node.value, ints) or node.name in self.scopeInts:
+                    ints.add(node.name)
+                else:
+                    ints.discard(node.name)
+            elif kind is Array:
+                ints.discard(node.name)
+            elif kind is If:
+                branches = [node.body] + [clause.body for clause in node.elifs]
+                if node.orelse is not None:
+                    branches.append(node.orelse.body)
+                exits = [self.block(branch, ints) for branch in branches]
+                if node.orelse is None:
+                    exits.append(ints)
+                ints = set.intersection(*exits)
+            elif kind is While:
+                # Names that stay ints all the way around the loop.
+                head = set(ints)
+                while True:
+                    after = head & self.analyse(node.body, head)
+                    if after == head:
+                        break
+                    head = after
+                self.block(node.body, head)
+                lowered = self.lower(node, head)
+                if lowered is not None:
+                    body[i] = lowered
+                ints = head
+            elif kind is Func:
+                # Function variables are locals, known to be ints only if every assignment is.
+                outer = self.scopeInts
+                self.scopeInts = self.types.ints(node, outer)
+                self.block(node.body, self.scopeInts)
+                self.scopeInts = outer
+        return ints
+
+    # Return the ints on exit from a block without rewriting anything.
+    def analyse(self, body, ints):
+        """Return the ints on exit from a block without rewriting anything."""
+        ints = set(ints)
+        for node in body:
+            kind = type(node)
+            if kind is Var:
+                if isInt(node.value, ints) or node.name in self.scopeInts:
+                    ints.add(node.name)
+                else:
+                    ints.discard(node.name)
+            elif kind is Array:
+                ints.discard(node.name)
+            elif kind is If or kind is While or kind is For:
+                ints -= assigned([node]) - self.scopeInts
+        return ints
+
+    # Return a For node equivalent to a While loop, or None if the loop is not a counting loop.
+    # `ints` holds the names that are ints every time the loop condition is checked.
+    def lower(self, node, ints):
+        """Return a For node equivalent to a While loop, or None if the loop is not a counting loop."""
+        cond = node.cond
+        if type(cond) is not Compare or len(cond.ops) != 1 or cond.ops[0] not in SWAPPED:
+            return None
+        op, left, right = cond.ops[0], cond.left, cond.comparators[0]
+        if type(left) is not Name:
+            op, left, right = SWAPPED[op], right, left
+        if type(left) is not Name or left.name not in ints:
+            return None
+        name = left.name
+
+        # The last statement must be the only write to the counter: Var n = n +/- constant.
+        if not node.body:
+            return None
+        update = node.body[-1]
+        written = assigned(node.body[:-1])
+        if type(update) is not Var or update.name != name or name in written:
+            return None
+        step = counterStep(update.value, name)
+        if step is None or (step < 0) != (op in (">", ">=")):
+            return None
+
+        # The bound must be an int the loop does not change.
+        if not isInt(right, ints) or reads(right) & (written | {name}):
+            return None
+        if op == "<=":
+            stop = offset(right, 1)
+        elif op == ">=":
+            stop = offset(right, -1)
+        else:
+            stop = right
+
+        self.optimizer.record(
+            "loops lowered", f"lowered While {describe(cond)} to a range() loop over '{name}'"
+        )
+        loop = For(name, stop, step, cond, node.body[:-1])
+        loop.pos = getattr(node, "pos", None)
+        return loop
+
+
+# Return true if an expression always produces an int, given the names known to hold ints.
+def isInt(node, ints):
+    """Return true if an expression always produces an int, given the names known to hold ints."""
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        kind = type(node)
+        if kind is Number:
+            if "." in node.text:
+                return False
+        elif kind is Constant:
+            if type(node.value) is not int:
+                return False
+        elif kind is Name:
+            if node.name not in ints:
+                return False
+        elif kind is Length:
+            pass
+        elif kind is UnaryOp:
+            stack.append(node.operand)
+        elif kind is BinOp:
+            if node.op == "/":
+                return False
+            stack += [node.left, node.right]
+        else:
+            return False
+    return True
+
+
+# Return the names assigned by a block, not counting function bodies.
+def assigned(body):
+    """Return the names assigned by a block, not counting function bodies."""
+    names = set()
+    stack = list(body)
+    while stack:
+        node = stack.pop()
+        kind = type(node)
+        if kind is Var or kind is Array:
+            names.add(node.name)
+        elif kind is If:
+            stack.extend(node.body)
+            for clause in node.elifs:
+                stack.extend(clause.body)
+            if node.orelse is not None:
+                stack.extend(node.orelse.body)
+        elif kind is While or kind is For:
+            stack.extend(node.body)
+            if kind is For:
+                names.add(node.name)
+    return names
+
+
+# Return the names a block binds as Python locals of the function it is the body of: its
+# variables, loop counters and the Funcs it defines, not counting those of nested Funcs.
+def localNames(body):
+    """Return the names a block binds as Python locals of the function it is the body of."""
+    names = assigned(body)
+    stack = list(body)
+    while stack:
+        node = stack.pop()
+        if type(node) is Func:
+            names.add(node.name)
+        else:
+            for block in childBlocks(node):
+                stack.extend(block)
+    return names
+
+
+# Return the Var statements of a block whose value may read one of the names in `local` before it
+# is bound, given the names `bound` on entry. Such a read raises UnboundLocalError (NameError at
+# module level), so the store is not dead even if its value is never read. The Funcs defined in
+# the block are checked too, each against its own locals.
+def unboundReads(body, local, bound):
+    """Return the Var statements of a block whose value may read a local before it is bound."""
+    found = set()
+    bindings(body, local, set(bound), found)
+    return found
+
+
+# Follow the names bound for certain through a block, adding to `found` the Vars that may read an
+# unbound name of `local`; returns the names bound for certain at the end of the block.
+def bindings(body, local, bound, found):
+    """Follow the names bound for certain through a block; returns those bound at its end."""
+    for node in body:
+        kind = type(node)
+        if kind is Var:
+            if reads(node.value) & local - bound:
+                found.add(node)
+            bound.add(node.name)
+        elif kind is Array:
+            bound.add(node.name)
+        elif kind is Func:
+            bound.add(node.name)
+            params = set(node.params)
+            bindings(node.body, localNames(node.body) | params, params, found)
+        elif kind is If:
+            ends = [bindings(block, local, set(bound), found) for block in childBlocks(node)]
+            if node.orelse is None:
+                ends.append(bound)
+            bound = set.intersection(*ends)
+        elif kind is While or kind is For:
+            # The body may not run at all.
+            inner = set(bound) | ({node.name} if kind is For else set())
+            bindings(node.body, local, inner, found)
+    return bound
+
+
+# Return {Func node: the names it binds as locals} for every Func in a block.
+def funcLocals(body):
+    """Return {Func node: the names it binds as locals} for every Func in a block."""
+    return {node: localNames(node.body) for node in walk(body) if type(node) is Func}
+
+
+# Put back a never-run binding for each local that optimisation removed the last binding of from
+# a Func, given funcLocals() from before. Without one, Python would look the name up as a global,
+# and a read that failed with UnboundLocalError would read the global instead.
+def keepLocals(body, before):
+    """Put back a never-run binding for each local whose last binding optimisation removed from a Func."""
+    for node in walk(body):
+        if type(node) is Func and node in before:
+            lost = before[node] - localNames(node.body)
+            if lost:
+                node.body.append(If(Constant(0), [Var(name, Constant(0)) for name in sorted(lost)], [], None))
+
+
+# Return the constant step of `name + c`, `c + name` or `name - c`, or None.
+def counterStep(node, name):
+    """Return the constant step of `name + c`, `c + name` or `name - c`, or None."""
+    if type(node) is not BinOp or node.op not in "+-":
+        return None
+    left, right = node.left, node.right
+    if node.op == "+" and type(right) is Name:
+        left, right = right, left
+    if type(left) is not Name or left.name != name:
+        return None
+    value = constantValue(right)
+    if type(value) is not int or value == 0:
+        return None
+    return value if node.op == "+" else -value
+
+
+# Return `node + delta`, folded when the bound is a constant.
+def offset(node, delta):
+    """Return `node + delta`, folded when the bound is a constant."""
+    value = constantValue(node)
+    if value is not UNKNOWN:
+        return Constant(value + delta)
+    if delta > 0:
+        return BinOp("+", node, Constant(delta))
+    return BinOp("-", node, Constant(-delta))
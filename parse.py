@@ -1,17 +1,39 @@
-import sys
-
 from lex import *
+from nodes import *
+from purity import checkMemo
+from typeinfer import inferTypes
+
+
+# Binary operator token -> precedence; higher binds tighter.
+BINARY_PRECEDENCE = {
+    TokenType.PLUS: 1,
+    TokenType.MINUS: 1,
+    TokenType.ASTERISK: 2,
+    TokenType.SLASH: 2,
+}
+
+# Statements with a block; statement() keeps them on its stack while the block is open.
+BLOCK_STATEMENTS = (If, While, Func)
+
+
+# Raised by the Parser for code that does not match the grammar.
+class ParseError(CobaltError):
+    """Raised by the Parser for code that does not match the grammar."""
 
 
-# Parser object keeps track of current token and checks if the code matches the grammar.
+# Parser object keeps track of current token, checks if the code matches the grammar and builds the syntax tree.
 class Parser:
-    def __init__(self, lexer, emitter):
+    def __init__(self, lexer, emitter=None, modules=None):
         self.lexer = lexer
-        self.emitter = emitter
+        self.emitter = emitter  # If given, program() also generates code into it.
+        # Module name -> its Import node, or None if there is no such module. Given only when
+        # the module is built as part of a project, where other modules may also import it.
+        self.modules = modules
 
         self.symbols = set()  # All variables we have declared so far.
         self.functions = set()  # All functions declared so far.
         self.in_func = False  # True if we are in a function, false otherwise.
+        self.depth = 0  # Deepest block nesting seen so far.
 
         self.curToken = None
         self.peekToken = None
@@ -43,8 +65,8 @@ class Parser:
         # No need to worry about passing the EOF, lexer handles that.
 
     def abort(self, message):
-        """Abort the program."""
-        sys.exit("Error: " + message)
+        """Abort parsing with an error."""
+        raise ParseError("Error: " + message)
 
     # Production rules.
 
@@ -56,212 +78,230 @@ class Parser:
         while self.checkToken(TokenType.NEWLINE):
             self.nextToken()
 
-        self.module()
+        module = self.module()
+        # Operators given operands they can never accept are compile errors, as is Memo on a Func
+        # whose calls cannot be cached.
+        module.types = inferTypes(module)
+        checkMemo(module, module.types)
+        if self.emitter is not None:
+            from codegen import CodeGenerator
+
+            CodeGenerator(self.emitter).generate(module)
+        return module
 
     # Module ::= {statement}
     def module(self):
         """Module node for the AST."""
+        body = list(self.moduleStatements())
+        return Module(body, self.depth, library=self.modules is not None)
+
+    # Parse a module, yielding each top-level statement as soon as it is complete.
+    def moduleStatements(self):
+        """Parse a module, yielding each top-level statement as soon as it is complete."""
+        while self.checkToken(TokenType.NEWLINE):
+            self.nextToken()
+
         self.match(TokenType.Module)
         self.match(TokenType.LBRACE)
 
         while self.checkToken(TokenType.NEWLINE):
             self.nextToken()
 
+        # Imports come first, so that every name they bind is known before any statement uses it.
+        while self.checkToken(TokenType.Import):
+            yield self.importStatement()
+
         # Parse all the statements in the program.
         while not self.checkToken(TokenType.RBRACE):
-            self.statement()
+            yield self.statement()
 
         while self.checkToken(TokenType.NEWLINE):
             self.nextToken()
         self.match(TokenType.RBRACE)
         self.match(TokenType.SEMI)
 
-    # One of the following statements...
+    # Import ::= "Import" ident
+    def importStatement(self):
+        """Import node for the AST."""
+        start = self.curToken.start
+        self.nextToken()
+        name = self.curToken.text
+        self.match(TokenType.IDENT)
+        if self.modules is None:
+            self.abort("Import needs the other modules of a project; build it with 'cobalt.py build'")
+        node = self.modules(name)
+        if node is None:
+            self.abort(f"No module named '{name}'")
+        funcs = {func.name for func, _, _ in node.funcs}
+        for symbol in sorted((set(node.variables) | funcs) & (self.symbols | self.functions)):
+            self.abort(f"Cannot import '{symbol}' from '{name}'- name already taken")
+        self.symbols.update(node.variables)
+        self.functions.update(funcs)
+        self.semi_nl()
+        node.pos = start
+        return node
+
+    # Match the "{" and newlines that open a block.
+    def openBlock(self):
+        """Match the "{" and newlines that open a block."""
+        self.match(TokenType.LBRACE)
+        self.nl()
+
+    # Parse one statement, including any blocks nested in it, and return its node.
+    #
+    # Blocks are not parsed recursively: the compound statements whose blocks are open are kept on
+    # an explicit stack, so nesting depth is limited only by memory.
     def statement(self):
         """Statement node for the AST."""
-        # Check the first token to see what kind of statement this is.
-
-        # Print (no newline) ::= "Print" "(" (expression | string) ")"
-        if self.checkToken(TokenType.Print):
-            self.nextToken()
-            self.match(TokenType.LPAREN)
-            if self.checkToken(TokenType.STRING):
-                self.emitter.emitLine(f"print(\"{self.curToken.text}\", end='')")
+        stack = []  # [node, list receiving its statements, start offset, outer in_func], innermost last.
+        while True:
+            if stack and self.checkToken(TokenType.RBRACE):
+                # The innermost open block ends.
+                frame = stack[-1]
                 self.nextToken()
+                node = frame[0]
+                if type(node) is If and node.orelse is None:
+                    if self.checkToken(TokenType.ElseIf):
+                        self.nextToken()
+                        clause = ElseIf(self.comparison(), [])
+                        node.elifs.append(clause)
+                        self.openBlock()
+                        frame[1] = clause.body
+                        continue
+                    if self.checkToken(TokenType.Else):
+                        self.nextToken()
+                        node.orelse = Else([])
+                        self.openBlock()
+                        frame[1] = node.orelse.body
+                        continue
+                stack.pop()
+                self.in_func = frame[3]
+                start = frame[2]
             else:
-                self.emitter.emit("print(")
-                self.expression()
-                self.emitter.emitLine(", end='')")
-
-            self.match(TokenType.RPAREN)
+                start = self.curToken.start  # Recorded on the node for source maps.
+                outer = self.in_func
+                node = self.statementHead()
+                if type(node) in BLOCK_STATEMENTS:
+                    stack.append([node, node.body, start, outer])
+                    self.depth = max(self.depth, len(stack))
+                    continue
+
+            # Semicolon and newline.
+            self.semi_nl()
+            node.pos = start
+            if not stack:
+                return node
+            stack[-1][1].append(node)
+
+    # Parse a simple statement, or the head of a compound one up to and including the "{" that
+    # opens its block. Returns the node; statement() fills in the body of a compound one.
+    def statementHead(self):
+        """Parse a simple statement, or the head of a compound one up to the start of its block."""
+        # Check the first token to see what kind of statement this is.
 
-        # Print (with newline) ::= "PrintLn" "(" (expression | string) ")"
-        if self.checkToken(TokenType.PrintLn):
+        # Print (no newline) ::= "Print" "(" expression ")"
+        # Print (with newline) ::= "PrintLn" "(" expression ")"
+        if self.checkToken(TokenType.Print) or self.checkToken(TokenType.PrintLn):
+            newline = self.checkToken(TokenType.PrintLn)
             self.nextToken()
             self.match(TokenType.LPAREN)
-            if self.checkToken(TokenType.STRING):
-                self.emitter.emitLine(f'print("{self.curToken.text}")')
-                self.nextToken()
-            else:
-                self.emitter.emit("print(")
-                self.expression()
-                self.emitter.emitLine(")")
-
+            value = self.expression()
             self.match(TokenType.RPAREN)
+            return Print(value, newline)
 
-        # If-statement ::= "If" comparison "{" {statement} "}"
-        elif self.checkToken(TokenType.If):
+        # If-statement ::= "If" comparison "{" {statement} "}" {"ElseIf" comparison "{" {statement} "}"} ["Else" "{" {statement} "}"]
+        if self.checkToken(TokenType.If):
             self.nextToken()
-            self.emitter.emit("if ")
-            self.comparison()
-
-            self.match(TokenType.LBRACE)
-            self.nl()
-            self.emitter.emitLine(":")
-            self.emitter.id += 1
-
-            # Zero or more statements in the body.
-            while not self.checkToken(TokenType.RBRACE):
-                self.statement()
-
-            self.match(TokenType.RBRACE)
-            self.emitter.id -= 1
-
-            self.nextToken()
-
-            if self.checkToken(TokenType.Else):
-                self.nextToken()
-                self.emitter.emitLine("else:")
-
-                self.match(TokenType.LBRACE)
-                self.nl()
-
-                # Zero or more statements in the body.
-                while not self.checkToken(TokenType.RBRACE):
-                    self.statement()
-
-                self.match(TokenType.RBRACE)
-                self.emitter.id -= 1
-
-                self.nextToken()
-
-            elif self.checkToken(TokenType.ElseIf):
-                self.nextToken()
-                self.emitter.emit("elif ")
-                self.comparison()
-
-                self.match(TokenType.LBRACE)
-                self.nl()
-                self.emitter.emitLine(":")
-                self.emitter.id += 1
-
-                # Zero or more statements in the body.
-                while not self.checkToken(TokenType.RBRACE):
-                    self.statement()
-
-                self.match(TokenType.RBRACE)
-                self.emitter.id -= 1
-
-                self.nextToken()
+            node = If(self.comparison(), [], [], None)
+            self.openBlock()
+            return node
 
         # While loop ::= "While" comparison "{" {statement} "}"
-        elif self.checkToken(TokenType.While):
-            self.nextToken()
-            self.emitter.emit("while ")
-            self.comparison()
-
-            self.match(TokenType.LBRACE)
-            self.nl()
-            self.emitter.emitLine(":")
-            self.emitter.id += 1
-
-            # Zero or more statements in the loop body.
-            while not self.checkToken(TokenType.RBRACE):
-                self.statement()
-
-            self.match(TokenType.RBRACE)
-            self.emitter.id -= 1
-
-        # Function definition ::= "Func" ident "{" {statement} "}"
-        elif self.checkToken(TokenType.Func):
+        if self.checkToken(TokenType.While):
             self.nextToken()
-            if self.curToken.text in self.symbols:
-                self.abort(f"Cannot name function '{self.curToken.text}'- name already taken")
-
-            self.emitter.emitLine("")
-            self.emitter.emitLine(f"def {self.curToken.text}():")
-            self.in_func = True
+            node = While(self.comparison(), [])
+            self.openBlock()
+            return node
+
+        # Function definition ::= ["Memo"] "Func" ident ["(" [ident {"," ident}] ")"] "{" {statement} "}"
+        if self.checkToken(TokenType.Func) or self.checkToken(TokenType.Memo):
+            memo = self.checkToken(TokenType.Memo)
+            if memo:
+                self.nextToken()
+            self.match(TokenType.Func)
+            name = self.curToken.text
+            if name in self.symbols:
+                self.abort(f"Cannot name function '{name}'- name already taken")
 
             # Add the function name to the list of functions.
-            self.functions.add(self.curToken.text)
+            self.functions.add(name)
 
             self.match(TokenType.IDENT)
-
-            self.emitter.id += 1
-
-            self.match(TokenType.LBRACE)
-            self.nl()
-
-            while not self.checkToken(TokenType.RBRACE):
-                self.statement()
-
-            self.match(TokenType.RBRACE)
-            self.emitter.id -= 1
-            self.emitter.emitLine("")
-            self.in_func = False
+            params = []
+            if self.checkToken(TokenType.LPAREN):
+                self.nextToken()
+                while not self.checkToken(TokenType.RPAREN):
+                    if params:
+                        self.match(TokenType.COMMA)
+                    param = self.curToken.text
+                    self.match(TokenType.IDENT)
+                    if param in params:
+                        self.abort(f"Duplicate parameter '{param}' in function '{name}'")
+                    params.append(param)
+                self.nextToken()
+            # Parameters are variables of the function.
+            self.symbols.update(params)
+            self.in_func = True  # statement() restores it when the block closes.
+            self.openBlock()
+            return Func(name, [], params, memo)
 
         # Variable definition ::= "Var" ident "=" expression
-        elif self.checkToken(TokenType.Var):
+        # Element assignment ::= "Var" ident "[" expression "]" "=" expression
+        if self.checkToken(TokenType.Var):
             self.nextToken()
-            self.symbols.add(self.curToken.text)
-            self.emitter.emit(f"{self.curToken.text} = ")
+            name = self.curToken.text
+            if self.checkPeek(TokenType.LBRACKET):
+                self.checkSymbol(name)
+                self.match(TokenType.IDENT)
+                index = self.subscript()
+                self.match(TokenType.EQ)
+                return Store(name, index, self.expression())
+            self.symbols.add(name)
             self.match(TokenType.IDENT)
             self.match(TokenType.EQ)
-            self.expression()
-            self.emitter.emitLine("")
+            return Var(name, self.expression())
 
-        # Function call ::= ident "()"
-        elif self.checkToken(TokenType.IDENT):
-            name = self.curToken.text
+        # Array definition ::= "Array" ident "[" expression "]" ["=" expression]
+        if self.checkToken(TokenType.Array):
             self.nextToken()
-            if self.checkToken(TokenType.LPAREN):
+            name = self.curToken.text
+            self.symbols.add(name)
+            self.match(TokenType.IDENT)
+            size = self.subscript()
+            fill = Number("0")  # Arrays are zero-filled ints unless told otherwise.
+            if self.checkToken(TokenType.EQ):
                 self.nextToken()
-                if self.checkToken(TokenType.RPAREN):
-                    # This is a function call. Check if the function exists.
-                    if name not in self.functions:
-                        self.abort(f"Referencing function before assignment: {name}")
-                    self.emitter.emitLine(f"{name}()")
-                    self.nextToken()
-                else:
-                    self.abort(f"Expected ')', got {self.curToken.text}")
-
-        # Return statement: must be inside a function ::= "Return" ident | expression | string
-        elif self.checkToken(TokenType.Return):
+                fill = self.expression()
+            return Array(name, size, fill)
+
+        # Function call ::= call
+        if self.checkToken(TokenType.IDENT):
+            return self.call()
+
+        if self.checkToken(TokenType.Import):
+            self.abort("Import must come before the other statements of the module")
+
+        # Return statement: must be inside a function ::= "Return" expression
+        if self.checkToken(TokenType.Return):
             self.nextToken()
-            if self.in_func:
-                if self.checkToken(TokenType.IDENT):
-                    if self.curToken.text not in self.symbols:
-                        self.abort(f"Referencing variable before assignment: {self.curToken.text}")
-                    self.emitter.emitLine(f"return {self.curToken.text}")
-                    self.nextToken()
-                elif self.checkToken(TokenType.STRING):
-                    self.emitter.emitLine(f"return {self.curToken.text}")
-                    self.nextToken()
-                else:
-                    # Expect expression
-                    self.nextToken()
-                    self.expression()
-            else:
+            if not self.in_func:
                 self.abort("'Return' outside of function")
+            return Return(self.expression())
 
         # This is not a valid statement. Error!
-        else:
-            self.abort(
-                "Invalid statement at " + self.curToken.text + " (" + self.curToken.kind.name + ")"
-            )
-
-        # Semicolon and newline.
-        self.semi_nl()
+        self.abort(
+            "Invalid statement at " + self.curToken.text + " (" + self.curToken.kind.name + ")"
+        )
 
     # Return true if the current token is a comparison operator.
     def isComparisonOperator(self):
@@ -278,63 +318,109 @@ class Parser:
     # comparison ::= expression (("==" | "!=" | ">" | ">=" | "<" | "<=") expression)+
     def comparison(self):
         """Comparison node for the AST."""
-        self.expression()
-        # Must be at least one comparison operator and another expression.
-        if self.isComparisonOperator():
-            self.emitter.emit(f" {self.curToken.text} ")
-            self.nextToken()
-            self.expression()
+        left = self.expression()
+        ops = []
+        comparators = []
         # Can have 0 or more comparison operator and expressions.
         while self.isComparisonOperator():
-            self.emitter.emit(f" {self.curToken.text} ")
+            ops.append(self.curToken.text)
             self.nextToken()
-            self.expression()
+            comparators.append(self.expression())
+        if not ops:
+            return left
+        return Compare(left, ops, comparators)
 
     # expression ::= term {( "-" | "+" ) term}
+    # term ::= unary {( "/" | "*" ) unary}
+    #
+    # Both levels are parsed by one loop driven by BINARY_PRECEDENCE (operator precedence parsing
+    # with explicit operand and operator stacks), so long expressions cost no recursion.
     def expression(self):
         """Expression node for the AST."""
-        self.term()
-        # Can have 0 or more +/- and expressions.
-        while self.checkToken(TokenType.PLUS) or self.checkToken(TokenType.MINUS):
-            self.emitter.emit(f" {self.curToken.text} ")
-            self.nextToken()
-            self.term()
-
-    # term ::= unary {( "/" | "*" ) unary}
-    def term(self):
-        """Term node for the AST."""
-        self.unary()
-        # Can have 0 or more *// and expressions.
-        while self.checkToken(TokenType.ASTERISK) or self.checkToken(TokenType.SLASH):
-            self.emitter.emit(f" {self.curToken.text} ")
+        operands = [self.unary()]
+        operators = []  # (operator text, precedence), binding more tightly towards the top.
+        while self.curToken.kind in BINARY_PRECEDENCE:
+            prec = BINARY_PRECEDENCE[self.curToken.kind]
+            # Operators are left-associative: reduce everything that binds at least as tightly.
+            while operators and operators[-1][1] >= prec:
+                right = operands.pop()
+                operands[-1] = BinOp(operators.pop()[0], operands[-1], right)
+            operators.append((self.curToken.text, prec))
             self.nextToken()
-            self.unary()
+            operands.append(self.unary())
+        while operators:
+            right = operands.pop()
+            operands[-1] = BinOp(operators.pop()[0], operands[-1], right)
+        return operands[0]
 
     # unary ::= ["+" | "-"] primary
     def unary(self):
         """Unary node for the AST."""
         # Optional unary +/-
         if self.checkToken(TokenType.PLUS) or self.checkToken(TokenType.MINUS):
-            self.emitter.emit(f" {self.curToken.text} ")
+            op = self.curToken.text
             self.nextToken()
-        self.primary()
+            return UnaryOp(op, self.primary())
+        return self.primary()
 
-    # primary ::= number | ident
+    # primary ::= number | call | ident ["[" expression "]"] | "Len" ident | string
     def primary(self):
         """Primary node for the AST."""
         if self.checkToken(TokenType.NUMBER):
-            self.emitter.emit(self.curToken.text)
+            node = Number(self.curToken.text)
+            self.nextToken()
+        elif self.checkToken(TokenType.STRING):
+            node = String(self.curToken.text)
             self.nextToken()
+        elif self.checkToken(TokenType.IDENT) and self.checkPeek(TokenType.LPAREN):
+            node = self.call()
         elif self.checkToken(TokenType.IDENT):
-            if self.curToken.text in self.symbols:
-                self.emitter.emit(self.curToken.text)
-                self.nextToken()
-            else:
-                # Undefined variable!
-                self.abort(f"Undefined variable '{self.curToken.text}'")
+            self.checkSymbol(self.curToken.text)
+            node = Name(self.curToken.text)
+            self.nextToken()
+            if self.checkToken(TokenType.LBRACKET):
+                node = Index(node, self.subscript())
+        elif self.checkToken(TokenType.Len):
+            self.nextToken()
+            self.checkSymbol(self.curToken.text)
+            node = Length(Name(self.curToken.text))
+            self.match(TokenType.IDENT)
         else:
             # Error!
             self.abort("Unexpected token at " + self.curToken.text)
+        return node
+
+    # call ::= ident "(" [expression {"," expression}] ")"
+    def call(self):
+        """Call node for the AST."""
+        name = self.curToken.text
+        self.nextToken()
+        self.match(TokenType.LPAREN)
+        # This is a function call. Check if the function exists.
+        if name not in self.functions:
+            self.abort(f"Referencing function before assignment: {name}")
+        args = []
+        while not self.checkToken(TokenType.RPAREN):
+            if args:
+                self.match(TokenType.COMMA)
+            args.append(self.expression())
+        self.nextToken()
+        return Call(name, args)
+
+    # subscript ::= "[" expression "]"
+    def subscript(self):
+        """Match an array subscript and return the index expression."""
+        self.match(TokenType.LBRACKET)
+        index = self.expression()
+        self.match(TokenType.RBRACKET)
+        return index
+
+    # Abort unless `name` is a declared variable.
+    def checkSymbol(self, name):
+        """Abort unless `name` is a declared variable."""
+        if name not in self.symbols:
+            # Undefined variable!
+            self.abort(f"Undefined variable '{name}'")
 
     # nl ::= "\n"+
     def nl(self):
@@ -0,0 +1,235 @@
+import collections
+import cProfile
+import pstats
+import sys
+import time
+import tracemalloc
+
+from codegen import CodeGenerator
+from emit import Emitter
+from lex import KINDS, Lexer, TokenBuffer
+from optimize import Optimizer
+from parse import Parser
+
+# Instrumented compilation for `cobalt.py --timings`, `--productions` and `--profile`, and the
+# line profiler behind `cobalt.py profile`. This module is only imported when one of those is
+# asked for, and its hooks are installed on single instances, so ordinary compiles pay nothing for it.
+
+# Parser methods counted by countProductions(): one per grammar production.
+PRODUCTIONS = (
+    "program",
+    "statement",
+    "statementHead",
+    "openBlock",
+    "comparison",
+    "expression",
+    "unary",
+    "primary",
+    "nl",
+    "semi_nl",
+)
+
+
+# Records the wall and CPU time of each named phase.
+class PhaseTimer:
+    def __init__(self):
+        self.phases = []  # (name, wall seconds, CPU seconds), in the order they ran.
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+
+    # End the current phase, giving it a name.
+    def lap(self, name):
+        """End the current phase, giving it a name."""
+        wall, cpu = time.perf_counter(), time.process_time()
+        self.phases.append((name, wall - self.wall, cpu - self.cpu))
+        self.wall, self.cpu = wall, cpu
+
+
+# What an instrumented compile measured.
+class Report:
+    def __init__(self):
+        self.phases = []  # (name, wall seconds, CPU seconds).
+        self.peaks = {}  # Phase name -> peak traced memory in bytes.
+        self.tokens = collections.Counter()  # TokenType name -> count.
+        self.productions = None  # Production name -> calls, if they were counted.
+
+
+# Wrap the production methods of one Parser instance so each call is counted; returns the counter.
+# Only this instance is affected, so other parsers in the process run at full speed.
+def countProductions(parser):
+    """Wrap the production methods of one Parser instance so each call is counted; returns the counter."""
+    counts = collections.Counter()
+
+    def counted(name, method):
+        def wrapper(*args):
+            counts[name] += 1
+            return method(*args)
+
+        return wrapper
+
+    for name in PRODUCTIONS:
+        setattr(parser, name, counted(name, getattr(parser, name)))
+    return counts
+
+
+# Run the phases one after another, calling `lap(name)` at the end of each; returns the tokens.
+def runPhases(source, generator, optimizer, lap, productions=None):
+    """Run the phases one after another, calling `lap(name)` at the end of each; returns the tokens."""
+    tokens = TokenBuffer(Lexer(source))
+    lap("lex")
+    parser = Parser(tokens)
+    if productions is not None:
+        counts = countProductions(parser)
+    module = parser.program()
+    lap("parse")
+    optimizer.optimize(module)
+    lap("optimize")
+    generator.generate(module)
+    generator.emitter.getCode()
+    lap("emit")
+    if productions is not None:
+        productions.update(counts)
+    return tokens
+
+
+# Transpile `source` (a string) into the generator's emitter, timing each phase; returns a Report.
+def transpileInstrumented(source, generator, optimizer, productions=False):
+    """Transpile `source` (a string) into the generator's emitter, timing each phase; returns a Report."""
+    report = Report()
+    if productions:
+        report.productions = collections.Counter()
+    timer = PhaseTimer()
+    tokens = runPhases(source, generator, optimizer, timer.lap, report.productions)
+    report.phases = timer.phases
+    for kind, count in collections.Counter(tokens.kinds).items():
+        report.tokens[KINDS[kind].name] += count
+    return report
+
+
+# Fill in the peak memory of each phase. This compiles `source` a second time under tracemalloc,
+# so that its overhead does not skew the timings.
+def measureMemory(source, mode, level, report):
+    """Fill in the peak memory of each phase."""
+
+    def lap(name):
+        report.peaks[name] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.reset_peak()
+
+    tracemalloc.start()
+    try:
+        runPhases(source, CodeGenerator(Emitter(None), mode), Optimizer(level), lap)
+    finally:
+        tracemalloc.stop()
+
+
+# Print a Report.
+def printReport(report, file=sys.stdout):
+    """Print a Report."""
+    print(f"{'phase':>10} {'wall ms':>9} {'cpu ms':>9} {'peak MiB':>9}", file=file)
+    for name, wall, cpu in report.phases:
+        peak = report.peaks.get(name, 0) / 2**20
+        print(f"{name:>10} {wall * 1000:9.1f} {cpu * 1000:9.1f} {peak:9.2f}", file=file)
+    wall = sum(phase[1] for phase in report.phases)
+    cpu = sum(phase[2] for phase in report.phases)
+    peak = max(report.peaks.values(), default=0) / 2**20
+    print(f"{'total':>10} {wall * 1000:9.1f} {cpu * 1000:9.1f} {peak:9.2f}", file=file)
+    if not report.peaks:
+        print("(peak memory not measured)", file=file)
+
+    total = sum(report.tokens.values())
+    print(f"tokens: {total}", file=file)
+    for name, count in report.tokens.most_common():
+        print(f"{name:>10} {count:9}", file=file)
+    if report.productions is not None:
+        print("productions:", file=file)
+        for name, count in report.productions.most_common():
+            print(f"{name:>10} {count:9}", file=file)
+
+
+# Call `func()` under cProfile, save the stats to `path` and print the most expensive functions.
+def profile(func, path, limit=15):
+    """Call `func()` under cProfile, save the stats to `path` and print the most expensive functions."""
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func)
+    finally:
+        profiler.dump_stats(path)
+        stats = pstats.Stats(profiler, stream=sys.stderr)
+        stats.sort_stats("tottime").print_stats(limit)
+        print(f"Profile written to {path} (view with: python -m pstats {path})", file=sys.stderr)
+
+
+# Function names that mean "top-level Cobalt code" rather than a Func.
+MODULE_NAMES = ("<module>", "main")
+
+
+# Profiles the generated code of one program by Python line and function. It traces every line
+# executed, counting hits and charging the time until the next traced line to each. (Sampling
+# would be cheaper, but CPython only runs signal handlers and switches threads at loop back edges
+# and calls, so every sample of a loop would land on its While line.)
+class LineProfiler:
+    def __init__(self, filename):
+        self.filename = filename  # co_filename of the generated code.
+        self.seconds = collections.Counter()  # (line, function) -> seconds.
+        self.hits = collections.Counter()  # (line, function) -> times executed.
+        self.last = None  # (line, function) being timed.
+        self.lastTime = 0.0
+
+    # Run a code object under the profiler.
+    def run(self, code, namespace):
+        """Run a code object under the profiler."""
+        self.lastTime = time.perf_counter()
+        sys.settrace(self.traceCall)
+        try:
+            exec(code, namespace)
+        finally:
+            sys.settrace(None)
+            if self.last is not None:
+                self.seconds[self.last] += time.perf_counter() - self.lastTime
+
+    def traceCall(self, frame, event, arg):
+        if frame.f_code.co_filename == self.filename:
+            return self.traceLine
+        return None
+
+    def traceLine(self, frame, event, arg):
+        if event == "line":
+            now = time.perf_counter()
+            if self.last is not None:
+                self.seconds[self.last] += now - self.lastTime
+            self.last = (frame.f_lineno, frame.f_code.co_name)
+            self.hits[self.last] += 1
+            self.lastTime = time.perf_counter()  # Leave out the tracer's own time.
+        return self.traceLine
+
+
+# Print the hottest Cobalt lines and Funcs measured by a LineProfiler.
+def printHotSpots(profiler, sourceMap, text, top=15, file=sys.stderr):
+    """Print the hottest Cobalt lines and Funcs measured by a LineProfiler."""
+    lines = collections.Counter()  # Cobalt line -> seconds.
+    hits = collections.Counter()
+    funcs = collections.Counter()  # Func name -> seconds.
+    owner = {}  # Cobalt line -> the Func it is in.
+    for (line, name), seconds in profiler.seconds.items():
+        position = sourceMap.lookup(line)
+        cobaltLine = position[0] if position else 0
+        func = "(module)" if name in MODULE_NAMES else name
+        lines[cobaltLine] += seconds
+        hits[cobaltLine] += profiler.hits[line, name]
+        funcs[func] += seconds
+        owner[cobaltLine] = func
+
+    total = sum(lines.values()) or 1
+    source = text.splitlines()
+    print(f"Hot spots in {sourceMap.source} ({total:.3f}s traced):", file=file)
+    print(f"{'line':>6} {'time %':>7} {'seconds':>9} {'hits':>9}  {'func':<12} source", file=file)
+    for line, seconds in lines.most_common(top):
+        code = source[line - 1].strip() if 0 < line <= len(source) else "(generated code)"
+        print(
+            f"{line or '-':>6} {seconds / total:7.1%} {seconds:9.4f} {hits[line]:9}"
+            f"  {owner[line]:<12} {code}",
+            file=file,
+        )
+    print("By Func:", file=file)
+    for func, seconds in funcs.most_common():
+        print(f"{seconds / total:7.1%} {seconds:9.4f}  {func}", file=file)
@@ -0,0 +1,285 @@
+import concurrent.futures
+import hashlib
+import json
+import os
+import sys
+import time
+
+import bytecode
+import cobalt
+from codegen import MEMO_SIZE, RUNTIME, CodeGenerator
+from emit import Emitter
+from lex import CobaltError, Lexer, TokenType
+from nodes import Func, Import
+from optimize import Optimizer, assigned
+from parse import Parser
+from purity import impurities
+from scope import statements
+
+# Project builds: every .cb file in a directory is a module, which other modules of the project
+# can Import by name.
+#
+# Building a module needs the interfaces of the modules it imports: the Funcs and variables they
+# define at their top level, with the number of parameters, the types and the purity the importer
+# is type checked against. So the modules form a graph, built in topological order: a module is
+# handed to a worker as soon as every module it imports is built, so independent modules build
+# in parallel. An import cycle is an error.
+#
+# Each build writes the module's interface next to its output, in a .cbi file that also records
+# what the output was built from: the compiler version and options, a hash of the source and a
+# hash of the interface of every module it imports. A module is only rebuilt when one of those
+# changed, so editing the inside of a Func rebuilds that module alone, and its importers only
+# if the edit changed its interface.
+
+# Tokens that may come before the end of a module's Imports.
+IMPORT_TOKENS = {
+    TokenType.NEWLINE,
+    TokenType.Module,
+    TokenType.LBRACE,
+    TokenType.Import,
+    TokenType.IDENT,
+    TokenType.SEMI,
+}
+
+
+# Return the names of the modules a source imports, reading no further than its Imports.
+def imports(source):
+    """Return the names of the modules a source imports, reading no further than its Imports."""
+    names = []
+    lexer = Lexer(source)
+    previous = None
+    while True:
+        token = lexer.getToken()
+        if token.kind not in IMPORT_TOKENS:
+            return names
+        if previous is TokenType.Import and token.kind is TokenType.IDENT:
+            names.append(token.text)
+        previous = token.kind
+
+
+# Return the interface of a parsed module: the Funcs and variables it defines at its top level.
+def interface(module):
+    """Return the interface of a parsed module: the Funcs and variables it defines at its top level."""
+    types = module.types
+    reasons = impurities(module, types)
+    funcs = {}
+    for node in statements(module.body):
+        if type(node) is Func:
+            funcs.setdefault(node.name, []).append(
+                {"params": node.params, "returns": sorted(types.returns[node]), "impure": reasons[node]}
+            )
+    variables = {name: sorted(types.possible(name)) for name in assigned(module.body) - funcs.keys()}
+    return {"funcs": funcs, "variables": variables}
+
+
+# Return the hash of an interface; importers are rebuilt when it changes.
+def digest(exports):
+    """Return the hash of an interface; importers are rebuilt when it changes."""
+    return hashlib.sha256(json.dumps(exports, sort_keys=True).encode()).hexdigest()
+
+
+# Return the Import node that binds the names of a module with the given interface.
+def importNode(name, exports):
+    """Return the Import node that binds the names of a module with the given interface."""
+    variables = {variable: frozenset(kinds) for variable, kinds in exports["variables"].items()}
+    funcs = [
+        (Func(func, [], entry["params"]), frozenset(entry["returns"]), entry["impure"])
+        for func, entries in exports["funcs"].items()
+        for entry in entries
+    ]
+    return Import(name, variables, funcs)
+
+
+# Transpile one module against the interfaces of the modules it imports; returns (Python code,
+# its own interface).
+def compileModule(source, interfaces, optimize=0, codegen="script", memoSize=MEMO_SIZE, flush="size"):
+    """Transpile one module against the interfaces of the modules it imports."""
+    modules = lambda name: importNode(name, interfaces[name]) if name in interfaces else None
+    module = Parser(Lexer(source), modules=modules).program()
+    exports = interface(module)
+    Optimizer(optimize).optimize(module)
+    emitter = Emitter(None)
+    CodeGenerator(emitter, codegen, memoSize, flush).generate(module)
+    return emitter.getCode(), exports
+
+
+# Build one module in a worker; returns (name, interface or None, seconds, error message or None).
+def buildModule(task):
+    """Build one module in a worker; returns (name, interface or None, seconds, error message or None)."""
+    name, source, output, interfaces, options, record = task
+    start = time.perf_counter()
+    try:
+        code, exports = compileModule(
+            source, interfaces, options["optimize"], options["codegen"], options["memoSize"], options["flush"]
+        )
+        bytecode.writeOutput(code, output, options["emit"])
+        # Written last, so that an interrupted build leaves the module to be built again.
+        record = dict(record, exports=exports)
+        bytecode.writeAtomic(output[:-3] + ".cbi", json.dumps(record, indent=1).encode())
+    except CobaltError as e:
+        return name, None, time.perf_counter() - start, str(e)
+    except OSError as e:
+        return name, None, time.perf_counter() - start, f"{type(e).__name__}: {e}"
+    except RecursionError:
+        return name, None, time.perf_counter() - start, "Program is nested too deeply"
+    return name, exports, time.perf_counter() - start, None
+
+
+# Return the interface recorded for a module if it was built from exactly `record`, else None.
+def upToDate(output, record, emit):
+    """Return the interface recorded for a module if it was built from exactly `record`, else None."""
+    target = output[:-3] + ".pyc" if emit == "pyc" else output
+    try:
+        with open(output[:-3] + ".cbi") as f:
+            recorded = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(recorded, dict) or "exports" not in recorded or not os.path.exists(target):
+        return None
+    exports = recorded.pop("exports")
+    return exports if recorded == record else None
+
+
+# Return the import cycle `name` is part of, as a list of names from `name` back to it, or None.
+def findCycle(name, graph):
+    """Return the import cycle `name` is part of, or None."""
+    path = [name]
+    stack = [iter(graph[name])]  # One iterator over the imports of each module on the path.
+    seen = {name}
+    while stack:
+        for dep in stack[-1]:
+            if dep == name:
+                return path + [name]
+            if dep in graph and dep not in seen:
+                seen.add(dep)
+                path.append(dep)
+                stack.append(iter(graph[dep]))
+                break
+        else:
+            stack.pop()
+            path.pop()
+    return None
+
+
+# Build every module of the project in `directory`, writing each module's Python and interface to
+# `outDir`; returns [(name, status, seconds, error message or None)] in build order, where status
+# is "built", "up to date" or "failed".
+def build(
+    directory, outDir=None, jobs=1, optimize=0, codegen="script", memoSize=MEMO_SIZE, emit="py", flush="size"
+):
+    """Build every module of the project in `directory`; returns one result per module."""
+    outDir = outDir or directory
+    options = {"optimize": optimize, "codegen": codegen, "memoSize": memoSize, "emit": emit, "flush": flush}
+    paths = {}  # Module name -> source path.
+    for entry in sorted(os.listdir(directory)):
+        name, extension = os.path.splitext(entry)
+        if extension == ".cb" and os.path.isfile(os.path.join(directory, entry)):
+            paths[name] = os.path.join(directory, entry)
+
+    results = []
+    graph = {}  # Module name -> names of the modules it imports.
+    sources = {}  # Module name -> its source.
+    for name, path in paths.items():
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            sources[name] = data.decode()
+            graph[name] = list(dict.fromkeys(imports(sources[name])))
+        except CobaltError as e:
+            results.append((name, "failed", 0.0, str(e)))
+        except (OSError, UnicodeDecodeError) as e:
+            results.append((name, "failed", 0.0, f"{type(e).__name__}: {e}"))
+
+    # Modules that cannot be built: those whose output would hide a module that generated code
+    # imports, those importing a missing module or in a cycle, and those importing a module that
+    # cannot be built.
+    failed = {name for name, *_ in results}
+    for name, deps in graph.items():
+        missing = [dep for dep in deps if dep not in paths]
+        cycle = findCycle(name, graph)
+        if name in sys.stdlib_module_names:
+            results.append((name, "failed", 0.0, f"'{name}' is the name of a Python standard library module"))
+        elif name == RUNTIME:
+            results.append((name, "failed", 0.0, f"'{name}' is the name of the Cobalt runtime module"))
+        elif missing:
+            results.append((name, "failed", 0.0, f"No module named '{missing[0]}'"))
+        elif cycle:
+            results.append((name, "failed", 0.0, "Import cycle: " + " -> ".join(cycle)))
+        else:
+            continue
+        failed.add(name)
+    changed = True
+    while changed:
+        changed = False
+        for name, deps in graph.items():
+            dep = next((dep for dep in deps if dep in failed), None)
+            if name not in failed and dep is not None:
+                results.append((name, "failed", 0.0, f"Imports '{dep}', which failed to build"))
+                failed.add(name)
+                changed = True
+
+    waiting = {name: set(deps) for name, deps in graph.items() if name not in failed}
+    importers = {}  # Module name -> names of the modules waiting on it.
+    for name, deps in waiting.items():
+        for dep in deps:
+            importers.setdefault(dep, []).append(name)
+    exports = {}  # Module name -> its interface, once built.
+    ready = sorted(name for name, deps in waiting.items() if not deps)
+    running = {}  # Future -> name.
+
+    # Mark a module done, making the modules that only waited on it ready.
+    def finish(name, interface, status, seconds, error):
+        results.append((name, status, seconds, error))
+        if interface is None:
+            failed.add(name)
+        else:
+            exports[name] = interface
+        for importer in importers.get(name, ()):
+            deps = waiting[importer]
+            deps.discard(name)
+            if not deps and importer not in failed:
+                if all(dep in exports for dep in graph[importer]):
+                    ready.append(importer)
+                else:
+                    dep = next(dep for dep in graph[importer] if dep in failed)
+                    finish(importer, None, "failed", 0.0, f"Imports '{dep}', which failed to build")
+
+    if waiting and flush != "unbuffered":
+        try:
+            bytecode.writeRuntime(outDir)
+        except OSError as e:
+            error = f"Cannot write the runtime module: {type(e).__name__}: {e}"
+            return results + [(name, "failed", 0.0, error) for name in waiting]
+    executor = concurrent.futures.ProcessPoolExecutor(jobs) if jobs > 1 and len(waiting) > 1 else None
+    try:
+        while ready or running:
+            while ready:
+                name = ready.pop(0)
+                output = os.path.join(outDir, name + ".py")
+                interfaces = {dep: exports[dep] for dep in graph[name]}
+                record = {
+                    "version": cobalt.VERSION,
+                    "options": options,
+                    "source": hashlib.sha256(sources[name].encode()).hexdigest(),
+                    "imports": {dep: digest(interfaces[dep]) for dep in graph[name]},
+                }
+                interface = upToDate(output, record, emit)
+                if interface is not None:
+                    finish(name, interface, "up to date", 0.0, None)
+                    continue
+                task = (name, sources[name], output, interfaces, options, record)
+                if executor is None:
+                    name, interface, seconds, error = buildModule(task)
+                    finish(name, interface, "failed" if error else "built", seconds, error)
+                else:
+                    running[executor.submit(buildModule, task)] = name
+            if running:
+                done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    del running[future]
+                    name, interface, seconds, error = future.result()
+                    finish(name, interface, "failed" if error else "built", seconds, error)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return results
@@ -0,0 +1,120 @@
+from nodes import *
+from optimize import calls, childBlocks, expressions, operands, reads, walk
+from scope import statements
+from typeinfer import ELEMENTS, TypeCheckError, normalName
+
+# Purity analysis: which Funcs can have their calls cached.
+#
+# A Func is pure if what a call returns depends only on its arguments and the call does nothing
+# else: its body reads only its parameters and its own variables; it does not print, declare or
+# write arrays, or define Funcs; and it calls only pure Funcs, itself included. Its parameters
+# must never hold arrays, which are mutable and cannot be cache keys.
+#
+# Whether an imported Func is pure comes from the interface of its module. Importing modules may
+# pass anything, so a module's top-level Funcs that take parameters are only pure if marked Memo,
+# and then calls from other modules are checked not to pass them arrays.
+#
+# Memo Funcs must be pure and defined at the top level of the module, so that each has one
+# cache for the whole run.
+
+
+# Return {Func node: why calls to it cannot be cached, or None if it is pure} for every Func.
+def impurities(module, types):
+    """Return {Func node: why calls to it cannot be cached, or None if it is pure} for every Func."""
+    funcs = [node for node in walk(module.body) if type(node) is Func]
+    reasons = {func: directImpurity(func, types) for func in funcs}
+    for node in module.body:
+        if type(node) is Import:
+            reasons.update((func, reason) for func, _, reason in node.funcs)
+    callees = {func: funcCalls(func) for func in funcs}
+
+    # Calling a Func that is not pure makes the caller impure too; repeat until nothing changes.
+    changed = True
+    while changed:
+        changed = False
+        for func in funcs:
+            if reasons[func] is not None:
+                continue
+            for name in sorted(callees[func]):
+                if any(reasons[callee] is not None for callee in types.funcs.get(normalName(name), ())):
+                    reasons[func] = f"it calls '{name}', which is not pure"
+                    changed = True
+                    break
+    return reasons
+
+
+# Return why a Func's own body keeps it from being pure, not counting the Funcs it calls, or None.
+def directImpurity(func, types):
+    """Return why a Func's own body keeps it from being pure, not counting the Funcs it calls, or None."""
+    for name in func.params:
+        if any(kind in ELEMENTS for kind in types.possible(name, func)):
+            return f"its parameter '{name}' may be an array"
+    own = types.scopes[func]
+    for node in statements(func.body):
+        kind = type(node)
+        if kind is Print:
+            return "it prints"
+        if kind is Array or kind is Store:
+            return "it uses arrays"
+        if kind is Func:
+            return f"it defines Func '{node.name}'"
+        for value in expressions(node):
+            for name in sorted(reads(value)):
+                if normalName(name) not in own:
+                    return f"it reads '{name}', which is not one of its own variables"
+    return None
+
+
+# Return the names of the Funcs a Func's body calls, not counting the Funcs defined in it.
+def funcCalls(func):
+    """Return the names of the Funcs a Func's body calls."""
+    names = set()
+    for node in statements(func.body):
+        for value in expressions(node):
+            names |= calls(value)
+    return names
+
+
+# Raise TypeCheckError for a Memo Func that is not pure or not defined at the top level, or for a
+# call that may pass an array to a pure Func of another module.
+def checkMemo(module, types):
+    """Raise TypeCheckError for a Memo Func that is not pure or not defined at the top level."""
+    checkImportedCalls(module, types)
+    marked = [node for node in walk(module.body) if type(node) is Func and node.memo]
+    if not marked:
+        return
+    topLevel = {id(node) for node in module.body}
+    reasons = impurities(module, types)
+    for func in marked:
+        if id(func) not in topLevel:
+            raise TypeCheckError(f"Memo Func '{func.name}' must be defined at the top level", func)
+        if reasons[func] is not None:
+            raise TypeCheckError(f"Memo Func '{func.name}' cannot be memoized: {reasons[func]}", func)
+
+
+# Raise TypeCheckError for a call that may pass an array to a pure Func imported from another
+# module, which may be memoized there.
+def checkImportedCalls(module, types):
+    """Raise TypeCheckError for a call that may pass an array to a pure imported Func."""
+    pure = set()
+    for node in module.body:
+        if type(node) is Import:
+            pure.update(func for func, _, reason in node.funcs if reason is None and func.params)
+    if not pure:
+        return
+    stack = [(module.body, None)]  # Blocks still to check, with the Func each is in.
+    while stack:
+        body, scope = stack.pop()
+        for node in body:
+            values = list(expressions(node))
+            while values:
+                value = values.pop()
+                values.extend(operands(value))
+                if type(value) is not Call or not any(func in pure for func in types.callees(value)):
+                    continue
+                for arg in value.args:
+                    if any(kind in ELEMENTS for kind in types.evaluate(arg, scope)[0]):
+                        message = f"'{value.name}' is pure in its module, so it cannot be passed an array"
+                        raise TypeCheckError(message, node)
+            inner = node if type(node) is Func else scope
+            stack.extend((block, inner) for block in childBlocks(node))
@@ -0,0 +1,66 @@
+import itertools
+
+from nodes import *
+from optimize import calls, childBlocks, expressions, reads
+
+
+# Scope analysis: which names are shared between module-level code and functions.
+#
+# Generated functions keep Python's scoping: a Var inside a Func creates a local, and any other
+# name a function reads is looked up as a module global. When the module body is wrapped in
+# main(), the names main() binds that some function reads, and the functions main() defines,
+# must stay module globals; everything else main() binds can become a fast local. Imports stay at
+# module level, so an imported name main() assigns must be declared global too.
+
+
+# Return the names main() must declare global when the module body is wrapped in it.
+def mainGlobals(module):
+    """Return the names main() must declare global when the module body is wrapped in it."""
+    bound = set()  # Names main() binds: its variables and functions.
+    shared = set()  # Names read by functions defined in main().
+    funcs = set()
+    imported = set()  # Names bound by Imports, which stay above main() at module level.
+    for node in statements(module.body):
+        kind = type(node)
+        if kind is Var or kind is Array:
+            bound.add(node.name)
+        elif kind is Func:
+            funcs.add(node.name)
+            shared |= freeNames(node)
+        elif kind is Import:
+            imported |= set(node.variables) | {func.name for func, _, _ in node.funcs}
+    return funcs | (bound & (shared | imported))
+
+
+# Return the names a function reads from enclosing scopes (variables and called functions).
+def freeNames(func):
+    """Return the names a function reads from enclosing scopes (variables and called functions)."""
+    used = set()
+    assigned = set()
+    for node in statements(func.body):
+        kind = type(node)
+        for value in expressions(node):
+            used |= reads(value) | calls(value)
+        if kind is Var or kind is Array:
+            assigned.add(node.name)
+        elif kind is Store:
+            # Writing an element reads the array variable; it does not bind it.
+            used.add(node.name)
+        elif kind is Func:
+            assigned.add(node.name)
+            used |= freeNames(node)
+    return used - assigned - set(func.params)
+
+
+# Yield the statements of a block and of the blocks nested in it, without entering functions.
+def statements(body):
+    """Yield the statements of a block and of the blocks nested in it, without entering functions."""
+    stack = [iter(body)]  # One iterator per open block, innermost last.
+    while stack:
+        for node in stack[-1]:
+            yield node
+            if type(node) is not Func and childBlocks(node):
+                stack.append(itertools.chain.from_iterable(childBlocks(node)))
+                break
+        else:
+            stack.pop()
@@ -0,0 +1,152 @@
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+
+import cobalt
+from cobaltc import defaultSocket
+from codegen import FLUSH_POLICIES, MEMO_SIZE, CodeGenerator, MODES
+from emit import Emitter
+from lex import CobaltError, Lexer
+from optimize import Optimizer
+from parse import Parser
+
+
+# Operations the server understands; 'check' stops before code generation.
+OPS = ("compile", "check")
+
+
+# Answer one request (decoded from JSON) with a reply dict; never raises. A malformed request or
+# an error in the compiler itself gets an {"ok": false} reply like any compile error.
+def handle(fields, cache=None):
+    """Answer one request (decoded from JSON) with a reply dict; never raises."""
+    start = time.perf_counter()
+    if not isinstance(fields, dict):
+        reply = {"ok": False, "error": "Bad request: expected a JSON object"}
+    else:
+        try:
+            reply = answer(fields, cache, start)
+        except Exception as e:
+            error = f"Internal compiler error: {type(e).__name__}: {e}"
+            reply = {"ok": False, "error": error, "kind": "InternalError"}
+    reply.setdefault("timings", {})["total"] = time.perf_counter() - start
+    return reply
+
+
+# Answer a request object with a reply dict, which handle() adds the total time to.
+def answer(fields, cache, start):
+    """Answer a request object with a reply dict, which handle() adds the total time to."""
+    op = fields.get("op", "compile")
+    optimize = fields.get("optimize", 0)
+    codegen = fields.get("codegen", "script")
+    memoSize = fields.get("memoSize", MEMO_SIZE)
+    flush = fields.get("flush", "size")
+    if op not in OPS:
+        return {"ok": False, "error": f"Unknown op: {op!r}"}
+    if optimize not in (0, 1, 2, 3) or codegen not in MODES:
+        return {"ok": False, "error": "Bad optimize level or codegen mode"}
+    if type(memoSize) is not int or memoSize < 0:
+        return {"ok": False, "error": "Bad memo size"}
+    if flush not in FLUSH_POLICIES:
+        return {"ok": False, "error": "Bad flush policy"}
+    source = fields.get("source")
+    if not isinstance(source, str):
+        return {"ok": False, "error": "Missing source"}
+
+    timings = {}
+    try:
+        if op == "compile" and cache is not None:
+            code = cobalt.transpile_source(source, optimize, codegen, cache, memoSize, flush)
+            timings["transpile"] = time.perf_counter() - start
+        else:
+            module = Parser(Lexer(source)).program()
+            parsed = time.perf_counter()
+            Optimizer(optimize).optimize(module)
+            optimized = time.perf_counter()
+            timings["parse"] = parsed - start
+            timings["optimize"] = optimized - parsed
+            code = None
+            if op == "compile":
+                emitter = Emitter(None)
+                CodeGenerator(emitter, codegen, memoSize, flush).generate(module)
+                code = emitter.getCode()
+                timings["emit"] = time.perf_counter() - optimized
+    except CobaltError as e:
+        reply = {"ok": False, "error": str(e), "kind": type(e).__name__}
+    except RecursionError:
+        reply = {"ok": False, "error": "Program is nested too deeply", "kind": "RecursionError"}
+    else:
+        reply = {"ok": True}
+        if code is not None:
+            reply["code"] = code
+    reply["timings"] = timings
+    return reply
+
+
+# One connection: any number of newline-delimited JSON requests, each answered by one JSON line.
+class CompileHandler(socketserver.StreamRequestHandler):
+    # Read requests until the client closes the connection.
+    def handle(self):
+        """Read requests until the client closes the connection."""
+        for line in self.rfile:
+            try:
+                fields = json.loads(line)
+            except ValueError as e:
+                reply = {"ok": False, "error": f"Bad request: {e}"}
+            else:
+                reply = handle(fields, self.server.cache)
+                self.server.log(fields, reply)
+            self.wfile.write(json.dumps(reply).encode() + b"\n")
+            self.wfile.flush()
+
+
+# Threaded Unix socket server; each connection gets its own thread.
+class CompileServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, cache=None, verbose=False):
+        self.cache = cache
+        self.verbose = verbose
+        self.requests = 0
+        self.lock = threading.Lock()
+        super().__init__(path, CompileHandler)
+
+    # Count a finished request and, when verbose, print its timing.
+    def log(self, fields, reply):
+        """Count a finished request and, when verbose, print its timing."""
+        with self.lock:
+            self.requests += 1
+            number = self.requests
+        if self.verbose:
+            if not isinstance(fields, dict):
+                fields = {}
+            name = fields.get("filename", "<source>")
+            status = "ok" if reply["ok"] else reply["error"]
+            total = reply["timings"]["total"] * 1000
+            print(f"#{number} {fields.get('op', 'compile')} {name}: {total:.1f} ms, {status}", file=sys.stderr)
+
+
+# Serve requests on `path` until interrupted, replacing a stale socket file left by a dead server.
+def serve(path=None, cache=None, verbose=False):
+    """Serve requests on `path` until interrupted."""
+    path = path or defaultSocket()
+    if os.path.exists(path):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+            try:
+                probe.connect(path)
+            except ConnectionRefusedError:
+                os.unlink(path)
+            else:
+                raise OSError(f"A compile server is already listening on {path}")
+    with CompileServer(path, cache, verbose) as server:
+        print(f"Cobalt compile server listening on {path}", file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.unlink(path)
+    return server
@@ -0,0 +1,85 @@
+import bisect
+import json
+import os
+
+# Format version written into every map.
+VERSION = 1
+
+# Prefix of the comment line that carries an inline source map at the end of generated code.
+INLINE_PREFIX = "# cobalt-source-map: "
+
+
+# SourceMap maps each line of generated Python back to the Cobalt statement it came from.
+#
+# `lines[i]` and `columns[i]` are the 1-based Cobalt line and column of generated line i + 1,
+# or 0 for lines that do not come from any statement (headers, blank lines, the main() wrapper).
+# Serialised, it is a small JSON object, written either to a sidecar `<output>.map` file or as a
+# comment on the last line of the generated code.
+class SourceMap:
+    def __init__(self, source, lines, columns):
+        self.source = source  # Path of the Cobalt source file.
+        self.lines = lines
+        self.columns = columns
+
+    # Return the (line, column) of the Cobalt code that generated Python line `line`, or None.
+    def lookup(self, line):
+        """Return the (line, column) of the Cobalt code that generated Python line `line`, or None."""
+        if 1 <= line <= len(self.lines) and self.lines[line - 1]:
+            return self.lines[line - 1], self.columns[line - 1]
+        return None
+
+    # Return the map as a JSON string.
+    def dumps(self):
+        """Return the map as a JSON string."""
+        return json.dumps(
+            {"version": VERSION, "source": self.source, "lines": self.lines, "columns": self.columns},
+            separators=(",", ":"),
+        )
+
+    # Return the comment line that embeds the map in generated code.
+    def comment(self):
+        """Return the comment line that embeds the map in generated code."""
+        return INLINE_PREFIX + self.dumps()
+
+
+# Build a SourceMap from the Cobalt source text and the offset (or None) of each generated line.
+def build(text, offsets, source):
+    """Build a SourceMap from the Cobalt source text and the offset (or None) of each generated line."""
+    starts = [0]  # Offset of the first character of each Cobalt line.
+    index = text.find("\n")
+    while index != -1:
+        starts.append(index + 1)
+        index = text.find("\n", index + 1)
+
+    lines, columns = [], []
+    for offset in offsets:
+        if offset is None:
+            lines.append(0)
+            columns.append(0)
+        else:
+            line = bisect.bisect_right(starts, offset)
+            lines.append(line)
+            columns.append(offset - starts[line - 1] + 1)
+    return SourceMap(source, lines, columns)
+
+
+# Parse a map written by SourceMap.dumps().
+def loads(data):
+    """Parse a map written by SourceMap.dumps()."""
+    fields = json.loads(data)
+    if fields.get("version") != VERSION:
+        raise ValueError(f"Unsupported source map version: {fields.get('version')}")
+    return SourceMap(fields["source"], fields["lines"], fields["columns"])
+
+
+# Load the map of a generated Python file: its sidecar `.map` file, else an inline map, else None.
+def load(path):
+    """Load the map of a generated Python file: its sidecar `.map` file, else an inline map, else None."""
+    if os.path.exists(path + ".map"):
+        with open(path + ".map") as f:
+            return loads(f.read())
+    with open(path) as f:
+        for line in f:
+            if line.startswith(INLINE_PREFIX):
+                return loads(line[len(INLINE_PREFIX) :])
+    return None
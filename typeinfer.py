@@ -0,0 +1,472 @@
+import itertools
+import unicodedata
+
+from lex import CobaltError
+from nodes import *
+from optimize import calls, childBlocks, describe, expressions, operands, reads
+
+# Static type inference. Every variable is classified by the types of the values assigned to it
+# anywhere in its scope (the module, or the Func that assigns it, following Python's scoping):
+# int, float, string, int array or float array if all of them have that one type, dynamic
+# otherwise. The analysis is flow-insensitive, so a variable's type holds wherever it is bound,
+# and a read of an unbound variable still fails at run time as it would without the analysis.
+# A parameter holds whatever any call passes it, and a call produces whatever the Funcs of its
+# name return (none if they may end without a Return). The types of imported variables and of
+# what imported Funcs return come from the interfaces of their modules. Other modules of a project
+# may call the Funcs a module defines at its top level with anything, so their parameters may hold
+# any value; a Memo Func's are only never arrays, which importing modules may not pass it.
+#
+# Operators whose operands can never be valid together, such as a string minus an int, are
+# reported as compile errors, as are calls passing the wrong number of arguments; code
+# generation and the optimizer use the types to specialise.
+
+INT = "int"
+FLOAT = "float"
+STRING = "string"
+DYNAMIC = "dynamic"  # A variable or expression that may produce values of more than one type.
+FUNCTION = "function"  # A name bound by a Func; never a variable's only type in a valid program.
+NONE = "none"  # What a call returns if the Func ends without a Return.
+INT_ARRAY = "int array"
+FLOAT_ARRAY = "float array"
+
+ELEMENTS = {INT_ARRAY: INT, FLOAT_ARRAY: FLOAT}  # Array type -> the type of its elements.
+ARRAYS = {INT: INT_ARRAY, FLOAT: FLOAT_ARRAY}  # Fill type -> the type of the array.
+
+NUMERIC = {(INT, INT): INT, (INT, FLOAT): FLOAT, (FLOAT, INT): FLOAT, (FLOAT, FLOAT): FLOAT}
+
+# Operator -> {(left type, right type): result type}, with Python's rules; other pairs raise TypeError.
+BINARY_RESULTS = {
+    "+": {**NUMERIC, (STRING, STRING): STRING},
+    "-": NUMERIC,
+    "*": {**NUMERIC, (STRING, INT): STRING, (INT, STRING): STRING},
+    "/": dict.fromkeys(NUMERIC, FLOAT),
+}
+UNARY_RESULTS = {INT: INT, FLOAT: FLOAT}
+
+# Operand pairs the ordering comparisons accept; == and != accept anything.
+ORDERED = set(NUMERIC) | {(STRING, STRING)}
+
+# Sets of possible types. Sets are frozen, so that operators' results can be looked up by them.
+NOTHING = frozenset()  # E.g. a name no scope assigns; reading it fails at run time.
+INTS = frozenset([INT])
+FLOATS = frozenset([FLOAT])
+STRINGS = frozenset([STRING])
+FUNCTIONS = frozenset([FUNCTION])
+NONES = frozenset([NONE])
+SCALARS = frozenset([INT, FLOAT, STRING, NONE])  # Any value but an array or a Func.
+VALUES = SCALARS | frozenset(ELEMENTS)  # Any value but a Func.
+
+
+# Raised for operators applied to operands of types they can never accept.
+class TypeCheckError(CobaltError):
+    """Raised for operators applied to operands of types they can never accept."""
+
+    def __init__(self, message, node=None):
+        super().__init__("Error: " + message)
+        self.pos = getattr(node, "pos", None)
+
+
+# Return the name Python uses for a Cobalt identifier, so that names Python treats as one
+# variable share one type.
+def normalName(name):
+    """Return the name Python uses for a Cobalt identifier."""
+    return name if name.isascii() else unicodedata.normalize("NFKC", name)
+
+
+# Return the classification of a set of possible types.
+def classify(kinds):
+    """Return the classification of a set of possible types."""
+    if len(kinds) == 1:
+        (kind,) = kinds
+        if kind != FUNCTION:
+            return kind
+    return DYNAMIC
+
+
+# Return a set of types for an error message, e.g. "int or float".
+def spell(kinds):
+    """Return a set of types for an error message."""
+    return " or ".join(sorted(kinds))
+
+
+# Types holds the result of inference: the types each variable may hold, per scope. Scopes are
+# identified by their Func node, or None for the module.
+class Types:
+    def __init__(self):
+        self.scopes = {None: {}}  # Scope -> {name: frozenset of possible types}.
+        self.parents = {None: None}  # Func node -> the scope it is defined in.
+        self.returns = {}  # Func node -> frozenset of the types a call to it may produce.
+        self.resolved = {}  # (scope, name) -> the scope a read of the name refers to.
+        self.funcs = {}  # Normalised name -> every Func node defined with that name.
+
+    # Return the scope whose variable a read of `name` (normalised) in `scope` refers to.
+    def scopeOf(self, name, scope):
+        """Return the scope whose variable a read of `name` in `scope` refers to."""
+        path = []
+        while scope is not None and name not in self.scopes[scope]:
+            key = (scope, name)
+            if key in self.resolved:
+                scope = self.resolved[key]
+                break
+            path.append(key)
+            scope = self.parents[scope]
+        for key in path:
+            self.resolved[key] = scope
+        return scope
+
+    # Return the set of types a read of `name` in `scope` may produce.
+    def possible(self, name, scope=None):
+        """Return the set of types a read of `name` in `scope` may produce."""
+        name = normalName(name)
+        return self.scopes[self.scopeOf(name, scope)].get(name, NOTHING)
+
+    # Return the classification of a variable as read in `scope`: INT, FLOAT, STRING, INT_ARRAY,
+    # FLOAT_ARRAY or DYNAMIC.
+    def variable(self, name, scope=None):
+        """Return the classification of a variable as read in `scope`."""
+        return classify(self.possible(name, scope))
+
+    # Return the classification of an expression evaluated in `scope`.
+    def expression(self, node, scope=None):
+        """Return the classification of an expression evaluated in `scope`."""
+        return classify(self.evaluate(node, scope)[0])
+
+    # Return true if some operator in an expression may be given operands it rejects at run time.
+    def mayFail(self, node, scope=None):
+        """Return true if some operator in an expression may be given operands it rejects at run time."""
+        return self.evaluate(node, scope)[1]
+
+    # Return the names visible in `scope` that only ever hold ints, given those of the enclosing scope.
+    def ints(self, scope, outer=frozenset()):
+        """Return the names visible in `scope` that only ever hold ints."""
+        names = self.scopes[scope]
+        return {name for name in outer if name not in names} | {
+            name for name, kinds in names.items() if kinds == INTS
+        }
+
+    # Return (possible types, whether some operator may fail, error) for an expression evaluated
+    # in `scope`. The error is the message for the first operator that fails whatever its
+    # operands hold, or None.
+    def evaluate(self, node, scope=None):
+        """Return (possible types, whether some operator may fail, error) for an expression."""
+        # Post-order with explicit stacks, so the depth of an expression costs no recursion.
+        values = []  # Possible types of each finished subexpression.
+        seen = {}  # Name -> its possible types, looked up once per expression.
+        mayFail = False
+        error = None
+        stack = [(node, False)]
+        while stack:
+            node, ready = stack.pop()
+            kind = type(node)
+            if kind is Name:
+                kinds = seen.get(node.name)
+                if kinds is None:
+                    kinds = seen[node.name] = self.possible(node.name, scope)
+                values.append(kinds)
+                continue
+            if kind is Number:
+                values.append(FLOATS if "." in node.text else INTS)
+                continue
+            if kind is String:
+                values.append(STRINGS)
+                continue
+            if kind is Constant:
+                # Bools behave as ints.
+                values.append(FLOATS if type(node.value) is float else INTS)
+                continue
+            if not ready:
+                stack.append((node, True))
+                if kind is BinOp:
+                    stack += ((node.right, False), (node.left, False))
+                else:
+                    stack.extend((child, False) for child in reversed(operands(node)))
+                continue
+            if kind is BinOp or kind is Index:
+                count = 2
+            elif kind is UnaryOp or kind is Length:
+                count = 1
+            elif kind is Call:
+                count = len(node.args)
+            else:
+                count = len(node.ops) + 1
+            start = len(values) - count
+            args = values[start:]
+            del values[start:]
+            if kind is Call:
+                result, callError = self.call(node, args)
+                if callError is not None:
+                    mayFail = True
+                    error = error or callError
+                values.append(result)
+                continue
+            result, complete = combine(node, args)
+            if not complete:
+                mayFail = True
+                if error is None and not result and all(args):
+                    error = mismatch(node, args)
+            values.append(result)
+        return values[0], mayFail, error
+
+    # Return the Funcs a call may run: those with its name that take as many arguments as it passes.
+    def callees(self, node):
+        """Return the Funcs a call may run."""
+        funcs = self.funcs.get(normalName(node.name), ())
+        return [func for func in funcs if len(func.params) == len(node.args)]
+
+    # Return (possible types, error) of a call given the possible types of its arguments. The
+    # error is the message for a call no Func of its name takes, or None.
+    def call(self, node, args):
+        """Return (possible types, error) of a call given the possible types of its arguments."""
+        callees = self.callees(node)
+        if not callees:
+            counts = sorted({len(func.params) for func in self.funcs.get(normalName(node.name), ())})
+            plural = "" if counts == [1] else "s"
+            return NOTHING, (
+                f"Func '{node.name}' takes {' or '.join(map(str, counts))} argument{plural},"
+                f" not {len(args)}, in '{describe(node)}'"
+            )
+        return frozenset().union(*(self.returns[func] for func in callees)), None
+
+    # Return (possible types, error) of the variable an Array statement in `scope` binds. The
+    # error is the message for a size that is never an int or a fill that is not always an int
+    # or always a float, or None.
+    def declare(self, node, scope):
+        """Return (possible types, error) of the variable an Array statement binds."""
+        size, _, error = self.evaluate(node.size, scope)
+        fill, _, fillError = self.evaluate(node.fill, scope)
+        error = error or fillError
+        if error is None and size and INT not in size:
+            error = f"The size of Array '{node.name}' must be an int, not {spell(size)}"
+        if fill == INTS or fill == FLOATS:
+            (kind,) = fill
+            return frozenset([ARRAYS[kind]]), error
+        if error is None and fill:
+            error = f"Array '{node.name}' must be filled with only ints or only floats, not {spell(fill)}"
+        return NOTHING, error
+
+    # Return the error message for a Store in `scope` that can never succeed, or None.
+    def storeError(self, node, scope):
+        """Return the error message for a Store that can never succeed, or None."""
+        target = Index(Name(node.name), node.index)
+        elements, _, error = self.evaluate(target, scope)
+        value, _, valueError = self.evaluate(node.value, scope)
+        error = error or valueError
+        # Float arrays also take ints; int arrays only ints.
+        accepted = {INT, FLOAT} if FLOAT in elements else elements
+        if error is None and elements and value and not value & accepted:
+            arrays = spell(kind for kind in self.possible(node.name, scope) if kind in ELEMENTS)
+            error = f"Cannot store {spell(value)} in {arrays} element '{describe(target)}'"
+        return error
+
+
+# combine() results by operator and operand types; there are only a few distinct combinations.
+COMBINED = {}
+
+
+# Apply an operator to the possible types of its operands; returns (result types, whether every
+# combination of operand types is accepted).
+def combine(node, args):
+    """Apply an operator to the possible types of its operands."""
+    kind = type(node)
+    if kind is BinOp or kind is UnaryOp:
+        op = node.op
+    else:
+        op = tuple(node.ops) if kind is Compare else None
+    key = (kind, op, *args)
+    found = COMBINED.get(key)
+    if found is None:
+        found = COMBINED[key] = combineTypes(kind, key[1], args)
+    return found
+
+
+# combine() for an operator given by node class and operator text (a tuple of them for a Compare).
+def combineTypes(kind, op, args):
+    """combine() for an operator given by node class and operator text."""
+    if kind is BinOp:
+        table = BINARY_RESULTS[op]
+        pairs = list(itertools.product(*args))
+        result = frozenset(table[pair] for pair in pairs if pair in table)
+        return result, all(pair in table for pair in pairs)
+    if kind is UnaryOp:
+        (operand,) = args
+        result = frozenset(UNARY_RESULTS[t] for t in operand if t in UNARY_RESULTS)
+        return result, operand <= UNARY_RESULTS.keys()
+    if kind is Index:
+        array, index = args
+        result = frozenset(ELEMENTS[t] for t in array if t in ELEMENTS)
+        if index and INT not in index:
+            result = NOTHING
+        return result, array <= ELEMENTS.keys() and index <= INTS
+    if kind is Length:
+        (array,) = args
+        return (INTS if any(t in ELEMENTS for t in array) else NOTHING), array <= ELEMENTS.keys()
+    # Compare: each link compares neighbouring operands.
+    complete = accepted = True
+    for link, left, right in zip(op, args, args[1:]):
+        if link in ("==", "!="):
+            continue
+        pairs = list(itertools.product(left, right))
+        complete = complete and all(pair in ORDERED for pair in pairs)
+        accepted = accepted and (not pairs or any(pair in ORDERED for pair in pairs))
+    return (INTS if accepted else NOTHING), complete
+
+
+# Return true if running a block may reach its end, rather than always ending in a Return.
+def mayFallOff(body):
+    """Return true if running a block may reach its end, rather than always ending in a Return."""
+    stack = [body]  # Blocks that must each end in a Return, or in an If/Else whose branches all do.
+    while stack:
+        body = stack.pop()
+        last = body[-1] if body else None
+        if type(last) is Return:
+            continue
+        if type(last) is not If or last.orelse is None:
+            return True
+        stack.extend(childBlocks(last))
+    return False
+
+
+# Return the error message for an operator that rejects every combination of its operand types.
+def mismatch(node, args):
+    """Return the error message for an operator that rejects every combination of its operand types."""
+    kind = type(node)
+    if kind is BinOp:
+        return (
+            f"Unsupported operand types for {node.op}: {spell(args[0])} and {spell(args[1])}"
+            f" in '{describe(node)}'"
+        )
+    if kind is UnaryOp:
+        return f"Bad operand type for unary {node.op}: {spell(args[0])} in '{describe(node)}'"
+    if kind is Index:
+        if not any(t in ELEMENTS for t in args[0]):
+            return f"Cannot index {spell(args[0])} in '{describe(node)}'"
+        return f"Array indices must be ints, not {spell(args[1])} in '{describe(node)}'"
+    if kind is Length:
+        return f"Len needs an array, not {spell(args[0])} in '{describe(node)}'"
+    for op, left, right in zip(node.ops, args, args[1:]):
+        if op not in ("==", "!=") and not any(pair in ORDERED for pair in itertools.product(left, right)):
+            return f"Cannot compare {spell(left)} and {spell(right)} with '{op}' in '{describe(node)}'"
+
+
+# Infer the types of every variable in a module; returns a Types. Raises TypeCheckError for an
+# operator whose operands can never be valid together.
+def inferTypes(module):
+    """Infer the types of every variable in a module; returns a Types."""
+    types = Types()
+    statements = []  # (statement, scope) for every statement, in source order.
+
+    # Find the scopes and the names each one binds, which decides what every read refers to.
+    stack = [(iter(module.body), None)]  # One iterator per open block, innermost last.
+    while stack:
+        body, scope = stack[-1]
+        for node in body:
+            statements.append((node, scope))
+            kind = type(node)
+            if kind is Var or kind is For or kind is Array:
+                types.scopes[scope].setdefault(normalName(node.name), NOTHING)
+            elif kind is Func:
+                names = types.scopes[scope]
+                name = normalName(node.name)
+                names[name] = names.get(name, NOTHING) | FUNCTIONS
+                # Parameters of a Func other modules may import also hold what they may pass.
+                passed = NOTHING
+                if module.library and scope is None:
+                    passed = SCALARS if node.memo else VALUES
+                types.scopes[node] = dict.fromkeys(map(normalName, node.params), passed)
+                types.parents[node] = scope
+                types.returns[node] = NONES if mayFallOff(node.body) else NOTHING
+                types.funcs.setdefault(name, []).append(node)
+                stack.append((iter(node.body), node))
+                break
+            elif kind is Import:
+                names = types.scopes[scope]
+                for name, kinds in node.variables.items():
+                    name = normalName(name)
+                    names[name] = names.get(name, NOTHING) | kinds
+                for func, returns, _ in node.funcs:
+                    name = normalName(func.name)
+                    names[name] = names.get(name, NOTHING) | FUNCTIONS
+                    types.scopes[func] = dict.fromkeys(map(normalName, func.params), NOTHING)
+                    types.parents[func] = scope
+                    types.returns[func] = returns
+                    types.funcs.setdefault(name, []).append(func)
+            blocks = childBlocks(node)
+            if blocks:
+                stack.append((itertools.chain.from_iterable(blocks), scope))
+                break
+        else:
+            stack.pop()
+
+    # Grow each variable's types to a fixed point. A worklist re-evaluates only the assignments
+    # that read a variable, or call a Func, whose types grew; each set can only grow a few times.
+    # (node, value, scope, table, key, owner): `value`, evaluated in `scope`, goes into table[key],
+    # a variable of scope `owner`. The value is an expression, an Array statement, or None for a
+    # range() counter.
+    assignments = []
+    for node, scope in statements:
+        kind = type(node)
+        if kind is Var or kind is For or kind is Array:
+            value = node.value if kind is Var else node if kind is Array else None
+            assignments.append((node, value, scope, types.scopes[scope], normalName(node.name), scope))
+        elif kind is Return and scope is not None:
+            assignments.append((node, node.value, scope, types.returns, scope, None))
+        # Passing an argument assigns it to the parameter of every Func the call may run.
+        stack = expressions(node)
+        while stack:
+            call = stack.pop()
+            stack.extend(operands(call))
+            if type(call) is Call:
+                for func in types.callees(call):
+                    for param, arg in zip(func.params, call.args):
+                        assignments.append((call, arg, scope, types.scopes[func], normalName(param), func))
+
+    # Variable (scope, name), or the result of a Func (func, None) -> indexes of the assignments
+    # that read it.
+    readers = {}
+    for index, (node, value, scope, *_) in enumerate(assignments):
+        if value is None:
+            continue
+        for source in expressions(node) if value is node else [value]:
+            for name in reads(source):
+                name = normalName(name)
+                readers.setdefault((types.scopeOf(name, scope), name), []).append(index)
+            for name in calls(source):
+                for func in types.funcs.get(normalName(name), ()):
+                    readers.setdefault((func, None), []).append(index)
+
+    # Each assignment is evaluated again after anything it reads grows, so its last evaluation
+    # saw the final types; keep the error from that one. Errors in arguments are found when the
+    # statement making the call is checked.
+    errors = {}  # Statement -> error message or None.
+    pending = list(reversed(range(len(assignments))))  # Source order first.
+    queued = set(pending)
+    while pending:
+        index = pending.pop()
+        queued.discard(index)
+        node, value, scope, table, key, owner = assignments[index]
+        if value is None:
+            kinds = INTS  # Counters come from range().
+        elif value is node:
+            kinds, errors[node] = types.declare(node, scope)
+        elif type(node) is Call:
+            kinds = types.evaluate(value, scope)[0]
+        else:
+            kinds, _, errors[node] = types.evaluate(value, scope)
+        if not kinds <= table[key]:
+            table[key] |= kinds
+            target = (key, None) if table is types.returns else (owner, key)
+            for reader in readers.get(target, ()):
+                if reader not in queued:
+                    queued.add(reader)
+                    pending.append(reader)
+
+    for node, scope in statements:
+        error = errors.get(node)
+        if node not in errors:
+            for value in expressions(node):
+                error = error or types.evaluate(value, scope)[2]
+            if error is None and type(node) is Store:
+                error = types.storeError(node, scope)
+        if error is not None:
+            raise TypeCheckError(error, node)
+    return types
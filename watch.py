@@ -0,0 +1,233 @@
+import hashlib
+import os
+import sys
+import time
+
+import bytecode
+from codegen import MEMO_SIZE, CodeGenerator
+from emit import Emitter
+from lex import CobaltError, Lexer, TokenType
+from nodes import Array, Constant, Func, Module, Number, Print, Store, String, nestingLimit
+from optimize import Optimizer, calls, childBlocks, expressions, reads, walk
+from typeinfer import STRING
+from parse import Parser
+
+
+# Incremental recompilation.
+#
+# An IncrementalCompiler remembers, for each top-level Func of the last version of a file, its
+# source text, syntax tree and generated Python. When the file changes, a Func whose text is
+# unchanged is skipped over by restarting the lexer after it, so it is neither lexed nor parsed,
+# and its old output is spliced into the new one. The skip is only taken if every name the Func
+# read from outside when it was first parsed is still defined, so a reused Func is accepted
+# exactly when parsing it would be.
+#
+# -O2 output of a function depends on the rest of the module (dead stores are found through calls,
+# and Funcs are memoized if what they call is pure), so at -O2 every file is recompiled in full.
+# Some of a Func's output depends on inferred types, which may come from outside it: from its
+# callers through its parameters, and from the names it reads. The typecode of each array it
+# declares and whether each value it prints is a string are recorded with its output, and the
+# output is only reused if the new version of the file gives the same answers.
+
+
+# Parser that skips top-level Funcs whose text it has seen before.
+class IncrementalParser(Parser):
+    def __init__(self, lexer, funcs):
+        super().__init__(lexer)
+        # Func name -> (text, node, names it needs, symbols it adds, functions it adds). The text
+        # runs from "Func" up to the start of the next statement.
+        self.funcs = funcs
+        self.seen = {}  # The same, for the Funcs in this version of the file.
+        self.reused = set()  # Func nodes taken from `funcs` rather than parsed.
+
+    def statement(self):
+        """Statement node for the AST, reusing unchanged top-level Funcs."""
+        if not self.checkToken(TokenType.Func) or self.in_func:
+            return super().statement()
+
+        source = self.lexer.source
+        start = self.curToken.start
+        entry = self.funcs.get(self.peekToken.text)
+        if entry is not None:
+            text, node, needs, symbols, functions = entry
+            if (
+                source.startswith(text, start)
+                and node.name not in self.symbols
+                and all(name in self.symbols or name in self.functions for name in needs)
+            ):
+                self.symbols |= symbols
+                self.functions |= functions
+                self.lexer.seek(start + len(text))
+                self.nextToken()
+                self.nextToken()
+                self.seen[node.name] = entry
+                self.reused.add(node)
+                return node
+
+        symbols, functions = set(self.symbols), set(self.functions)
+        node = super().statement()
+        needs = set()
+        for statement in walk(node.body):
+            for value in expressions(statement):
+                needs |= reads(value) | calls(value)
+            if type(statement) is Store:
+                needs.add(statement.name)
+        needs &= symbols | functions
+        text = source[start : self.curToken.start]
+        added = (self.symbols - symbols, self.functions - functions)
+        self.seen[node.name] = (text, node, needs) + added
+        return node
+
+
+# CodeGenerator that splices in the remembered output of reused top-level Funcs.
+class IncrementalGenerator(CodeGenerator):
+    def __init__(self, emitter, mode, outputs, reused, memoSize=MEMO_SIZE, flush="size"):
+        super().__init__(emitter, mode, memoSize, flush)
+        self.outputs = outputs  # Func node -> (type facts, its generated Python).
+        self.reused = reused  # Func nodes whose output can be taken from `outputs`.
+        self.top = 0 if mode == "script" else 1  # Indentation level of top-level statements.
+
+    def genFunc(self, node):
+        if self.emitter.id != self.top:
+            super().genFunc(node)
+            return
+        facts = self.typeFacts(node)
+        if node in self.reused and self.outputs[node][0] == facts:
+            self.emitter.code.append(self.outputs[node][1])
+            return
+        mark = len(self.emitter.code)
+        super().genFunc(node)
+        self.outputs[node] = (facts, "".join(self.emitter.code[mark:]))
+
+    # Return the inferred types a top-level Func's output depends on: whether each value it prints
+    # is a string, and the kind of each array fill, in a fixed order.
+    def typeFacts(self, func):
+        """Return the inferred types a top-level Func's output depends on."""
+        if self.types is None:
+            return []
+        facts = []
+        stack = [(func.body, func)]
+        while stack:
+            body, scope = stack.pop()
+            for node in body:
+                kind = type(node)
+                if kind is Print and type(node.value) not in (String, Constant, Number):
+                    facts.append(self.types.expression(node.value, scope) == STRING)
+                elif kind is Array:
+                    facts.append(self.types.evaluate(node.fill, scope)[0])
+                inner = node if kind is Func else scope
+                stack.extend((block, inner) for block in childBlocks(node))
+        return facts
+
+
+# Compiles successive versions of one file, reusing the output of unchanged top-level Funcs.
+class IncrementalCompiler:
+    def __init__(self, optimize=0, codegen="script", memoSize=MEMO_SIZE, flush="size"):
+        self.optimize = optimize
+        self.codegen = codegen
+        self.memoSize = memoSize
+        self.flush = flush
+        self.funcs = {}  # Func text -> parse results, from the last successful compile.
+        self.outputs = {}  # Func node -> generated Python, from the last successful compile.
+        self.reused = 0  # Number of Funcs reused by the last compile.
+        self.total = 0  # Number of top-level Funcs in the last compile.
+
+    # Transpile one version of the source; returns the Python code.
+    def compile(self, source):
+        """Transpile one version of the source; returns the Python code."""
+        incremental = self.optimize < 2
+        parser = IncrementalParser(Lexer(source), self.funcs if incremental else {})
+        module = parser.program()
+
+        optimizer = Optimizer(self.optimize)
+        if incremental:
+            body = []
+            with nestingLimit(module.depth):
+                for node in module.body:
+                    body.extend([node] if node in parser.reused else optimizer.optimizeStatement(node))
+            module = Module(body, module.depth, module.types, module.library)
+        else:
+            optimizer.optimize(module)
+
+        emitter = Emitter(None)
+        generator = IncrementalGenerator(
+            emitter, self.codegen, self.outputs, parser.reused, self.memoSize, self.flush
+        )
+        generator.generate(module)
+
+        # Only keep what the current version of the file still uses.
+        self.funcs = parser.seen
+        self.outputs = {
+            node: generator.outputs[node]
+            for _, node, *_ in parser.seen.values()
+            if node in generator.outputs
+        }
+        self.reused = len(parser.reused)
+        self.total = len(parser.seen)
+        return emitter.getCode()
+
+
+# Return {path: (mtime, size)} for every .cb file under `directory`.
+def scan(directory):
+    """Return {path: (mtime, size)} for every .cb file under `directory`."""
+    found = {}
+    for root, dirs, files in os.walk(directory):
+        for name in files:
+            if name.endswith(".cb"):
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue  # Deleted while we were looking.
+                found[path] = (stat.st_mtime_ns, stat.st_size)
+    return found
+
+
+# Watch `directory`, recompiling each .cb file next to itself whenever its contents change.
+def watch(directory, optimize=0, codegen="script", interval=0.1, once=False, memoSize=MEMO_SIZE, flush="size"):
+    """Watch `directory`, recompiling each .cb file next to itself whenever its contents change."""
+    stats = {}  # Path -> (mtime, size) when last looked at.
+    digests = {}  # Path -> hash of the contents last compiled.
+    compilers = {}  # Path -> its IncrementalCompiler.
+
+    while True:
+        current = scan(directory)
+        for path in stats.keys() - current.keys():
+            print(f"{path}: removed", file=sys.stderr)
+            digests.pop(path, None)
+            compilers.pop(path, None)
+
+        for path, stat in sorted(current.items()):
+            if stats.get(path) == stat:
+                continue
+            start = time.perf_counter()
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+            except OSError:
+                continue
+            digest = hashlib.sha256(data).digest()
+            if digests.get(path) == digest:
+                continue  # Touched, but not changed.
+            digests[path] = digest
+
+            compiler = compilers.setdefault(path, IncrementalCompiler(optimize, codegen, memoSize, flush))
+            try:
+                code = compiler.compile(data.decode())
+                with open(f"{path[:-3]}.py", "w") as f:
+                    f.write(code)
+                if flush != "unbuffered":
+                    bytecode.writeRuntime(os.path.dirname(path))
+            except (CobaltError, UnicodeDecodeError, RecursionError) as e:
+                print(f"{path}: {e}", file=sys.stderr)
+                continue
+            latency = (time.perf_counter() - start) * 1000
+            print(
+                f"{path}: {latency:.1f} ms"
+                f" ({compiler.reused} of {compiler.total} functions reused)"
+            )
+
+        stats = current
+        if once:
+            return
+        time.sleep(interval)